@@ -12,7 +12,7 @@ from pydantic import BaseModel
 from jose import JWTError, jwt
 from app.core.config import settings
 from app.core.database import mongodb
-from app.core.security import verify_password, get_password_hash, create_access_token
+from app.core.security import verify_password, get_password_hash, create_access_token, user_cache
 
 # Done by ELYES
 router = APIRouter()
@@ -77,6 +77,8 @@ async def register_user(user: User, password: str):
     user_dict["hashed_password"] = hashed_password
     
     await mongodb.users.insert_one(user_dict)
+    # Drop any cached "unknown user" entry for this name
+    await user_cache.invalidate(user.username)
     return user
 
 @router.post("/token", response_model=Token)
@@ -4,13 +4,23 @@ Chat routes for ChatXpert
 Done by ELYES
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
+import json
+import time
 
-from app.core.database import mongodb, redis_client
-from app.core.security import get_current_user
+from app.core.chat_history import chat_history
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.logging import logger
+from app.core.message_writer import message_writer
+from app.core.security import get_current_user, get_user_from_token, user_rate_limiter
+from app.core.session_context import Turn, session_context
+from app.ml.router import response_router
 
 # Done by ELYES
 router = APIRouter()
@@ -20,12 +30,15 @@ class ChatMessage(BaseModel):
     content: str
     timestamp: datetime = datetime.now()
     user_id: Optional[str] = None
+    # Conversation whose context the reply uses; one per user when omitted
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     # Done by ELYES
     message: str
     confidence: float
     intent: Optional[str] = None
+    source: Optional[str] = None
 
 @router.post("/send", response_model=ChatResponse)
 async def send_message(
@@ -34,35 +47,163 @@ async def send_message(
 ):
     # Done by ELYES
     try:
-        # Store message in MongoDB
-        await mongodb.messages.insert_one({
+        user_id = str(current_user["_id"])
+        # Queue the message for MongoDB; it is written in the background
+        await message_writer.write({
             "content": message.content,
-            "user_id": current_user.id,
+            "user_id": user_id,
             "timestamp": message.timestamp
         })
         
-        # TODO: Implement AI processing logic here
-        # For now, return a simple response
-        return ChatResponse(
-            message="I received your message. AI processing will be implemented soon.",
-            confidence=1.0,
-            intent="general"
-        )
+        # Confident intents are answered locally; the rest go to the LLM.
+        # The last turns come from the session store, not the messages collection.
+        context = await session_context.get(user_id, message.session_id)
+        reply = await response_router.reply(message.content, context)
+        await session_context.append(user_id, message.session_id, Turn(message.content, reply.message, reply.intent))
+        return ChatResponse(**reply._asdict())
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def reply_events(
+    content: str,
+    current_user: dict,
+    session_id: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    # The intent result as soon as it is known, then the reply as token
+    # events, then a done event with the full ChatResponse
+    # Done by ELYES
+    user_id = str(current_user["_id"])
+    await message_writer.write({
+        "content": content,
+        "user_id": user_id,
+        "timestamp": datetime.now()
+    })
+    
+    context = await session_context.get(user_id, session_id)
+    async for event, data in response_router.stream(content, context):
+        if event == "done":
+            # Recorded before the client sees the end of the reply
+            await session_context.append(user_id, session_id, Turn(content, data["message"], data["intent"]))
+        yield event, data
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    # Done by ELYES
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/stream")
+async def stream_message(
+    message: ChatMessage,
+    current_user = Depends(get_current_user)
+):
+    # Server-Sent Events; each event is written only once the client has
+    # taken the previous one, and a disconnect stops generation
+    # Done by ELYES
+    async def events():
+        try:
+            async for event, data in reply_events(message.content, current_user, message.session_id):
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error(f"Streaming chat failed: {str(e)}", exc_info=True)
+            yield _sse("error", {"detail": "Could not generate a response"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _authenticate_websocket(websocket: WebSocket, token: Optional[str]):
+    # Token from the query string, or from a first {"type": "auth"} message
+    # Done by ELYES
+    if token is None:
+        message = await websocket.receive_json()
+        if not isinstance(message, dict) or message.get("type") != "auth":
+            return None
+        token = message.get("token")
+    return await get_user_from_token(token) if isinstance(token, str) else None
+
+async def _read_messages(websocket: WebSocket, pending: asyncio.Queue):
+    # Stops reading while pending is full, so a client that sends faster than
+    # replies are generated is held back by the socket
+    # Done by ELYES
+    try:
+        while True:
+            message = await websocket.receive_json()
+            content = message.get("content") if isinstance(message, dict) else None
+            if not isinstance(content, str) or not content.strip():
+                await websocket.send_json({"type": "error", "detail": "Expected {\"content\": \"...\"}"})
+                continue
+            await pending.put(content)
+    except (WebSocketDisconnect, json.JSONDecodeError, RuntimeError):
+        pass
+    await pending.put(None)
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, token: Optional[str] = None, session_id: Optional[str] = None):
+    # Long-lived session: the token and user are resolved once at connect
+    # Done by ELYES
+    await websocket.accept()
+    try:
+        resolved = await _authenticate_websocket(websocket, token)
+    except (WebSocketDisconnect, json.JSONDecodeError):
+        return
+    if resolved is None:
+        await websocket.close(code=1008, reason="Could not validate credentials")
+        return
+    current_user, payload = resolved
+    await websocket.send_json({"type": "ready", "username": current_user["username"]})
+    
+    pending: asyncio.Queue = asyncio.Queue(maxsize=settings.CHAT_WS_MAX_PENDING)
+    reader = asyncio.create_task(_read_messages(websocket, pending))
+    try:
+        while True:
+            content = await pending.get()
+            if content is None:
+                break
+            if payload.get("exp", float("inf")) <= time.time():
+                await websocket.close(code=1008, reason="Token expired")
+                break
+            if not (await user_rate_limiter.hit(f"user:{current_user['_id']}")).allowed:
+                await websocket.send_json({"type": "error", "detail": "Too many requests"})
+                continue
+            try:
+                async for event, data in reply_events(content, current_user, session_id):
+                    # A client that stops reading is disconnected rather than
+                    # buffered for
+                    await asyncio.wait_for(
+                        websocket.send_json({"type": event, **data}),
+                        timeout=settings.CHAT_STREAM_SEND_TIMEOUT
+                    )
+            except (WebSocketDisconnect, asyncio.TimeoutError):
+                raise
+            except Exception as e:
+                logger.error(f"Streaming chat failed: {str(e)}", exc_info=True)
+                await websocket.send_json({"type": "error", "detail": "Could not generate a response"})
+    except (WebSocketDisconnect, asyncio.TimeoutError, RuntimeError):
+        pass
+    finally:
+        reader.cancel()
+        try:
+            await reader
+        except asyncio.CancelledError:
+            pass
+
 @router.get("/history", response_model=List[ChatMessage])
 async def get_chat_history(
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(settings.CHAT_HISTORY_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = None,
     current_user = Depends(get_current_user)
 ):
+    # Newest first, at most CHAT_HISTORY_MAX_PAGE_SIZE messages; older pages
+    # are requested with the X-Next-Cursor header as cursor
     # Done by ELYES
     try:
-        cursor = mongodb.messages.find(
-            {"user_id": current_user.id}
-        ).sort("timestamp", -1).limit(limit)
-        
-        messages = await cursor.to_list(length=limit)
-        return [ChatMessage(**msg) for msg in messages]
+        messages, next_cursor = await chat_history.page(str(current_user["_id"]), limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return messages
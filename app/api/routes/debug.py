@@ -0,0 +1,58 @@
+"""
+Debug routes for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.profiling import request_profiler
+from app.core.security import check_admin_permission
+
+# Done by ELYES
+router = APIRouter()
+
+class ProfileRequest(BaseModel):
+    # Done by ELYES
+    path: Optional[str] = None  # only requests under this path prefix
+    count: int = 1
+
+@router.post("/profile")
+async def arm_profile(
+    request: ProfileRequest,
+    current_user = Depends(check_admin_permission)
+):
+    # Profiles the next count matching requests; their reports are listed
+    # under /traces and returned as X-Profile-Id to the caller
+    # Done by ELYES
+    if not 1 <= request.count <= settings.SLOW_REQUEST_TRACES:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {settings.SLOW_REQUEST_TRACES}")
+    armed = request_profiler.arm(request.path, request.count)
+    return {"message": "Profiling armed", "armed": armed}
+
+@router.get("/traces")
+async def list_traces(
+    limit: int = Query(settings.SLOW_REQUEST_TRACES, ge=1),
+    current_user = Depends(check_admin_permission)
+):
+    # Done by ELYES
+    return {
+        "enabled": request_profiler.enabled,
+        "threshold": request_profiler.threshold,
+        "armed": len(request_profiler.armed),
+        "traces": request_profiler.recent(limit)
+    }
+
+@router.get("/traces/{trace_id}")
+async def get_trace(
+    trace_id: str,
+    current_user = Depends(check_admin_permission)
+):
+    # Done by ELYES
+    trace = request_profiler.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace.as_dict()
@@ -8,10 +8,15 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-import json
+from bson import ObjectId
+from bson.errors import InvalidId
 
+from app.core.config import settings
 from app.core.database import mongodb
-from app.core.security import get_current_user
+from app.core.security import get_current_user, check_admin_permission
+from app.ml.inference import inference_engine, model_manager, model_registry
+from app.ml.ingest import TrainingDataImporter
+from app.ml.training_runner import training_runner
 
 # Done by ELYES
 router = APIRouter()
@@ -22,14 +27,19 @@ class TrainingData(BaseModel):
     patterns: List[str]
     responses: List[str]
 
+class TrainingDataResponse(TrainingData):
+    # Done by ELYES
+    job_id: Optional[str] = None
+
 class TrainingStatus(BaseModel):
     # Done by ELYES
     status: str
     progress: float
     last_updated: datetime
     metrics: Optional[dict] = None
+    error: Optional[str] = None
 
-@router.post("/data", response_model=TrainingData)
+@router.post("/data", response_model=TrainingDataResponse)
 async def add_training_data(
     data: TrainingData,
     current_user = Depends(get_current_user)
@@ -41,10 +51,13 @@ async def add_training_data(
             "intent": data.intent,
             "patterns": data.patterns,
             "responses": data.responses,
-            "created_by": current_user.username,
+            "created_by": current_user["username"],
             "created_at": datetime.now()
         })
-        return data
+        job_id = None
+        if settings.TRAINING_INCREMENTAL:
+            job_id = await training_runner.enqueue(current_user["username"], [data.intent])
+        return TrainingDataResponse(**data.dict(), job_id=job_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -55,61 +68,78 @@ async def upload_training_file(
 ):
     # Done by ELYES
     try:
-        content = await file.read()
-        data = json.loads(content)
+        # JSON arrays and NDJSON are parsed incrementally from the spooled
+        # upload; nothing is written unless every item is valid
+        importer = TrainingDataImporter(mongodb.training_data, batch_size=settings.UPLOAD_BATCH_SIZE)
+        count, errors = await importer.validate(file.read)
+        if errors:
+            raise HTTPException(
+                status_code=400,
+                detail={"message": "Invalid training data format", "errors": errors}
+            )
         
-        # Validate and store training data
-        for item in data:
-            if not all(k in item for k in ["intent", "patterns", "responses"]):
-                raise HTTPException(
-                    status_code=400,
-                    detail="Invalid training data format"
-                )
-            
-            await mongodb.training_data.insert_one({
-                "intent": item["intent"],
-                "patterns": item["patterns"],
-                "responses": item["responses"],
-                "created_by": current_user.username,
-                "created_at": datetime.now()
-            })
+        await file.seek(0)
+        report = await importer.write(file.read, current_user["username"])
         
-        return {"message": "Training data uploaded successfully"}
-    except json.JSONDecodeError:
+        response = {
+            "message": "Training data uploaded successfully",
+            "items": report["items"],
+            "intents": len(report["intents"]),
+            "batches": report["batches"]
+        }
+        if report["failed_batches"]:
+            response["message"] = f"Training data uploaded with {report['failed_batches']} failed batches"
+        written = report["failed_batches"] < len(report["batches"])
+        if settings.TRAINING_INCREMENTAL and written:
+            response["job_id"] = await training_runner.enqueue(current_user["username"], report["intents"])
+        return response
+    except HTTPException:
+        raise
+    except ValueError as e:
         raise HTTPException(
             status_code=400,
-            detail="Invalid JSON format"
+            detail=f"Invalid JSON format: {str(e)}"
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _job_object_id(job_id: str) -> ObjectId:
+    # Done by ELYES
+    try:
+        return ObjectId(job_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Training job not found")
+
 @router.post("/train")
 async def train_model(current_user = Depends(get_current_user)):
     # Done by ELYES
     try:
-        # Create training job
-        job_id = await mongodb.training_jobs.insert_one({
-            "status": "pending",
-            "progress": 0.0,
-            "created_by": current_user.username,
-            "created_at": datetime.now()
-        })
-        
-        # TODO: Implement actual model training logic
-        # This would typically involve:
-        # 1. Fetching training data
-        # 2. Preprocessing
-        # 3. Training the model
-        # 4. Saving the model
-        # 5. Updating job status
+        # Full retrain; the runner picks it up in a worker process
+        job_id = await training_runner.enqueue(current_user["username"])
         
         return {
             "message": "Training job started",
-            "job_id": str(job_id.inserted_id)
+            "job_id": job_id
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/cancel/{job_id}")
+async def cancel_training(
+    job_id: str,
+    current_user = Depends(get_current_user)
+):
+    # Only the user who queued the job, or an admin, may stop it
+    # Done by ELYES
+    job = await mongodb.training_jobs.find_one({"_id": _job_object_id(job_id)}, {"status": 1, "created_by": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    if job.get("created_by") != current_user["username"] and not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    if not await training_runner.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Training job is {job['status']}")
+    return {"message": "Training job cancellation requested", "job_id": job_id}
+
 @router.get("/status/{job_id}", response_model=TrainingStatus)
 async def get_training_status(
     job_id: str,
@@ -117,7 +147,7 @@ async def get_training_status(
 ):
     # Done by ELYES
     try:
-        job = await mongodb.training_jobs.find_one({"_id": job_id})
+        job = await mongodb.training_jobs.find_one({"_id": _job_object_id(job_id)})
         if not job:
             raise HTTPException(status_code=404, detail="Training job not found")
         
@@ -125,7 +155,40 @@ async def get_training_status(
             status=job["status"],
             progress=job["progress"],
             last_updated=job.get("updated_at", job["created_at"]),
-            metrics=job.get("metrics")
+            metrics=job.get("metrics"),
+            error=job.get("error")
         )
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/models")
+async def list_models(current_user = Depends(get_current_user)):
+    # Done by ELYES
+    return {
+        "current": model_registry.current(),
+        "serving": inference_engine.model_version,
+        "versions": model_registry.list_versions()
+    }
+
+@router.post("/models/rollback")
+async def rollback_model(current_user = Depends(check_admin_permission)):
+    # Done by ELYES
+    try:
+        version = await model_manager.rollback()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": "Model rolled back", "version": version}
+
+@router.post("/models/{version}/activate")
+async def activate_model(
+    version: str,
+    current_user = Depends(check_admin_permission)
+):
+    # Done by ELYES
+    try:
+        await model_manager.activate(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Model version not found")
+    return {"message": "Model activated", "version": version}
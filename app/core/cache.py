@@ -1,47 +1,121 @@
 from typing import Any, Optional
+from collections import OrderedDict
 import json
+import time
+from app.core.config import settings
 from app.core.database import redis_client
 from app.core.logging import logger
 
+class CircuitBreaker:
+    # After a failure the store is skipped for retry_after seconds, so an
+    # outage costs one log line instead of an error, and a connection attempt,
+    # per call; the first call after the pause probes the store again
+    def __init__(self, name: str, retry_after: float = 5.0):
+        self.name = name
+        self.retry_after = retry_after
+        self._open_until = 0.0
+
+    @property
+    def open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def failure(self, operation: str, error: Exception):
+        if not self._open_until:
+            logger.error(
+                f"{self.name} unavailable ({operation}: {str(error)}); "
+                f"skipping it, retrying every {self.retry_after:g}s"
+            )
+        self._open_until = time.monotonic() + self.retry_after
+
+    def success(self):
+        if self._open_until:
+            self._open_until = 0.0
+            logger.info(f"{self.name} available again")
+
+cache_breaker = CircuitBreaker("Redis cache", retry_after=settings.CACHE_RETRY_AFTER)
+
 class Cache:
     @staticmethod
     async def get(key: str) -> Optional[Any]:
+        if cache_breaker.open:
+            return None
         try:
             data = await redis_client.get(key)
-            return json.loads(data) if data else None
         except Exception as e:
-            logger.error(f"Cache get error: {str(e)}")
+            cache_breaker.failure("get", e)
             return None
+        cache_breaker.success()
+        return json.loads(data) if data else None
 
     @staticmethod
     async def set(key: str, value: Any, ttl: int = 3600) -> bool:
+        if cache_breaker.open:
+            return False
+        data = json.dumps(value)
         try:
-            await redis_client.setex(
-                key,
-                ttl,
-                json.dumps(value)
-            )
-            return True
+            await redis_client.setex(key, ttl, data)
         except Exception as e:
-            logger.error(f"Cache set error: {str(e)}")
+            cache_breaker.failure("set", e)
             return False
+        cache_breaker.success()
+        return True
 
     @staticmethod
     async def delete(key: str) -> bool:
+        if cache_breaker.open:
+            return False
         try:
             await redis_client.delete(key)
-            return True
         except Exception as e:
-            logger.error(f"Cache delete error: {str(e)}")
+            cache_breaker.failure("delete", e)
             return False
+        cache_breaker.success()
+        return True
 
     @staticmethod
     async def clear_pattern(pattern: str) -> bool:
+        if cache_breaker.open:
+            return False
         try:
             keys = await redis_client.keys(pattern)
             if keys:
                 await redis_client.delete(*keys)
-            return True
         except Exception as e:
-            logger.error(f"Cache clear pattern error: {str(e)}")
-            return False 
\ No newline at end of file
+            cache_breaker.failure("clear pattern", e)
+            return False
+        cache_breaker.success()
+        return True
+
+class LRUCache:
+    # In-process cache bounded by entry count, with optional per-entry expiry
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Any):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
@@ -0,0 +1,152 @@
+"""
+Chat history pagination for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import base64
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+
+from app.core.config import settings
+from app.core.database import mongodb, redis_client
+from app.core.logging import logger
+
+# Done by ELYES
+HISTORY_PROJECTION = {"content": 1, "user_id": 1, "timestamp": 1}
+# Matches the (user_id, timestamp, _id) index created in init_db
+HISTORY_SORT = [("timestamp", -1), ("_id", -1)]
+# Field of a user's cache hash counting the writes of their messages
+GENERATION_FIELD = "generation"
+
+def encode_cursor(document: Dict[str, Any]) -> str:
+    # Opaque keyset position after document
+    # Done by ELYES
+    raw = f"{document['timestamp'].isoformat()}|{document['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    # Raises ValueError for anything encode_cursor did not produce
+    # Done by ELYES
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, _id = raw.split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+class ChatHistory:
+    # Newest-first pages of a user's messages, continued with keyset cursors on
+    # (timestamp, _id), so page N costs the same index walk as page 1. The
+    # first page is what clients load on every visit; it is cached in Redis
+    # per user, tagged with the user's write generation read before the query.
+    # Writing a message bumps the generation, so a page read before the write
+    # is never served after it, even when it is stored after the write.
+    # Done by ELYES
+    def __init__(
+        self,
+        collection,
+        redis=None,
+        page_size: int = 50,
+        max_page_size: int = 100,
+        cache_ttl: int = 60,
+        prefix: str = "history"
+    ):
+        self.collection = collection
+        self.redis = redis
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.cache_ttl = cache_ttl
+        self.prefix = prefix
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    async def _get_cached(self, user_id: str, limit: int) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        # (current generation, cached page if it is from that generation);
+        # no generation means the page must not be cached either
+        if self.redis is None:
+            return None, None
+        try:
+            generation, data = await self.redis.hmget(self._key(user_id), GENERATION_FIELD, str(limit))
+        except Exception as e:
+            logger.error(f"History cache get error: {str(e)}")
+            return None, None
+        generation = int(generation or 0)
+        page = json_util.loads(data) if data is not None else None
+        if page is None or page.get("generation") != generation:
+            return generation, None
+        return generation, page
+
+    async def _set_cached(self, user_id: str, limit: int, generation: int, page: Dict[str, Any]):
+        try:
+            await self.redis.hset(self._key(user_id), str(limit), json_util.dumps({**page, "generation": generation}))
+            await self.redis.expire(self._key(user_id), self.cache_ttl)
+        except Exception as e:
+            logger.error(f"History cache set error: {str(e)}")
+
+    async def page(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        # (messages, cursor for the next page or None at the end)
+        limit = max(1, min(limit or self.page_size, self.max_page_size))
+        query: Dict[str, Any] = {"user_id": user_id}
+        generation: Optional[int] = None
+        if cursor is not None:
+            timestamp, _id = decode_cursor(cursor)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": _id}}
+            ]
+        else:
+            generation, cached = await self._get_cached(user_id, limit)
+            if cached is not None:
+                return cached["messages"], cached["next_cursor"]
+
+        # One extra document tells whether there is a next page
+        documents = await self.collection.find(query, HISTORY_PROJECTION).sort(
+            HISTORY_SORT
+        ).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = encode_cursor(documents[limit - 1]) if len(documents) > limit else None
+        messages = [
+            {"content": d["content"], "user_id": d["user_id"], "timestamp": d["timestamp"]}
+            for d in documents[:limit]
+        ]
+        if cursor is None and generation is not None:
+            await self._set_cached(user_id, limit, generation, {"messages": messages, "next_cursor": next_cursor})
+        return messages, next_cursor
+
+    async def invalidate(self, user_ids: Iterable[str]):
+        # Bumps each user's generation, which every page cached so far, or
+        # being read right now, was stored under an older value of
+        if self.redis is None:
+            return
+        keys = {self._key(user_id) for user_id in user_ids}
+        if not keys:
+            return
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipeline.hincrby(key, GENERATION_FIELD, 1).expire(key, self.cache_ttl)
+            await pipeline.execute()
+        except Exception as e:
+            logger.error(f"History cache invalidate error: {str(e)}")
+
+    async def written(self, documents: List[Dict[str, Any]]):
+        # MessageWriter hook: a message invalidates its user's first page once
+        # it is in the collection, not when it is queued
+        await self.invalidate(d["user_id"] for d in documents if "user_id" in d)
+
+# Done by ELYES
+chat_history = ChatHistory(
+    mongodb.messages,
+    redis_client,
+    page_size=settings.CHAT_HISTORY_PAGE_SIZE,
+    max_page_size=settings.CHAT_HISTORY_MAX_PAGE_SIZE,
+    cache_ttl=settings.CHAT_HISTORY_CACHE_TTL
+)
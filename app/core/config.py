@@ -5,7 +5,7 @@ Done by ELYES
 """
 
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 from functools import lru_cache
 import os
 from dotenv import load_dotenv
@@ -25,22 +25,148 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     ALGORITHM: str = "HS256"
+    TOKEN_CACHE_SIZE: int = 10000
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: int = 300
+    USER_CACHE_LOCAL_TTL: float = 30.0
+    USER_CACHE_NEGATIVE_TTL: int = 10
     
     # Database Settings
     # Done by ELYES
     DATABASE_URL: str
     MONGODB_URL: str = "mongodb://localhost:27017/chatxpert"
     REDIS_URL: str = "redis://localhost:6379/0"
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 30.0
+    DATABASE_POOL_RECYCLE: int = 1800
+    DATABASE_POOL_MIN_SIZE: int = 2  # opened at startup
+    DATABASE_POOL_PRE_PING: bool = True  # test a pooled connection before handing it out
+    # PostgreSQL probes connections idle this many seconds, then every interval
+    DATABASE_TCP_KEEPALIVES_IDLE: Optional[int] = 60
+    DATABASE_TCP_KEEPALIVES_INTERVAL: Optional[int] = 10
+    MONGODB_MAX_POOL_SIZE: int = 100
+    MONGODB_MIN_POOL_SIZE: int = 2
+    MONGODB_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = 10000
+    MONGODB_CONNECT_TIMEOUT_MS: int = 10000
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_MIN_CONNECTIONS: int = 2
+    REDIS_SOCKET_TIMEOUT: Optional[float] = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 2.0
+    REDIS_SOCKET_KEEPALIVE: bool = True
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+    HEALTH_CHECK_TIMEOUT: float = 2.0
+    HEALTH_CHECK_CACHE_TTL: float = 5.0
     
     # OpenAI Settings
     # Done by ELYES
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-3.5-turbo"
+    LLM_ENABLED: bool = False
+    LLM_MAX_TOKENS: int = 256
+    LLM_TEMPERATURE: float = 0.7
+    LLM_TIMEOUT: float = 30.0
+    LLM_SYSTEM_PROMPT: str = "You are ChatXpert, a helpful assistant. Answer briefly."
+    ROUTER_CONFIDENCE_THRESHOLD: float = 0.7  # below this, messages go to the LLM
+    ROUTER_CONTEXT_MARGIN: float = 0.15
+    
+    # Streaming Chat Settings
+    # Done by ELYES
+    CHAT_WS_MAX_PENDING: int = 8
+    CHAT_STREAM_SEND_TIMEOUT: float = 10.0
+    
+    # Intent Model Settings
+    # Done by ELYES
+    MODEL_BACKEND: str = "numpy"  # "numpy" or "keras"
+    MODEL_PATH: str = "chatbotmodel.h5"
+    MODEL_WEIGHTS_PATH: str = "chatbotmodel.npz"
+    MODEL_REGISTRY_DIR: str = "models"
+    MODEL_REGISTRY_POLL_INTERVAL: float = 10.0
+    MODEL_AUTO_ACTIVATE: bool = True
+    WORDS_PATH: str = "words.pkl"
+    CLASSES_PATH: str = "classes.pkl"
+    INTENTS_PATH: str = "intents.json"
+    INTENT_ERROR_THRESHOLD: float = 0.25
+    INTENT_CONFIDENCE_THRESHOLD: float = 0.25
+    INTENT_FALLBACK_TAG: Optional[str] = "invalid"
+    INTENT_RELOAD_INTERVAL: float = 30.0
+    INFERENCE_MAX_BATCH_SIZE: int = 32
+    INFERENCE_MAX_WAIT_MS: float = 5.0
+    INFERENCE_MAX_QUEUE_SIZE: int = 1024
+    SENTENCE_CACHE_SIZE: int = 4096
+    LEMMA_CACHE_SIZE: int = 16384
+    PREDICTION_CACHE_SIZE: int = 1024
+    PREDICTION_CACHE_TTL: int = 3600
+    CACHE_RETRY_AFTER: float = 5.0  # seconds Redis is skipped after a cache error
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_SIZE: int = 4096
+    SEMANTIC_CACHE_TTL: int = 86400
+    SEMANTIC_CACHE_THRESHOLD: float = 0.9
+    SEMANTIC_CACHE_EMBEDDING: str = "hidden"  # "hidden" or "bag_of_words"
+    SEMANTIC_CACHE_OOV_BUCKETS: int = 1024
+    SEMANTIC_CACHE_SYNC_INTERVAL: float = 30.0
+    
+    # Rate Limiting Settings
+    # Done by ELYES
+    RATE_LIMIT_DEFAULT: str = "100/60"  # requests/seconds
+    RATE_LIMIT_USER: str = "100/60"
+    RATE_LIMIT_ROUTES: Dict[str, str] = {}  # path prefix -> "requests/seconds"
+    RATE_LIMIT_LOCAL_BATCH: int = 0
+    RATE_LIMIT_LEASE_TTL: float = 1.0
+    RATE_LIMIT_FAIL_OPEN: bool = True
+    
+    # Message Log Settings
+    # Done by ELYES
+    MESSAGE_WRITER_BATCH_SIZE: int = 500
+    MESSAGE_WRITER_FLUSH_INTERVAL: float = 0.5
+    MESSAGE_WRITER_MAX_QUEUE_SIZE: int = 10000
+    MESSAGE_WRITER_ENQUEUE_TIMEOUT: float = 1.0
+    MESSAGE_WRITER_DRAIN_TIMEOUT: float = 10.0
+    CHAT_HISTORY_PAGE_SIZE: int = 50
+    CHAT_HISTORY_MAX_PAGE_SIZE: int = 100
+    CHAT_HISTORY_CACHE_TTL: int = 60
+    
+    # Session Context Settings
+    # Done by ELYES
+    SESSION_CONTEXT_TURNS: int = 10
+    SESSION_CONTEXT_TTL: int = 3600
+    SESSION_CONTEXT_CACHE_SIZE: int = 10000
+    SESSION_CONTEXT_LOCAL_TTL: float = 5.0
+    
+    # Training Settings
+    # Done by ELYES
+    TRAINING_OUTPUT_DIR: str = "training_runs"
+    TRAINING_MAX_CONCURRENT_JOBS: int = 1
+    TRAINING_EPOCHS: int = 200
+    TRAINING_BATCH_SIZE: int = 5
+    TRAINING_INCREMENTAL: bool = True
+    TRAINING_FINE_TUNE_EPOCHS: int = 30
+    TRAINING_REPLAY_RATIO: float = 1.0
+    TRAINING_POLL_INTERVAL: float = 2.0  # seconds between queue polls and job heartbeats
+    TRAINING_STALE_AFTER: float = 60.0  # a running job without a heartbeat this long is failed
+    TRAINING_COALESCE_WINDOW: float = 10.0  # seconds a new incremental job collects further changes
+    UPLOAD_BATCH_SIZE: int = 1000
     
     # Logging Settings
     # Done by ELYES
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" or "text"
+    LOG_QUEUE_SIZE: int = 10000  # records waiting for the writer thread; more are dropped
+    # logger name -> fraction of its records below WARNING that are kept
+    LOG_SAMPLING: Dict[str, float] = {"chatxpert.requests": 1.0}
     
+    # Profiling
+    # Done by ELYES
+    PROFILING_ENABLED: bool = False  # header-triggered profiles and the slow-request sampler
+    PROFILING_HEADER: str = "X-Profile"
+    PROFILING_TOKEN: Optional[str] = None  # the header must carry this value
+    PROFILING_TOP_N: int = 40  # functions kept from each cProfile report
+    SLOW_REQUEST_THRESHOLD: float = 1.0  # seconds
+    SLOW_REQUEST_TRACES: int = 50
+    SLOW_REQUEST_SAMPLE_INTERVAL: float = 0.01  # seconds between stack samples
+
     # CORS
     # Done by ELYES
     BACKEND_CORS_ORIGINS: list = ["*"]
@@ -4,82 +4,220 @@ Database configuration and utilities for ChatXpert
 Done by ELYES
 """
 
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
-from contextlib import contextmanager
+import asyncio
 import time
-from typing import Generator
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 from motor.motor_asyncio import AsyncIOMotorClient
 import redis.asyncio as redis
 from app.core.config import settings
 from app.core.logging import logger
+from app.core.pools import InstrumentedRedisPool, MongoPoolListener, PoolMetrics, instrumented_sqlalchemy_pool
+
+def async_database_url(url: str) -> URL:
+    # The configured URL with an asyncio driver: asyncpg for PostgreSQL,
+    # aiosqlite for the local/test SQLite mode
+    # Done by ELYES
+    url = make_url(url)
+    drivers = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+    backend = url.get_backend_name()
+    if backend in drivers:
+        url = url.set(drivername=f"{backend}+{drivers[backend]}")
+    return url
+
+def database_connect_args(url: URL) -> Dict[str, Any]:
+    # TCP keepalive for pooled PostgreSQL connections. asyncpg has no client
+    # side option, so the server is asked to probe idle connections; a NAT or
+    # load balancer then never sees one idle long enough to drop it.
+    # Done by ELYES
+    if url.get_backend_name() != "postgresql":
+        return {}
+    keepalives = {
+        "tcp_keepalives_idle": settings.DATABASE_TCP_KEEPALIVES_IDLE,
+        "tcp_keepalives_interval": settings.DATABASE_TCP_KEEPALIVES_INTERVAL
+    }
+    server_settings = {name: str(value) for name, value in keepalives.items() if value}
+    return {"server_settings": server_settings} if server_settings else {}
+
+def create_database_engine(url: str, metrics: Optional[PoolMetrics] = None) -> AsyncEngine:
+    # Done by ELYES
+    url = async_database_url(url)
+    if url.get_backend_name() == "sqlite":
+        # Local/test mode: nothing to pool
+        return create_async_engine(url)
+    return create_async_engine(
+        url,
+        poolclass=instrumented_sqlalchemy_pool(metrics or PoolMetrics("postgres")),
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        connect_args=database_connect_args(url)
+    )
+
+# Per-worker pool metrics
+# Done by ELYES
+pool_metrics = {
+    "postgres": PoolMetrics("postgres", settings.DATABASE_POOL_SIZE + settings.DATABASE_MAX_OVERFLOW),
+    "mongodb": PoolMetrics("mongodb", settings.MONGODB_MAX_POOL_SIZE),
+    "redis": PoolMetrics("redis", settings.REDIS_MAX_CONNECTIONS),
+}
 
 # PostgreSQL
 # Done by ELYES
-SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    poolclass=QueuePool,
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30,
-    pool_recycle=1800,
-    pool_pre_ping=True
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_database_engine(settings.DATABASE_URL, pool_metrics["postgres"])
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 Base = declarative_base()
 
 # MongoDB
 # Done by ELYES
-mongodb_client = AsyncIOMotorClient(settings.MONGODB_URL)
+mongodb_client = AsyncIOMotorClient(
+    settings.MONGODB_URL,
+    maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+    minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+    # pymongo turns on TCP keepalive for every socket it opens (probing
+    # after at most 120s idle) and has no option for it; idle connections
+    # are closed after this instead
+    maxIdleTimeMS=settings.MONGODB_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+    connectTimeoutMS=settings.MONGODB_CONNECT_TIMEOUT_MS,
+    # Fail fast when no server is reachable instead of pymongo's 30s default
+    serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+    event_listeners=[MongoPoolListener(pool_metrics["mongodb"])]
+)
 mongodb = mongodb_client.get_database()
 
 # Redis
 # Done by ELYES
-redis_client = redis.from_url(settings.REDIS_URL)
+redis_client = redis.Redis(connection_pool=InstrumentedRedisPool.from_url(
+    settings.REDIS_URL,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+    socket_keepalive=settings.REDIS_SOCKET_KEEPALIVE,
+    health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+    metrics=pool_metrics["redis"]
+))
 
-@contextmanager
-def get_db() -> Generator:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    # FastAPI dependency: one session per request
     # Done by ELYES
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as session:
+        yield session
 
-async def check_db_health() -> bool:
+async def ping_postgres():
     # Done by ELYES
-    try:
-        start_time = time.time()
-        db = SessionLocal()
-        db.execute("SELECT 1")
-        duration = time.time() - start_time
-        logger.info(f"Database health check successful. Response time: {duration:.3f}s")
-        return True
-    except Exception as e:
-        logger.error(f"Database health check failed: {str(e)}")
-        return False
-    finally:
-        db.close()
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+async def ping_mongodb():
+    # Done by ELYES
+    await mongodb_client.admin.command('ping')
+
+async def ping_redis():
+    # Done by ELYES
+    await redis_client.ping()
+
+class HealthChecker:
+    # Pings every store concurrently, each bounded by timeout, and reuses the
+    # result for ttl seconds. Callers arriving while a check runs wait for it
+    # instead of starting their own, so however often load balancers probe,
+    # each store sees at most one ping per ttl per worker.
+    # Done by ELYES
+    def __init__(
+        self,
+        checks: Dict[str, Callable[[], Awaitable[Any]]],
+        timeout: float = 2.0,
+        ttl: float = 5.0
+    ):
+        self.checks = checks
+        self.timeout = timeout
+        self.ttl = ttl
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _ping(self, check: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), timeout=self.timeout)
+            result = {"status": "up"}
+        except asyncio.TimeoutError:
+            result = {"status": "timeout"}
+        except Exception as e:
+            result = {"status": "down", "error": str(e)}
+        result["latency_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+        return result
+
+    def _fresh(self) -> bool:
+        return self._result is not None and time.monotonic() - self._checked_at < self.ttl
+
+    async def check(self) -> Dict[str, Any]:
+        if self._fresh():
+            return self._result
+        async with self.lock:
+            if self._fresh():
+                return self._result
+            results = await asyncio.gather(*(self._ping(check) for check in self.checks.values()))
+            stores = dict(zip(self.checks, results))
+            self._result = {
+                "healthy": all(store["status"] == "up" for store in stores.values()),
+                "stores": stores
+            }
+            self._checked_at = time.monotonic()
+            for name, store in stores.items():
+                if store["status"] != "up":
+                    logger.warning(f"Health check: {name} is {store['status']} ({store['latency_ms']}ms)")
+            return self._result
+
+# Done by ELYES
+health_checker = HealthChecker(
+    {"postgres": ping_postgres, "mongodb": ping_mongodb, "redis": ping_redis},
+    timeout=settings.HEALTH_CHECK_TIMEOUT,
+    ttl=settings.HEALTH_CHECK_CACHE_TTL
+)
+
+async def check_db_health() -> Dict[str, Any]:
+    # Done by ELYES
+    return await health_checker.check()
 
 async def init_db():
     # Initialize database connections
     # Done by ELYES
     try:
-        # Create PostgreSQL tables
-        Base.metadata.create_all(bind=engine)
+        # Create PostgreSQL tables (this also proves the connection works)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
         logger.info("PostgreSQL tables created successfully")
         
-        # Test PostgreSQL connection
-        db = SessionLocal()
-        db.execute("SELECT 1")
-        db.close()
-        
         # Test MongoDB connection
         await mongodb_client.admin.command('ping')
         
+        # Upload upserts are keyed on intent; the catalog polls updated_at
+        await mongodb.training_data.create_index("intent")
+        await mongodb.training_data.create_index("updated_at")
+        # Chat history pages: equality on user_id, then the keyset sort
+        await mongodb.messages.create_index([("user_id", 1), ("timestamp", -1), ("_id", -1)])
+        # Training workers claim the oldest queued job
+        await mongodb.training_jobs.create_index([("status", 1), ("created_at", 1)])
+        # At most one queued incremental job, which further changes join
+        await mongodb.training_jobs.create_index(
+            [("mode", 1), ("status", 1)],
+            unique=True,
+            partialFilterExpression={"mode": "incremental", "status": "queued"},
+            name="one_queued_incremental_job"
+        )
+        
         # Test Redis connection
         await redis_client.ping()
         
@@ -88,10 +226,38 @@ async def init_db():
         logger.error(f"Error connecting to databases: {e}")
         raise e
 
-def get_db():
+async def warm_up_pools():
+    # Opens the minimum number of connections to each store concurrently, so
+    # the first requests after a deploy don't pay for connection setup.
+    # Overlapping pings each need their own connection.
     # Done by ELYES
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close() 
\ No newline at end of file
+    warm_ups = {
+        "postgres": (ping_postgres, settings.DATABASE_POOL_MIN_SIZE),
+        "mongodb": (ping_mongodb, settings.MONGODB_MIN_POOL_SIZE),
+        "redis": (ping_redis, settings.REDIS_MIN_CONNECTIONS),
+    }
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*(
+        asyncio.gather(*(ping() for _ in range(count)), return_exceptions=True)
+        for ping, count in warm_ups.values()
+    ))
+    for name, outcomes in zip(warm_ups, results):
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        if errors:
+            logger.warning(f"Could not warm up {name} pool: {str(errors[0])}")
+    logger.info(
+        "Connection pools warmed up in "
+        f"{time.perf_counter() - start_time:.3f}s: "
+        + ", ".join(f"{name}={metrics.opened}" for name, metrics in pool_metrics.items())
+    )
+
+def pool_stats() -> Dict[str, Any]:
+    # Done by ELYES
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
+
+async def close_db():
+    # Done by ELYES
+    await engine.dispose()
+    mongodb_client.close()
+    # The pool was passed in, so it is only closed when asked for
+    await redis_client.aclose(close_connection_pool=True)
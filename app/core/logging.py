@@ -4,10 +4,14 @@ Logging configuration for ChatXpert
 Done by ELYES
 """
 
+import atexit
+import json
 import logging
 import logging.handlers
-import os
+import queue
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, Optional
 from app.core.config import settings
 
 # Done by ELYES
@@ -15,21 +19,84 @@ from app.core.config import settings
 log_dir = Path("logs")
 log_dir.mkdir(exist_ok=True)
 
+# Attributes every LogRecord has; anything else came in through extra=
+# Done by ELYES
+RESERVED_ATTRS = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+# Done by ELYES
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line, with extra= fields as top-level keys
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+# Done by ELYES
+class SamplingFilter(logging.Filter):
+    # Keeps rate of the records below WARNING from each sampled logger, e.g.
+    # every tenth at 0.1; warnings and errors always pass
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._credit = {name: 0.0 for name in self.rates}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.name)
+        if rate is None or rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        credit = self._credit[record.name] + rate
+        if credit >= 1:
+            self._credit[record.name] = credit - 1
+            return True
+        self._credit[record.name] = credit
+        return False
+
+# Done by ELYES
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # The stdlib QueueHandler formats every record on the logging thread so
+    # it can be pickled; this queue never leaves the process, so records are
+    # passed as they are and formatted by the listener thread instead. A full
+    # queue drops the record rather than blocking the event loop.
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 # Configure logging
 # Done by ELYES
 def setup_logging():
     # Get log level from settings
     log_level = getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO)
-    
+
     # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
+    if settings.LOG_FORMAT.lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+
     # Create console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    
+
     # Create file handler
     file_handler = logging.handlers.RotatingFileHandler(
         filename=log_dir / "chatxpert.log",
@@ -37,18 +104,33 @@ def setup_logging():
         backupCount=5
     )
     file_handler.setFormatter(formatter)
-    
+
+    # Callers only enqueue; console and file writes happen on the
+    # listener's thread, off the event loop
+    queue_handler = LazyQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLING))
+    listener = logging.handlers.QueueListener(
+        queue_handler.queue,
+        console_handler,
+        file_handler,
+        respect_handler_level=True
+    )
+    listener.start()
+    # Writes out whatever is still queued at exit
+    atexit.register(listener.stop)
+
     # Configure root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level)
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
-    
+    root_logger.addHandler(queue_handler)
+
     # Create logger for this module
     logger = logging.getLogger("chatxpert")
     logger.setLevel(log_level)
-    
-    return logger
+
+    return logger, queue_handler
 
 # Done by ELYES
-logger = setup_logging() 
\ No newline at end of file
+logger, log_handler = setup_logging()
+# One line per HTTP request, sampled through LOG_SAMPLING
+request_logger = logging.getLogger("chatxpert.requests")
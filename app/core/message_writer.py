@@ -0,0 +1,232 @@
+"""
+Write-behind message log for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+from app.core.chat_history import chat_history
+from app.core.config import settings
+from app.core.database import mongodb
+from app.core.logging import logger
+from app.core.metrics import pipeline_stage_seconds
+from app.core.profiling import record_stage
+
+# Done by ELYES
+DUPLICATE_KEY_ERROR = 11000
+# A batch write, or an inline one, from the call to the on_written hook
+PERSISTENCE = pipeline_stage_seconds.labels("persistence")
+
+class MessageWriter:
+    # Queues documents in memory and writes them with insert_many once
+    # max_batch_size are waiting or the oldest has waited flush_interval.
+    # When the queue is full, write() waits up to enqueue_timeout for space and
+    # then inserts inline, so a slow database pushes back on producers instead
+    # of growing memory without bound. on_written is awaited with every batch
+    # once it is in the collection.
+    # Done by ELYES
+    def __init__(
+        self,
+        collection,
+        max_batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_queue_size: int = 10000,
+        enqueue_timeout: float = 1.0,
+        drain_timeout: float = 10.0,
+        max_retries: int = 3,
+        on_written: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+    ):
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.enqueue_timeout = enqueue_timeout
+        self.drain_timeout = drain_timeout
+        self.max_retries = max_retries
+        self.on_written = on_written
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Documents taken off the queue and not flushed yet
+        self._batch: List[Dict[str, Any]] = []
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.inline_writes = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Message writer started (max_batch_size={self.max_batch_size}, "
+            f"flush_interval={self.flush_interval:g}s)"
+        )
+
+    async def stop(self):
+        # Drains everything queued before returning, unless the database stays
+        # unavailable for longer than drain_timeout
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Message writer drain timed out with {self.queue_depth} messages queued")
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        # A batch cut off mid-flush may or may not have reached the collection
+        dropped = len(self._batch) + self._queue.qsize()
+        self._batch = []
+        if dropped:
+            self.failed += dropped
+            logger.error(f"Dropped {dropped} unwritten messages on shutdown")
+        logger.info("Message writer stopped")
+
+    async def _written(self, documents: List[Dict[str, Any]]):
+        if self.on_written is None:
+            return
+        try:
+            await self.on_written(documents)
+        except Exception as e:
+            logger.error(f"Message writer on_written hook failed: {str(e)}")
+
+    async def _insert_one(self, document: Dict[str, Any]):
+        start_time = time.perf_counter()
+        await self.collection.insert_one(document)
+        await self._written([document])
+        PERSISTENCE.observe(time.perf_counter() - start_time)
+
+    async def write(self, document: Dict[str, Any]):
+        # A traced request sees what the write cost it: an enqueue, or an
+        # inline insert when the writer is stopped or backed up
+        start_time = time.perf_counter()
+        try:
+            await self._write(document)
+        finally:
+            record_stage("persistence", time.perf_counter() - start_time)
+
+    async def _write(self, document: Dict[str, Any]):
+        if not self.running:
+            await self._insert_one(document)
+            return
+        try:
+            self._queue.put_nowait(document)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(document), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.inline_writes += 1
+                await self._insert_one(document)
+                return
+        self.enqueued += 1
+
+    async def _collect(self) -> List[Dict[str, Any]]:
+        # Collected into self._batch, so stop() can account for what was taken
+        batch = self._batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            getter = asyncio.ensure_future(self._queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                # Not awaited: a cancelled get leaves its item in the queue,
+                # and awaiting it could swallow stop()'s cancellation
+                if not getter.cancel():
+                    # The item arrived just before the cancel
+                    batch.append(getter.result())
+                break
+            batch.append(getter.result())
+        return batch
+
+    async def _insert(self, batch: List[Dict[str, Any]]):
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # insert_many assigns _id in place, so a retry after a partial
+            # write reports the documents that already made it as duplicates
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        start_time = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._insert(batch)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    logger.error(f"Could not write {len(batch)} messages: {str(e)}", exc_info=True)
+                    return
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        await self._written(batch)
+        elapsed = time.perf_counter() - start_time
+        PERSISTENCE.observe(elapsed)
+        self.written += len(batch)
+        self.flushes += 1
+        self.flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._flush(batch)
+                self._batch = []
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_size": self.max_queue_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "inline_writes": self.inline_writes,
+            "flushes": self.flushes,
+            "average_flush_seconds": self.flush_seconds / self.flushes if self.flushes else 0.0,
+            "max_flush_seconds": self.max_flush_seconds
+        }
+
+# Done by ELYES
+message_writer = MessageWriter(
+    mongodb.messages,
+    max_batch_size=settings.MESSAGE_WRITER_BATCH_SIZE,
+    flush_interval=settings.MESSAGE_WRITER_FLUSH_INTERVAL,
+    max_queue_size=settings.MESSAGE_WRITER_MAX_QUEUE_SIZE,
+    enqueue_timeout=settings.MESSAGE_WRITER_ENQUEUE_TIMEOUT,
+    drain_timeout=settings.MESSAGE_WRITER_DRAIN_TIMEOUT,
+    on_written=chat_history.written
+)
@@ -0,0 +1,269 @@
+"""
+Metrics for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Prometheus text exposition format; Starlette appends the charset
+# Done by ELYES
+CONTENT_TYPE = "text/plain; version=0.0.4"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRAINING_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+def _escape(value: str) -> str:
+    # Done by ELYES
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    # Done by ELYES
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    # Done by ELYES
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return str(int(value)) if value == int(value) else repr(float(value))
+
+class _Sharded:
+    # A row of values per writing thread: every row has a single writer, so
+    # updates are plain list operations with no lock, and a scrape adds the
+    # rows up. A scrape may miss an update still in flight, never corrupt one.
+    # Done by ELYES
+    def __init__(self, width: int):
+        self.width = width
+        self.shards: Dict[int, List[float]] = {}
+
+    def shard(self) -> List[float]:
+        ident = threading.get_ident()
+        shard = self.shards.get(ident)
+        if shard is None:
+            # Thread ids are only reused once a thread has exited
+            shard = self.shards.setdefault(ident, [0.0] * self.width)
+        return shard
+
+    def total(self) -> List[float]:
+        totals = [0.0] * self.width
+        for shard in list(self.shards.values()):
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+class CounterChild(_Sharded):
+    # Done by ELYES
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1.0):
+        self.shard()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self.total()[0]
+
+class HistogramChild(_Sharded):
+    # Per-bucket counts (not cumulative, so an observation touches one
+    # bucket), then the sum
+    # Done by ELYES
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        super().__init__(len(bounds) + 1)
+
+    def observe(self, value: float):
+        shard = self.shard()
+        shard[bisect.bisect_left(self.bounds, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        # (cumulative bucket counts, sum, count)
+        totals = self.total()
+        cumulative, running = [], 0.0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1], running
+
+class _Metric:
+    # A metric family; children are created once per label values and are
+    # best kept by callers on hot paths
+    # Done by ELYES
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = self._children.setdefault(key, self._child())
+        return child
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.type}"
+        ]
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    # Done by ELYES
+    type = "counter"
+
+    def _child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            labels = _format_labels(list(zip(self.labelnames, values)))
+            lines.append(f"{self.name}{labels} {_format_value(child.value)}")
+        return lines
+
+class Histogram(_Metric):
+    # Done by ELYES
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets)) + (math.inf,)
+
+    def _child(self) -> HistogramChild:
+        return HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            pairs = list(zip(self.labelnames, values))
+            cumulative, total, count = child.snapshot()
+            for bound, bucket_count in zip(self.bounds, cumulative):
+                labels = _format_labels(pairs + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {_format_value(bucket_count)}")
+            labels = _format_labels(pairs)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {_format_value(count)}")
+        return lines
+
+class CallbackMetric(_Metric):
+    # Samples read at scrape time from counters a component already keeps,
+    # so its hot path does not pay twice
+    # Done by ELYES
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        samples: Callable[[], Iterable[Tuple[Sequence[str], float]]],
+        type: str = "gauge"
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.samples = samples
+        self.type = type
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for values, value in self.samples():
+            labels = _format_labels(list(zip(self.labelnames, (str(v) for v in values))))
+            lines.append(f"{self.name}{labels} {_format_value(float(value))}")
+        return lines
+
+class MetricsRegistry:
+    # This worker's metrics in the Prometheus text format; with several
+    # workers each is scraped, or summed, separately
+    # Done by ELYES
+    def __init__(self, namespace: str = ""):
+        self.namespace = namespace
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def _name(self, name: str) -> str:
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self._name(name), documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self._name(name), documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        samples: Callable[[], Iterable[Tuple[Sequence[str], float]]],
+        type: str = "gauge"
+    ) -> CallbackMetric:
+        return self._register(CallbackMetric(self._name(name), documentation, labelnames, samples, type))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+# Done by ELYES
+metrics = MetricsRegistry("chatxpert")
+
+# Done by ELYES
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time to response headers, by route template and status",
+    ("method", "route", "status")
+)
+pipeline_stage_seconds = metrics.histogram(
+    "pipeline_stage_duration_seconds",
+    "Time spent in each chat pipeline stage",
+    ("stage",)
+)
+rate_limit_rejections = metrics.counter(
+    "rate_limit_rejections_total",
+    "Requests rejected by a rate limiter, by limiter and policy",
+    ("limiter", "policy")
+)
+training_job_seconds = metrics.histogram(
+    "training_job_duration_seconds",
+    "Training job run time, by mode and outcome",
+    ("mode", "status"),
+    buckets=TRAINING_BUCKETS
+)
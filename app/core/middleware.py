@@ -4,88 +4,226 @@ Middleware for ChatXpert
 Done by ELYES
 """
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+# Plain ASGI middleware: each layer wraps send() instead of buffering the
+# response through BaseHTTPMiddleware's extra task and memory stream, so
+# streaming responses pass straight through.
+
+from fastapi import Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Any, Dict, Iterable, Optional
+import math
 import time
-from app.core.logging import logger
-from app.core.exceptions import AppException
-from app.core.database import redis_client
+from app.core.logging import logger, request_logger
+from app.core.metrics import http_request_seconds
+from app.core.profiling import RequestProfiler, current_trace, request_profiler
+from app.core.rate_limit import RateLimiter, rate_limiter
+from app.core.security import decode_access_token
+
+# Done by ELYES
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    "Content-Security-Policy": "default-src 'self'",
+}
+# The interactive API docs load their assets from a CDN
+CSP_EXEMPT_PATHS = ("/docs", "/redoc")
 
 # Done by ELYES
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-    
-    async def dispatch(self, request: Request, call_next):
+        self.app = app
+        # endpoint -> route path, filled as routes are first hit
+        self.routes: Dict[Any, str] = {}
+
+    def route_template(self, scope: Scope) -> str:
+        # The matched route's path ("/api/training/status/{job_id}"), so
+        # metrics get one series per route instead of one per URL
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        template = self.routes.get(endpoint)
+        if template is None:
+            routes = getattr(scope.get("app"), "routes", ())
+            template = next(
+                (route.path for route in routes if getattr(route, "endpoint", None) is endpoint),
+                "unmatched"
+            )
+            self.routes[endpoint] = template
+        return template
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
         # Start timer
-        start_time = time.time()
-        
-        # Process request
-        response = await call_next(request)
-        
-        # Calculate processing time
-        process_time = time.time() - start_time
-        
-        # Log request details
-        logger.info(
-            f"Request: {request.method} {request.url.path} "
-            f"Status: {response.status_code} "
-            f"Process Time: {process_time:.4f}s"
-        )
-        
-        # Add processing time to response headers
-        response.headers["X-Process-Time"] = f"{process_time:.4f}s"
-        
-        return response
+        start_time = time.perf_counter()
+        status_code = 500
+        process_time = 0.0
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code, process_time
+            if message["type"] == "http.response.start":
+                # Processing time up to the response headers
+                status_code = message["status"]
+                process_time = time.perf_counter() - start_time
+                MutableHeaders(scope=message).append("X-Process-Time", f"{process_time:.4f}s")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            process_time = process_time or time.perf_counter() - start_time
+            http_request_seconds.labels(scope["method"], self.route_template(scope), status_code).observe(process_time)
+            # Log request details; formatted later, on the log writer thread
+            request_logger.info(
+                "Request: %s %s Status: %s Process Time: %.4fs",
+                scope["method"],
+                scope["path"],
+                status_code,
+                process_time,
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status_code": status_code,
+                    "duration": process_time
+                }
+            )
 
 # Done by ELYES
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp, rate_limit: int = 100, window: int = 60):
-        super().__init__(app)
-        self.rate_limit = rate_limit
-        self.window = window
-    
-    async def dispatch(self, request: Request, call_next):
-        # Get client IP
-        client_ip = request.client.host
-        
-        # Check rate limit
-        key = f"rate_limit:{client_ip}"
-        current = await redis_client.get(key)
-        
-        if current and int(current) > self.rate_limit:
-            logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-            return Response(
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp, profiler: RequestProfiler = request_profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        profiler = self.profiler
+        # Disabled and nothing armed: one attribute check per request
+        if scope["type"] != "http" or not profiler.active:
+            return await self.app(scope, receive, send)
+
+        trace = profiler.begin(scope)
+        profile = profiler.wants_profile(scope)
+
+        async def send_with_trace(message: Message):
+            if message["type"] == "http.response.start":
+                trace.status_code = message["status"]
+                if profile:
+                    MutableHeaders(scope=message).append("X-Profile-Id", trace.id)
+            await send(message)
+
+        token = current_trace.set(trace)
+        try:
+            if profile:
+                # False when cProfile could not start: no X-Profile-Id then
+                with profiler.profiled(trace) as profile:
+                    await self.app(scope, receive, send_with_trace)
+            else:
+                await self.app(scope, receive, send_with_trace)
+        finally:
+            current_trace.reset(token)
+            profiler.end(trace)
+
+def rate_limit_identity(headers: Headers, client: Optional[tuple]) -> str:
+    # Authenticated requests are limited per user, everything else per IP
+    # Done by ELYES
+    authorization = headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            username = decode_access_token(token).get("sub")
+            if username:
+                return f"user:{username}"
+        except Exception:
+            pass
+    return f"ip:{client[0] if client else 'unknown'}"
+
+# Done by ELYES
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # One atomic Redis round trip (or none, with a local token lease)
+        identity = rate_limit_identity(Headers(scope=scope), scope.get("client"))
+        result = await self.limiter.hit(identity, scope["path"])
+
+        if not result.allowed:
+            logger.warning(f"Rate limit exceeded for {identity} on {scope['path']}")
+            response = Response(
                 content="Too many requests",
                 status_code=429,
-                headers={"Retry-After": str(self.window)}
+                headers={"Retry-After": str(max(1, math.ceil(result.retry_after)))}
             )
-        
-        # Increment counter
-        pipe = redis_client.pipeline()
-        pipe.incr(key)
-        pipe.expire(key, self.window)
-        await pipe.execute()
-        
+            return await response(scope, receive, send)
+
         # Process request
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
 
 # Done by ELYES
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
+class ErrorHandlingMiddleware:
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-    
-    async def dispatch(self, request: Request, call_next):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        response_started = False
+
+        async def send_tracking(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
-            return await call_next(request)
+            await self.app(scope, receive, send_tracking)
         except Exception as e:
             # Log the error
             logger.error(f"Unhandled exception: {str(e)}", exc_info=True)
-            
+            if response_started:
+                # Too late for an error response; let the server drop the connection
+                raise
+
             # Return a generic error response
-            return Response(
+            response = Response(
                 content="Internal server error",
                 status_code=500
-            ) 
\ No newline at end of file
+            )
+            await response(scope, receive, send)
+
+# Done by ELYES
+class SecurityHeadersMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        headers: Optional[Dict[str, str]] = None,
+        csp_exempt_paths: Iterable[str] = CSP_EXEMPT_PATHS
+    ):
+        self.app = app
+        self.headers = list((headers if headers is not None else SECURITY_HEADERS).items())
+        self.csp_exempt_paths = tuple(csp_exempt_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = self.headers
+        if scope["path"].startswith(self.csp_exempt_paths):
+            headers = [(name, value) for name, value in headers if name != "Content-Security-Policy"]
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                for name, value in headers:
+                    response_headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
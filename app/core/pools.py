@@ -0,0 +1,171 @@
+"""
+Connection pool instrumentation for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pymongo import monitoring
+from redis.asyncio.connection import ConnectionPool
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Done by ELYES
+class PoolMetrics:
+    # Per-worker pool counters. The Mongo driver reports from its own threads,
+    # hence the lock.
+    def __init__(self, name: str, size: Optional[int] = None):
+        self.name = name
+        self.size = size
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.acquisitions = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.opened = 0
+
+    def acquired(self, wait: float):
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.acquisitions += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def released(self):
+        with self._lock:
+            self.checked_out -= 1
+
+    def timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def connection_opened(self):
+        with self._lock:
+            self.opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "acquisitions": self.acquisitions,
+                "average_wait_seconds": self.wait_seconds / self.acquisitions if self.acquisitions else 0.0,
+                "max_wait_seconds": self.max_wait_seconds,
+                "timeouts": self.timeouts,
+                "opened": self.opened
+            }
+
+def instrumented_sqlalchemy_pool(metrics: PoolMetrics) -> type:
+    # A poolclass for create_async_engine. SQLAlchemy rebuilds pools from their
+    # class on dispose(), so the metrics travel on the class, not the instance.
+    # Done by ELYES
+    class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+        def _do_get(self):
+            start_time = time.perf_counter()
+            try:
+                record = super()._do_get()
+            except exc.TimeoutError:
+                metrics.timed_out()
+                raise
+            metrics.acquired(time.perf_counter() - start_time)
+            return record
+
+        def _do_return_conn(self, record):
+            metrics.released()
+            super()._do_return_conn(record)
+
+        def _create_connection(self):
+            metrics.connection_opened()
+            return super()._create_connection()
+
+    return InstrumentedQueuePool
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    # Check-out started/finished events for one operation fire on the same
+    # driver thread, so the start time is kept per thread
+    # Done by ELYES
+    def __init__(self, metrics: PoolMetrics):
+        self.metrics = metrics
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        self.metrics.acquired(time.perf_counter() - started if started is not None else 0.0)
+
+    def connection_check_out_failed(self, event):
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            self.metrics.timed_out()
+
+    def connection_checked_in(self, event):
+        self.metrics.released()
+
+    def connection_created(self, event):
+        self.metrics.connection_opened()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+class InstrumentedRedisPool(ConnectionPool):
+    # redis-py's pool fails immediately with "Too many connections" once
+    # max_connections are in use; those failures are counted as timeouts
+    # Done by ELYES
+    def __init__(self, *args, metrics: Optional[PoolMetrics] = None, **kwargs):
+        self.metrics = metrics or PoolMetrics("redis", kwargs.get("max_connections"))
+        # Connections counted as acquired; the base class also releases ones
+        # that failed to connect, which never were
+        self._counted = set()
+        super().__init__(*args, **kwargs)
+
+    def reset(self):
+        super().reset()
+        for _ in self._counted:
+            self.metrics.released()
+        self._counted.clear()
+
+    def make_connection(self):
+        self.metrics.connection_opened()
+        return super().make_connection()
+
+    async def get_connection(self, command_name, *keys, **options):
+        start_time = time.perf_counter()
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+        except RedisConnectionError as e:
+            if "Too many connections" in str(e):
+                self.metrics.timed_out()
+            raise
+        self._counted.add(connection)
+        self.metrics.acquired(time.perf_counter() - start_time)
+        return connection
+
+    async def release(self, connection):
+        if connection in self._counted:
+            self._counted.discard(connection)
+            self.metrics.released()
+        await super().release(connection)
@@ -0,0 +1,268 @@
+"""
+Request profiling for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import collections
+import contextlib
+import contextvars
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.logging import logger
+
+# Done by ELYES
+MAX_STACK_DEPTH = 64
+# Distinct stacks kept with a slow trace, most sampled first
+TOP_STACKS = 20
+# Both views are of the event loop's thread, not of one request
+TRACE_SCOPE = (
+    "The profile and stacks cover the whole event-loop thread, including "
+    "any requests that overlapped this one"
+)
+# The trace of the request running in this context, if it is being traced
+current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+def record_stage(name: str, seconds: float):
+    # Adds a chat pipeline stage timing to the traced request; a single
+    # context variable read when nothing is traced
+    # Done by ELYES
+    trace = current_trace.get()
+    if trace is not None:
+        trace.stages.append((name, seconds))
+
+def _stack(frame) -> Tuple[str, ...]:
+    # Outermost frame first, as in folded flame graph stacks
+    # Done by ELYES
+    frames = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return tuple(reversed(frames))
+
+class RequestTrace:
+    # Done by ELYES
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.status_code = 500
+        self.stages: List[Tuple[str, float]] = []
+        self.profile: Optional[str] = None
+        self.stacks: List[Tuple[str, int]] = []
+        # Other requests in flight at any point while this one ran
+        self.overlapping = 0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": "profile" if self.profile is not None else "slow",
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "stages": [{"stage": name, "seconds": seconds} for name, seconds in self.stages]
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            **self.summary(),
+            "scope": "event_loop_thread",
+            "overlapping_requests": self.overlapping,
+            "note": TRACE_SCOPE,
+            "profile": self.profile,
+            "stacks": [{"stack": stack, "samples": count} for stack, count in self.stacks]
+        }
+
+class StackSampler:
+    # Samples one thread's stack every interval from a daemon thread while
+    # requests are in flight, keeping the last window seconds of samples.
+    # Samples taken while the event loop waits on I/O end in its selector,
+    # which is itself the answer for a request stuck on a slow store.
+    # Done by ELYES
+    def __init__(self, interval: float = 0.01, window: float = 60.0):
+        self.interval = interval
+        self.samples: Deque[Tuple[float, Tuple[str, ...]]] = collections.deque(
+            maxlen=max(1, int(window / interval))
+        )
+        self.thread_id: Optional[int] = None
+        self.in_flight = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, thread_id: int):
+        # Follows the thread requests arrive on, should the loop move
+        self.thread_id = thread_id
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.in_flight:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples.append((time.perf_counter(), _stack(frame)))
+
+    def stacks_between(self, start: float, end: float, top: int = TOP_STACKS) -> List[Tuple[str, int]]:
+        # (folded stack, samples) for the samples taken in [start, end]
+        counts = collections.Counter(
+            stack for taken_at, stack in list(self.samples) if start <= taken_at <= end
+        )
+        return [(";".join(stack), count) for stack, count in counts.most_common(top)]
+
+class RequestProfiler:
+    # Opt-in views of where a request's time went. A request carrying the
+    # profiling header with the configured token, or one an admin armed, runs
+    # under cProfile; with profiling enabled, requests slower than threshold
+    # keep the event loop stacks sampled while they ran. Both are kept, with
+    # their chat pipeline stage timings, in a ring of the last max_traces.
+    # Done by ELYES
+    def __init__(
+        self,
+        enabled: bool = False,
+        header: str = "X-Profile",
+        token: Optional[str] = None,
+        threshold: float = 1.0,
+        max_traces: int = 50,
+        interval: float = 0.01,
+        top_n: int = 40
+    ):
+        self.enabled = enabled
+        self.header = header.lower().encode()
+        self.token = token.encode() if token else None
+        self.threshold = threshold
+        self.top_n = top_n
+        self.traces: Deque[RequestTrace] = collections.deque(maxlen=max_traces)
+        self.sampler = StackSampler(interval)
+        # Path prefixes (None for any path) of the next requests to profile
+        self.armed: List[Optional[str]] = []
+        self._profiling = False
+        self._in_flight: Set[RequestTrace] = set()
+
+    @property
+    def active(self) -> bool:
+        # False means the middleware passes requests straight through
+        return self.enabled or bool(self.armed)
+
+    def arm(self, path: Optional[str] = None, count: int = 1) -> int:
+        self.armed.extend([path] * count)
+        return len(self.armed)
+
+    def wants_profile(self, scope) -> bool:
+        # cProfile hooks the whole thread, so one profile runs at a time
+        if self._profiling:
+            return False
+        for i, prefix in enumerate(self.armed):
+            if prefix is None or scope["path"].startswith(prefix):
+                del self.armed[i]
+                return True
+        if self.enabled and self.token is not None:
+            for name, value in scope["headers"]:
+                if name == self.header and hmac.compare_digest(value, self.token):
+                    return True
+        return False
+
+    def begin(self, scope) -> RequestTrace:
+        if self.enabled:
+            # Requests arrive on the event loop's thread
+            self.sampler.start(threading.get_ident())
+        self.sampler.in_flight += 1
+        trace = RequestTrace(scope["method"], scope["path"])
+        trace.overlapping = len(self._in_flight)
+        for other in self._in_flight:
+            other.overlapping += 1
+        self._in_flight.add(trace)
+        return trace
+
+    @contextlib.contextmanager
+    def profiled(self, trace: RequestTrace) -> Iterator[bool]:
+        # Yields whether the request is really being profiled. Other requests
+        # interleaving on the event loop show up in the report too; on a
+        # quiet worker it is this request's profile.
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Another profiler (a debugger, coverage) already owns the hook
+            logger.warning(f"Could not profile request: {str(e)}")
+            yield False
+            return
+        self._profiling = True
+        try:
+            yield True
+        finally:
+            profile.disable()
+            self._profiling = False
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(self.top_n)
+            trace.profile = stream.getvalue()
+
+    def end(self, trace: RequestTrace):
+        self.sampler.in_flight -= 1
+        self._in_flight.discard(trace)
+        trace.duration = time.perf_counter() - trace.start
+        slow = self.enabled and trace.duration >= self.threshold
+        if slow:
+            trace.stacks = self.sampler.stacks_between(trace.start, trace.start + trace.duration)
+            logger.warning(
+                "Slow request %s %s took %.3fs (trace %s)",
+                trace.method,
+                trace.path,
+                trace.duration,
+                trace.id
+            )
+        if slow or trace.profile is not None:
+            self.traces.append(trace)
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        # Newest first
+        traces = list(self.traces)[::-1]
+        return [trace.summary() for trace in traces[:limit]]
+
+    def get(self, trace_id: str) -> Optional[RequestTrace]:
+        return next((trace for trace in self.traces if trace.id == trace_id), None)
+
+    def stop(self):
+        self.sampler.stop()
+
+# Done by ELYES
+request_profiler = RequestProfiler(
+    enabled=settings.PROFILING_ENABLED,
+    header=settings.PROFILING_HEADER,
+    token=settings.PROFILING_TOKEN,
+    threshold=settings.SLOW_REQUEST_THRESHOLD,
+    max_traces=settings.SLOW_REQUEST_TRACES,
+    interval=settings.SLOW_REQUEST_SAMPLE_INTERVAL,
+    top_n=settings.PROFILING_TOP_N
+)
@@ -0,0 +1,149 @@
+"""
+Rate limiting for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.logging import logger
+from app.core.metrics import rate_limit_rejections
+
+# GCRA (generic cell rate algorithm) in one atomic round trip. The key holds
+# the theoretical arrival time (TAT) in milliseconds of Redis server time.
+# Grants between ARGV[4] and ARGV[3] requests at once so workers can lease
+# tokens for their local buckets; returns {granted, remaining, retry_after_ms}.
+# Done by ELYES
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local minimum = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+local available = math.floor((tolerance - (tat - now)) / interval)
+if available < minimum then
+    local retry_after = math.ceil(tat + minimum * interval - tolerance - now)
+    return {0, math.max(available, 0), retry_after}
+end
+local granted = math.min(requested, available)
+tat = tat + granted * interval
+redis.call('SET', KEYS[1], tat, 'PX', math.ceil(tat - now))
+return {granted, available - granted, 0}
+"""
+
+class RateLimitPolicy(NamedTuple):
+    # limit requests per window seconds, with bursts of up to limit
+    # Done by ELYES
+    limit: int
+    window: float
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimitPolicy":
+        # "100/60" -> 100 requests per 60 seconds
+        limit, window = value.split("/")
+        return cls(int(limit), float(window))
+
+class RateLimitResult(NamedTuple):
+    # Done by ELYES
+    allowed: bool
+    remaining: int
+    retry_after: float = 0.0
+
+class RateLimiter:
+    # One limiter for the middleware and per-user checks. Policies are chosen
+    # by the longest matching route prefix, falling back to the default, and
+    # each policy keeps its own counters. With local_batch > 1 every worker
+    # leases up to local_batch tokens per Redis round trip and spends them
+    # in-process; unused leases lapse after lease_ttl, so the shared limit is
+    # never exceeded (a worker may just run out slightly early).
+    # Done by ELYES
+    def __init__(
+        self,
+        redis,
+        default: RateLimitPolicy,
+        routes: Optional[Dict[str, RateLimitPolicy]] = None,
+        local_batch: int = 0,
+        lease_ttl: float = 1.0,
+        fail_open: bool = True,
+        max_local_keys: int = 10000,
+        prefix: str = "rate_limit"
+    ):
+        self.redis = redis
+        self.default = default
+        # Longest prefix first
+        self.routes = sorted((routes or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.local_batch = local_batch
+        self.lease_ttl = lease_ttl
+        self.fail_open = fail_open
+        self.prefix = prefix
+        self.local = LRUCache(maxsize=max_local_keys)
+        self._script = redis.register_script(GCRA_SCRIPT) if redis is not None else None
+        self._last_error = 0.0
+
+    def policy_for(self, path: str) -> Tuple[str, RateLimitPolicy]:
+        for route, policy in self.routes:
+            if path.startswith(route):
+                return route, policy
+        return "default", self.default
+
+    async def _acquire(self, key: str, policy: RateLimitPolicy, requested: int, minimum: int):
+        interval = policy.window * 1000 / policy.limit
+        granted, remaining, retry_after = await self._script(
+            keys=[key],
+            args=[interval, policy.window * 1000, requested, minimum]
+        )
+        return int(granted), int(remaining), int(retry_after) / 1000
+
+    async def hit(self, identity: str, path: str = "", cost: int = 1) -> RateLimitResult:
+        name, policy = self.policy_for(path)
+        key = f"{self.prefix}:{name}:{identity}"
+
+        if self.local_batch > 1:
+            # (leased tokens left, shared remaining at lease time)
+            tokens, shared = self.local.get(key, (0, 0))
+            if tokens >= cost:
+                self.local.set(key, (tokens - cost, shared), ttl=self.lease_ttl)
+                return RateLimitResult(True, shared + tokens - cost)
+
+        try:
+            granted, remaining, retry_after = await self._acquire(
+                key,
+                policy,
+                max(cost, self.local_batch),
+                cost
+            )
+        except Exception as e:
+            # Redis being down should not take the API down with it
+            if time.monotonic() - self._last_error > 10:
+                self._last_error = time.monotonic()
+                logger.error(f"Rate limiter unavailable: {str(e)}")
+            if self.fail_open:
+                return RateLimitResult(True, policy.limit)
+            rate_limit_rejections.labels(self.prefix, name).inc()
+            return RateLimitResult(False, 0, policy.window)
+
+        if not granted:
+            rate_limit_rejections.labels(self.prefix, name).inc()
+            return RateLimitResult(False, remaining, retry_after)
+        if granted > cost:
+            self.local.set(key, (granted - cost, remaining), ttl=self.lease_ttl)
+        return RateLimitResult(True, remaining + granted - cost)
+
+# Done by ELYES
+rate_limiter = RateLimiter(
+    redis_client,
+    RateLimitPolicy.parse(settings.RATE_LIMIT_DEFAULT),
+    routes={route: RateLimitPolicy.parse(value) for route, value in settings.RATE_LIMIT_ROUTES.items()},
+    local_batch=settings.RATE_LIMIT_LOCAL_BATCH,
+    lease_ttl=settings.RATE_LIMIT_LEASE_TTL,
+    fail_open=settings.RATE_LIMIT_FAIL_OPEN
+)
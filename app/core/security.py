@@ -5,13 +5,19 @@ Done by ELYES
 """
 
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
+import math
+import time
+from bson import json_util
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from app.core.cache import LRUCache
 from app.core.config import settings
-from app.core.database import mongodb
+from app.core.database import mongodb, redis_client
+from app.core.logging import logger
+from app.core.rate_limit import RateLimiter, RateLimitPolicy
 
 # Done by ELYES
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -36,6 +42,122 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> Dict[str, Any]:
+    # Signature checks are memoized per token until the token expires
+    # Done by ELYES
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        expires_in = payload.get("exp", 0) - time.time()
+        if expires_in > 0:
+            token_cache.set(token, payload, ttl=expires_in)
+    # Callers get their own copy of the shared payload
+    return dict(payload)
+
+class UserCache:
+    # Resolves usernames to user documents: in-process LRU, then Redis, then
+    # Mongo. Unknown users are cached briefly as well, so replayed tokens for
+    # deleted accounts don't reach the database on every request. The local
+    # TTL bounds how long other workers can serve a user after invalidate().
+    # Done by ELYES
+    _MISSING = object()
+
+    def __init__(
+        self,
+        collection,
+        redis=None,
+        maxsize: int = 10000,
+        ttl: int = 300,
+        local_ttl: float = 30.0,
+        negative_ttl: int = 10,
+        prefix: str = "user"
+    ):
+        self.collection = collection
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.negative_ttl = negative_ttl
+        self.prefix = prefix
+        self.local = LRUCache(maxsize=maxsize)
+
+    def _key(self, username: str) -> str:
+        return f"{self.prefix}:{username}"
+
+    async def _get_remote(self, username: str) -> Any:
+        if self.redis is None:
+            return self._MISSING
+        try:
+            data = await self.redis.get(self._key(username))
+        except Exception as e:
+            logger.error(f"User cache get error: {str(e)}")
+            return self._MISSING
+        return self._MISSING if data is None else json_util.loads(data)
+
+    async def _set_remote(self, username: str, user: Optional[dict]):
+        if self.redis is None:
+            return
+        ttl = self.ttl if user is not None else self.negative_ttl
+        try:
+            await self.redis.setex(self._key(username), ttl, json_util.dumps(user))
+        except Exception as e:
+            logger.error(f"User cache set error: {str(e)}")
+
+    async def get(self, username: str) -> Optional[dict]:
+        user = self.local.get(username, self._MISSING)
+        if user is self._MISSING:
+            user = await self._get_remote(username)
+            if user is self._MISSING:
+                # The password hash never leaves the database through this path
+                user = await self.collection.find_one({"username": username}, {"hashed_password": 0})
+                await self._set_remote(username, user)
+            ttl = self.local_ttl if user is not None else min(self.local_ttl, self.negative_ttl)
+            self.local.set(username, user, ttl=ttl)
+        # Callers get their own copy of the shared document
+        return dict(user) if user is not None else None
+
+    async def invalidate(self, username: str):
+        # Call after a user is created, updated, disabled or deleted
+        self.local.delete(username)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self._key(username))
+            except Exception as e:
+                logger.error(f"User cache delete error: {str(e)}")
+
+# Done by ELYES
+user_rate_limiter = RateLimiter(
+    redis_client,
+    RateLimitPolicy.parse(settings.RATE_LIMIT_USER),
+    local_batch=settings.RATE_LIMIT_LOCAL_BATCH,
+    lease_ttl=settings.RATE_LIMIT_LEASE_TTL,
+    fail_open=settings.RATE_LIMIT_FAIL_OPEN,
+    prefix="rate_limit_user"
+)
+token_cache = LRUCache(maxsize=settings.TOKEN_CACHE_SIZE)
+user_cache = UserCache(
+    mongodb.users,
+    redis_client,
+    maxsize=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL,
+    local_ttl=settings.USER_CACHE_LOCAL_TTL,
+    negative_ttl=settings.USER_CACHE_NEGATIVE_TTL
+)
+
+async def get_user_from_token(token: str) -> Optional[Tuple[dict, Dict[str, Any]]]:
+    # (user, token payload), or None if the token or its user is invalid
+    # Done by ELYES
+    try:
+        payload = decode_access_token(token)
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+    user = await user_cache.get(username)
+    if user is None:
+        return None
+    return user, payload
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     # Done by ELYES
     credentials_exception = HTTPException(
@@ -43,18 +165,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-        
-    user = await mongodb.users.find_one({"username": username})
-    if user is None:
+    resolved = await get_user_from_token(token)
+    if resolved is None:
         raise credentials_exception
-    return user
+    return resolved[0]
 
 async def get_current_active_user(current_user = Depends(get_current_user)):
     # Done by ELYES
@@ -72,18 +186,12 @@ def check_admin_permission(current_user = Depends(get_current_active_user)):
     return current_user
 
 async def rate_limit_check(user_id: str):
-    # Implement rate limiting using Redis
+    # Same engine as the middleware, with its own per-user policy and counters
     # Done by ELYES
-    key = f"rate_limit:{user_id}"
-    current = await redis_client.get(key)
-    
-    if current and int(current) > 100:  # 100 requests per minute
+    result = await user_rate_limiter.hit(f"user:{user_id}")
+    if not result.allowed:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Too many requests"
+            detail="Too many requests",
+            headers={"Retry-After": str(max(1, math.ceil(result.retry_after)))}
         )
-    
-    pipe = redis_client.pipeline()
-    pipe.incr(key)
-    pipe.expire(key, 60)  # 60 seconds window
-    await pipe.execute() 
\ No newline at end of file
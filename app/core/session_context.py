@@ -0,0 +1,117 @@
+"""
+Conversation context store for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import msgpack
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.logging import logger
+
+# Done by ELYES
+DEFAULT_SESSION = "default"
+
+class Turn(NamedTuple):
+    # Done by ELYES
+    message: str
+    reply: str
+    intent: Optional[str] = None
+    timestamp: float = 0.0
+
+def encode_turn(turn: Turn) -> bytes:
+    # A msgpack array, without field names, is a few bytes over the text itself
+    # Done by ELYES
+    return msgpack.packb(list(turn), use_bin_type=True)
+
+def decode_turn(data: bytes) -> Turn:
+    # Done by ELYES
+    return Turn(*msgpack.unpackb(data, raw=False))
+
+def as_messages(turns: List[Turn]) -> List[Dict[str, str]]:
+    # Chat-completion history for build_messages
+    # Done by ELYES
+    messages = []
+    for turn in turns:
+        messages.append({"role": "user", "content": turn.message})
+        messages.append({"role": "assistant", "content": turn.reply})
+    return messages
+
+class SessionContextStore:
+    # The last max_turns turns of each conversation, kept in a Redis list that
+    # is trimmed on every append and expires after ttl of inactivity, so
+    # reading a conversation's context is one LRANGE instead of a history
+    # query. Reads go through a short-lived in-process cache, which this
+    # worker updates on append; without Redis it is the only copy.
+    # Done by ELYES
+    def __init__(
+        self,
+        redis=None,
+        max_turns: int = 10,
+        ttl: int = 3600,
+        local_maxsize: int = 10000,
+        local_ttl: float = 5.0,
+        prefix: str = "context"
+    ):
+        self.redis = redis
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local = LRUCache(maxsize=local_maxsize, ttl=local_ttl if redis is not None else ttl)
+
+    def _key(self, user_id: str, session_id: Optional[str]) -> str:
+        # Sessions are scoped to their user, so a session id alone never
+        # reaches another user's conversation
+        return f"{self.prefix}:{user_id}:{session_id or DEFAULT_SESSION}"
+
+    async def get(self, user_id: str, session_id: Optional[str] = None) -> List[Turn]:
+        key = self._key(user_id, session_id)
+        turns = self.local.get(key)
+        if turns is None:
+            turns = []
+            if self.redis is not None:
+                try:
+                    turns = [decode_turn(data) for data in await self.redis.lrange(key, 0, -1)]
+                except Exception as e:
+                    logger.error(f"Session context get error: {str(e)}")
+            self.local.set(key, turns)
+        return list(turns)
+
+    async def append(self, user_id: str, session_id: Optional[str], turn: Turn):
+        if not turn.timestamp:
+            turn = turn._replace(timestamp=time.time())
+        key = self._key(user_id, session_id)
+        turns = self.local.get(key)
+        if turns is not None or self.redis is None:
+            self.local.set(key, ((turns or []) + [turn])[-self.max_turns:])
+        if self.redis is None:
+            return
+        try:
+            await self.redis.pipeline(transaction=True).rpush(key, encode_turn(turn)).ltrim(
+                key, -self.max_turns, -1
+            ).expire(key, self.ttl).execute()
+        except Exception as e:
+            logger.error(f"Session context append error: {str(e)}")
+
+    async def clear(self, user_id: str, session_id: Optional[str] = None):
+        key = self._key(user_id, session_id)
+        self.local.delete(key)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(key)
+            except Exception as e:
+                logger.error(f"Session context clear error: {str(e)}")
+
+# Done by ELYES
+session_context = SessionContextStore(
+    redis_client,
+    max_turns=settings.SESSION_CONTEXT_TURNS,
+    ttl=settings.SESSION_CONTEXT_TTL,
+    local_maxsize=settings.SESSION_CONTEXT_CACHE_SIZE,
+    local_ttl=settings.SESSION_CONTEXT_LOCAL_TTL
+)
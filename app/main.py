@@ -4,7 +4,7 @@ ChatXpert - AI-Powered Universal Chatbot Platform
 Done by ELYES
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from typing import List, Optional, Dict
@@ -12,10 +12,26 @@ import uvicorn
 import time
 
 from app.core.config import settings
-from app.api.routes import chat, auth, training
-from app.core.database import init_db, check_db_health
-from app.core.logging import logger
-from app.core.middleware import RequestLoggingMiddleware, RateLimitMiddleware, ErrorHandlingMiddleware
+from app.api.routes import chat, auth, training, debug
+from app.core.database import init_db, check_db_health, close_db, pool_stats, warm_up_pools
+from app.core.logging import log_handler, logger
+from app.core.message_writer import message_writer
+from app.core.metrics import CONTENT_TYPE, metrics
+from app.core.profiling import request_profiler
+from app.core.middleware import (
+    ProfilingMiddleware,
+    RequestLoggingMiddleware,
+    RateLimitMiddleware,
+    ErrorHandlingMiddleware,
+    SecurityHeadersMiddleware
+)
+from app.ml.inference import inference_engine, intent_catalog, model_manager
+from app.ml.llm import llm_client
+from app.ml.prediction_cache import prediction_cache
+from app.ml.preprocessing import preprocessor
+from app.ml.router import response_router
+from app.ml.semantic_cache import semantic_cache
+from app.ml.training_runner import training_runner
 
 # Done by ELYES
 app = FastAPI(
@@ -32,19 +48,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Profile-Id"],
 )
 
-# Add custom middleware
+# Add custom middleware (pure ASGI; the last one added runs first)
 # Done by ELYES
+# Innermost, so a profile covers just the route; a pass-through unless
+# profiling is enabled or armed
+app.add_middleware(ProfilingMiddleware)
 app.add_middleware(RequestLoggingMiddleware)
-app.add_middleware(RateLimitMiddleware, rate_limit=100, window=60)
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(ErrorHandlingMiddleware)
+app.add_middleware(SecurityHeadersMiddleware)
 
 # Include routers
 # Done by ELYES
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
 app.include_router(training.router, prefix="/api/training", tags=["Training"])
+app.include_router(debug.router, prefix="/api/debug", tags=["Debug"])
+
+def cache_samples():
+    # ((cache, result), lookups) from the counters each cache already keeps
+    # Done by ELYES
+    yield ("prediction", "local_hit"), prediction_cache.local_hits
+    yield ("prediction", "remote_hit"), prediction_cache.remote_hits
+    yield ("prediction", "miss"), prediction_cache.misses
+    for name, info in preprocessor.stats().items():
+        yield (f"preprocessing_{name}", "hit"), info["hits"]
+        yield (f"preprocessing_{name}", "miss"), info["misses"]
+    yield ("semantic", "hit"), semantic_cache.hits
+    yield ("semantic", "miss"), semantic_cache.misses
+
+# Done by ELYES
+metrics.callback(
+    "cache_lookups_total",
+    "Cache lookups, by cache and result",
+    ("cache", "result"),
+    cache_samples,
+    type="counter"
+)
+metrics.callback(
+    "log_records_dropped_total",
+    "Log records dropped because the log queue was full",
+    (),
+    lambda: [((), log_handler.dropped)],
+    type="counter"
+)
 
 @app.on_event("startup")
 async def startup_event():
@@ -52,11 +102,31 @@ async def startup_event():
     logger.info("Starting ChatXpert application")
     await init_db()
     logger.info("Database initialized successfully")
+    await warm_up_pools()
+    await message_writer.start()
+    await inference_engine.start()
+    await model_manager.start()
+    await intent_catalog.start()
+    await training_runner.start()
+    # Loads the answers other workers cached, embedded with the live model
+    await semantic_cache.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     # Done by ELYES
     logger.info("Shutting down ChatXpert application")
+    await model_manager.stop()
+    await inference_engine.stop()
+    await intent_catalog.stop()
+    await semantic_cache.stop()
+    await training_runner.shutdown()
+    if llm_client is not None:
+        # Releases the OpenAI client's HTTP connection pool
+        await llm_client.close()
+    request_profiler.stop()
+    # Last, so messages from requests finishing during shutdown are written
+    await message_writer.stop()
+    await close_db()
 
 @app.get("/")
 async def root():
@@ -73,15 +143,16 @@ async def health_check():
     # Done by ELYES
     start_time = time.time()
     
-    # Check database health
-    db_healthy = await check_db_health()
+    # Concurrent, timeout-bounded pings of every store, cached briefly
+    health = await check_db_health()
     
     # Calculate response time
     response_time = time.time() - start_time
     
     return {
-        "status": "healthy" if db_healthy else "degraded",
-        "database": "connected" if db_healthy else "disconnected",
+        "status": "healthy" if health["healthy"] else "degraded",
+        "database": "connected" if health["stores"]["postgres"]["status"] == "up" else "disconnected",
+        "stores": health["stores"],
         "response_time": f"{response_time:.4f}s",
         "version": "1.0.0"
     }
@@ -93,10 +164,24 @@ async def system_info():
         "app_name": settings.APP_NAME,
         "debug": settings.DEBUG,
         "version": "1.0.0",
+        "cache": {
+            "prediction": prediction_cache.stats(),
+            "preprocessing": preprocessor.stats(),
+            "semantic": semantic_cache.stats()
+        },
+        "message_writer": message_writer.stats(),
+        "router": response_router.stats(),
+        "pools": pool_stats(),
         "author": "ELYES",
         "copyright": "© 2024-2025 ELYES. All rights reserved."
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    # Prometheus scrape target for this worker
+    # Done by ELYES
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     # Done by ELYES
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
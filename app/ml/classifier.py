@@ -0,0 +1,129 @@
+"""
+Intent classifier for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import hashlib
+import pickle
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.metrics import pipeline_stage_seconds
+from app.ml.numpy_model import NumpyMLP
+from app.ml.vectorizer import BagOfWordsVectorizer
+
+# Done by ELYES
+ERROR_THRESHOLD = 0.25
+# Timed per batch, on the inference thread
+TOKENIZE = pipeline_stage_seconds.labels("tokenize")
+VECTORIZE = pipeline_stage_seconds.labels("vectorize")
+PREDICT = pipeline_stage_seconds.labels("predict")
+
+class IntentClassifier:
+    # Vectorizer, class labels and model bundled together so a batch of
+    # sentences can be ranked with a single forward pass
+    # Done by ELYES
+    def __init__(
+        self,
+        vectorizer: BagOfWordsVectorizer,
+        classes: Sequence[str],
+        model: Any,
+        threshold: float = ERROR_THRESHOLD,
+        version: Optional[str] = None
+    ):
+        self.vectorizer = vectorizer
+        self.classes = list(classes)
+        self.model = model
+        self.threshold = threshold
+        # Identifies the artifacts behind this classifier, e.g. for cache keys
+        self.version = version
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(features))
+
+    def rank(self, probabilities: np.ndarray) -> List[Dict[str, Any]]:
+        # Intents above the threshold, most probable first
+        order = np.argsort(probabilities)[::-1]
+        return [
+            {"intent": self.classes[i], "probability": float(probabilities[i])}
+            for i in order
+            if probabilities[i] > self.threshold
+        ]
+
+    def predict_batch(self, sentences: Sequence[str]) -> List[List[Dict[str, Any]]]:
+        if not sentences:
+            return []
+        start_time = time.perf_counter()
+        tokens = [self.vectorizer.tokenizer(sentence) for sentence in sentences]
+        tokenized = time.perf_counter()
+        features = self.vectorizer.transform_tokens_batch(tokens)
+        vectorized = time.perf_counter()
+        ranked = [self.rank(row) for row in self.predict_proba(features)]
+        TOKENIZE.observe(tokenized - start_time)
+        VECTORIZE.observe(vectorized - tokenized)
+        PREDICT.observe(time.perf_counter() - vectorized)
+        return ranked
+
+    def predict_class(self, sentence: str) -> List[Dict[str, Any]]:
+        return self.predict_batch([sentence])[0]
+
+    def embed_batch(self, sentences: Sequence[str], hidden: bool = False) -> np.ndarray:
+        # Sentence vectors for similarity search: the bag of words, or the last
+        # hidden layer when the backend exposes it (the NumPy one does)
+        features = self.vectorizer.transform_batch(sentences)
+        if hidden and hasattr(self.model, "hidden_on_batch"):
+            return np.asarray(self.model.hidden_on_batch(features), dtype=np.float32)
+        return np.asarray(features, dtype=np.float32)
+
+def artifact_hash(*paths: str) -> str:
+    # Content hash of the model artifacts, used as the model version
+    # Done by ELYES
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def _load_classes(path: str) -> List[str]:
+    # Done by ELYES
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def load_keras_classifier(
+    model_path: str,
+    words_path: str,
+    classes_path: str,
+    threshold: float = ERROR_THRESHOLD,
+    version: Optional[str] = None
+) -> IntentClassifier:
+    # Done by ELYES
+    from tensorflow.keras.models import load_model
+
+    return IntentClassifier(
+        BagOfWordsVectorizer.from_pickle(words_path),
+        _load_classes(classes_path),
+        load_model(model_path, compile=False),
+        threshold=threshold,
+        version=version or artifact_hash(model_path, words_path, classes_path)
+    )
+
+def load_numpy_classifier(
+    weights_path: str,
+    words_path: str,
+    classes_path: str,
+    threshold: float = ERROR_THRESHOLD,
+    version: Optional[str] = None
+) -> IntentClassifier:
+    # Serves weights exported by app.ml.numpy_model without importing TensorFlow
+    # Done by ELYES
+    return IntentClassifier(
+        BagOfWordsVectorizer.from_pickle(words_path),
+        _load_classes(classes_path),
+        NumpyMLP.load(weights_path),
+        threshold=threshold,
+        version=version or artifact_hash(weights_path, words_path, classes_path)
+    )
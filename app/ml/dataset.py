@@ -0,0 +1,143 @@
+"""
+Training dataset builder for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import json
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from app.ml.preprocessing import clean_up_sentence
+
+# Done by ELYES
+IGNORE_LETTERS = frozenset({'?', '!', ',', '.'})
+
+class Dataset(NamedTuple):
+    words: List[str]
+    classes: List[str]
+    features: Any  # (patterns x words) uint8 ndarray, or scipy CSR matrix
+    labels: np.ndarray  # class index per pattern
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def one_hot(self, dtype=np.float32) -> np.ndarray:
+        targets = np.zeros((len(self.labels), len(self.classes)), dtype=dtype)
+        targets[np.arange(len(self.labels)), self.labels] = 1
+        return targets
+
+def iter_json_intents(path: str) -> Iterator[Dict[str, Any]]:
+    # Done by ELYES
+    with open(path) as f:
+        yield from json.load(f)["intents"]
+
+def iter_mongo_intents(url: str, collection: str = "training_data", batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    # Synchronous cursor for worker processes, which have no event loop
+    # Done by ELYES
+    from pymongo import MongoClient
+
+    client = MongoClient(url)
+    try:
+        cursor = client.get_database()[collection].find(
+            {},
+            {"_id": 0, "intent": 1, "patterns": 1},
+            batch_size=batch_size
+        )
+        yield from cursor
+    finally:
+        client.close()
+
+class DatasetBuilder:
+    # Builds the training matrices in one pass over a stream of intents.
+    # Token and class ids are assigned as they are first seen and kept in
+    # compact int arrays (CSR layout), then remapped to sorted order and
+    # scattered into a preallocated matrix by build(). When words/classes are
+    # given the vocabulary is fixed and unknown tokens are dropped.
+    # Done by ELYES
+    def __init__(
+        self,
+        tokenizer: Callable[[str], Sequence[str]] = clean_up_sentence,
+        words: Optional[Sequence[str]] = None,
+        classes: Optional[Sequence[str]] = None,
+        ignore: Iterable[str] = IGNORE_LETTERS
+    ):
+        self.tokenizer = tokenizer
+        self.ignore = frozenset(ignore)
+        self.fixed_words = words is not None
+        self.fixed_classes = classes is not None
+        self._word_ids: Dict[str, int] = {word: i for i, word in enumerate(words or ())}
+        self._class_ids: Dict[str, int] = {tag: i for i, tag in enumerate(classes or ())}
+        self._indices = array('i')
+        self._indptr = array('q', [0])
+        self._labels = array('i')
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._word_ids)
+
+    def _id(self, ids: Dict[str, int], key: str, fixed: bool) -> Optional[int]:
+        i = ids.get(key)
+        if i is None and not fixed:
+            i = ids[key] = len(ids)
+        return i
+
+    def add(self, tag: str, pattern: str) -> bool:
+        label = self._id(self._class_ids, tag, self.fixed_classes)
+        if label is None:
+            return False
+        columns = set()
+        for token in self.tokenizer(pattern):
+            if token not in self.ignore:
+                column = self._id(self._word_ids, token, self.fixed_words)
+                if column is not None:
+                    columns.add(column)
+        self._indices.extend(columns)
+        self._indptr.append(len(self._indices))
+        self._labels.append(label)
+        return True
+
+    def add_intents(self, intents: Iterable[Dict[str, Any]]) -> "DatasetBuilder":
+        # intents.json items ("tag") or training_data documents ("intent")
+        for intent in intents:
+            tag = intent.get("tag") or intent["intent"]
+            for pattern in intent["patterns"]:
+                self.add(tag, pattern)
+        return self
+
+    @staticmethod
+    def _sorted(ids: Dict[str, int], fixed: bool):
+        # Final labels (sorted unless fixed) and provisional id -> final position
+        names = list(ids)
+        if fixed:
+            return names, np.arange(len(names), dtype=np.int32)
+        order = sorted(range(len(names)), key=names.__getitem__)
+        remap = np.empty(len(names), dtype=np.int32)
+        remap[order] = np.arange(len(names), dtype=np.int32)
+        return [names[i] for i in order], remap
+
+    def build(self, sparse: bool = False, dtype=np.uint8) -> Dataset:
+        words, word_remap = self._sorted(self._word_ids, self.fixed_words)
+        classes, class_remap = self._sorted(self._class_ids, self.fixed_classes)
+
+        indptr = np.array(self._indptr, dtype=np.int64)
+        indices = word_remap[np.array(self._indices, dtype=np.int32)]
+        labels = class_remap[np.array(self._labels, dtype=np.int32)]
+        shape = (len(labels), len(words))
+
+        if sparse:
+            from scipy.sparse import csr_matrix
+
+            data = np.ones(len(indices), dtype=dtype)
+            features = csr_matrix((data, indices, indptr), shape=shape)
+            features.sort_indices()
+        else:
+            features = np.zeros(shape, dtype=dtype)
+            rows = np.repeat(np.arange(len(labels)), np.diff(indptr))
+            features[rows, indices] = 1
+        return Dataset(words, classes, features, labels)
@@ -0,0 +1,232 @@
+"""
+Micro-batching inference engine for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.database import mongodb
+from app.core.logging import logger
+from app.ml.classifier import (
+    IntentClassifier,
+    load_keras_classifier,
+    load_numpy_classifier
+)
+from app.ml.intents import IntentCatalogStore
+from app.ml.preprocessing import preprocessor
+from app.ml.registry import ModelManager, ModelRegistry
+from app.ml.training import CLASSES_FILE, MODEL_FILE, WEIGHTS_FILE, WORDS_FILE
+
+# Done by ELYES
+class InferenceEngine:
+    # Concurrent predict() calls are queued and flushed as one forward pass once
+    # max_batch_size requests are waiting or the oldest has waited max_wait_ms
+    def __init__(
+        self,
+        loader: Callable[[], IntentClassifier],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 1024
+    ):
+        self.loader = loader
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.classifier: Optional[IntentClassifier] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Requests taken off the queue and not answered yet
+        self._batch: List[Tuple[str, asyncio.Future]] = []
+        # One thread keeps forward passes serialized and off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+    def swap(self, classifier: IntentClassifier):
+        # Batches already running keep the classifier they started with
+        self.classifier = classifier
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # For other work on the serving model, queued behind the forward passes
+        return self._executor
+
+    @property
+    def model_version(self) -> Optional[str]:
+        return self.classifier.version if self.classifier else None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        self.classifier = await loop.run_in_executor(self._executor, self.loader)
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Inference engine started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:g})"
+        )
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        # Fail the batch in flight and anything still queued instead of
+        # leaving callers hanging
+        pending, self._batch = self._batch, []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Inference engine stopped"))
+        logger.info("Inference engine stopped")
+
+    async def predict(self, sentence: str) -> List[Dict[str, Any]]:
+        if not self.running:
+            raise RuntimeError("Inference engine is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((sentence, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        # Collected into self._batch, so stop() can fail what was taken
+        batch = self._batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            getter = asyncio.ensure_future(self._queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                # Not awaited: a cancelled get leaves its item in the queue,
+                # and awaiting it could swallow stop()'s cancellation
+                if not getter.cancel():
+                    # The item arrived just before the cancel
+                    batch.append(getter.result())
+                break
+            batch.append(getter.result())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Callers that went away (e.g. client disconnects) are dropped here
+            batch = self._batch = [(sentence, future) for sentence, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            sentences = [sentence for sentence, _ in batch]
+            classifier = self.classifier
+            try:
+                results = await loop.run_in_executor(
+                    self._executor,
+                    partial(classifier.predict_batch, sentences)
+                )
+            except Exception as e:
+                logger.error(f"Batched inference failed: {str(e)}", exc_info=True)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._batch = []
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self._batch = []
+
+def load_model_version(version: str) -> IntentClassifier:
+    # Loads a registered version and runs a warm-up inference so the first
+    # request after a swap doesn't pay for it. The NumPy backend keeps
+    # TensorFlow out of the serving process.
+    # Done by ELYES
+    path = model_registry.path(version)
+    words_path = os.path.join(path, WORDS_FILE)
+    classes_path = os.path.join(path, CLASSES_FILE)
+    if settings.MODEL_BACKEND == "keras":
+        classifier = load_keras_classifier(
+            os.path.join(path, MODEL_FILE),
+            words_path,
+            classes_path,
+            threshold=settings.INTENT_ERROR_THRESHOLD,
+            version=version
+        )
+    else:
+        classifier = load_numpy_classifier(
+            os.path.join(path, WEIGHTS_FILE),
+            words_path,
+            classes_path,
+            threshold=settings.INTENT_ERROR_THRESHOLD,
+            version=version
+        )
+
+    # Loads WordNet and fills the lemma cache before the first request
+    preprocessor.warm(classifier.vectorizer.words)
+    classifier.predict_batch(["hello"])
+    return classifier
+
+def load_serving_classifier() -> IntentClassifier:
+    # Done by ELYES
+    preprocessor.configure(settings.SENTENCE_CACHE_SIZE, settings.LEMMA_CACHE_SIZE)
+    version = model_registry.current()
+    if version is None:
+        # First start: the artifacts shipped with the repo become the initial
+        # version. Under the registry lock, so of the workers starting together
+        # one registers and activates them and the rest find it CURRENT.
+        with model_registry.locked():
+            version = model_registry.current()
+            if version is None:
+                manifest = model_registry.register({
+                    MODEL_FILE: settings.MODEL_PATH,
+                    WEIGHTS_FILE: settings.MODEL_WEIGHTS_PATH,
+                    WORDS_FILE: settings.WORDS_PATH,
+                    CLASSES_FILE: settings.CLASSES_PATH
+                }, source="bootstrap")
+                version = manifest["version"]
+                model_registry.set_current(version)
+    return load_model_version(version)
+
+# Done by ELYES
+model_registry = ModelRegistry(settings.MODEL_REGISTRY_DIR)
+
+# Done by ELYES
+inference_engine = InferenceEngine(
+    load_serving_classifier,
+    max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+    max_queue_size=settings.INFERENCE_MAX_QUEUE_SIZE
+)
+
+# Done by ELYES
+intent_catalog = IntentCatalogStore(
+    settings.INTENTS_PATH,
+    collection=mongodb.training_data,
+    fallback_tag=settings.INTENT_FALLBACK_TAG,
+    threshold=settings.INTENT_CONFIDENCE_THRESHOLD,
+    poll_interval=settings.INTENT_RELOAD_INTERVAL
+)
+
+# Done by ELYES
+model_manager = ModelManager(
+    model_registry,
+    inference_engine,
+    load_model_version,
+    poll_interval=settings.MODEL_REGISTRY_POLL_INTERVAL
+)
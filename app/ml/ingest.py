@@ -0,0 +1,180 @@
+"""
+Training data ingestion for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import codecs
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.logging import logger
+
+# Done by ELYES
+Reader = Callable[[int], Awaitable[bytes]]
+REQUIRED_FIELDS = ("intent", "patterns", "responses")
+
+async def iter_json_items(
+    read: Reader,
+    chunk_size: int = 1 << 16,
+    max_item_size: int = 1 << 20
+) -> AsyncIterator[Any]:
+    # Yields the items of a JSON array, or of newline-delimited JSON, while
+    # holding at most one item (plus a chunk) in memory. Raises ValueError for
+    # malformed input, including items larger than max_item_size.
+    # Done by ELYES
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer, pos, eof = "", 0, False
+
+    async def fill() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        chunk = await read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + text.decode(chunk, final=eof)
+        pos = 0
+        return True
+
+    async def peek() -> str:
+        # Next non-whitespace character, or "" at the end of the input
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not await fill():
+                return ""
+
+    async def decode() -> Any:
+        nonlocal pos
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof or len(buffer) - pos > max_item_size:
+                    raise ValueError(f"Invalid JSON at item {count + 1}: {e.msg}") from None
+                await fill()
+                continue
+            # A number or literal cut at the chunk boundary may continue
+            if end == len(buffer) and not eof and not isinstance(item, (dict, list, str)):
+                await fill()
+                continue
+            pos = end
+            return item
+
+    count = 0
+    array = await peek() == "["
+    if array:
+        pos += 1
+        if await peek() == "]":
+            pos += 1
+            array = None
+    while array is not None:
+        char = await peek()
+        if not char:
+            if array:
+                raise ValueError("Unexpected end of JSON array")
+            break
+        yield await decode()
+        count += 1
+        if array:
+            char = await peek()
+            pos += 1
+            if char == "]":
+                break
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' after item {count}")
+    if await peek():
+        raise ValueError("Unexpected data after JSON array")
+
+def validate_item(item: Any) -> Optional[str]:
+    # Done by ELYES
+    if not isinstance(item, dict) or not all(k in item for k in REQUIRED_FIELDS):
+        return f"missing one of {', '.join(REQUIRED_FIELDS)}"
+    if not isinstance(item["intent"], str) or not item["intent"]:
+        return "intent must be a non-empty string"
+    for field in ("patterns", "responses"):
+        value = item[field]
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            return f"{field} must be a list of strings"
+    return None
+
+class TrainingDataImporter:
+    # Two passes over a spooled upload: validate() reads every item so that
+    # nothing is written if any item is malformed, then write() streams the
+    # items again as ordered bulk upserts keyed on intent, batch_size at a time
+    # Done by ELYES
+    def __init__(self, collection, batch_size: int = 1000, max_errors: int = 100):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+
+    async def validate(self, read: Reader) -> Tuple[int, List[Dict[str, Any]]]:
+        count, errors = 0, []
+        async for item in iter_json_items(read):
+            error = validate_item(item)
+            if error is not None and len(errors) < self.max_errors:
+                errors.append({"item": count, "error": error})
+            count += 1
+        return count, errors
+
+    @staticmethod
+    def _upsert(item: Dict[str, Any], username: str, now: datetime) -> UpdateOne:
+        return UpdateOne(
+            {"intent": item["intent"]},
+            {
+                "$addToSet": {
+                    "patterns": {"$each": item["patterns"]},
+                    "responses": {"$each": item["responses"]}
+                },
+                "$set": {"updated_by": username, "updated_at": now},
+                "$setOnInsert": {"created_by": username, "created_at": now}
+            },
+            upsert=True
+        )
+
+    async def _write_batch(self, index: int, start: int, operations: List[UpdateOne]) -> Dict[str, Any]:
+        report = {"batch": index, "first_item": start, "items": len(operations)}
+        try:
+            result = await self.collection.bulk_write(operations, ordered=True)
+        except BulkWriteError as e:
+            details = e.details
+            error = details.get("writeErrors", [{}])[0]
+            report["error"] = error.get("errmsg", str(e))
+            report["failed_item"] = start + error.get("index", 0)
+            report["upserted"] = details.get("nUpserted", 0)
+            report["modified"] = details.get("nModified", 0)
+            logger.error(f"Training data batch {index} failed at item {report['failed_item']}: {report['error']}")
+        else:
+            report["upserted"] = result.upserted_count
+            report["modified"] = result.modified_count
+        return report
+
+    async def write(self, read: Reader, username: str) -> Dict[str, Any]:
+        now = datetime.now()
+        batches: List[Dict[str, Any]] = []
+        intents: Set[str] = set()
+        operations: List[UpdateOne] = []
+        count = 0
+        async for item in iter_json_items(read):
+            operations.append(self._upsert(item, username, now))
+            intents.add(item["intent"])
+            count += 1
+            if len(operations) == self.batch_size:
+                batches.append(await self._write_batch(len(batches), count - len(operations), operations))
+                operations = []
+        if operations:
+            batches.append(await self._write_batch(len(batches), count - len(operations), operations))
+        return {
+            "items": count,
+            "intents": sorted(intents),
+            "batches": batches,
+            "failed_batches": sum(1 for batch in batches if "error" in batch)
+        }
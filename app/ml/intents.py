@@ -0,0 +1,176 @@
+"""
+Intent catalog for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# A child of the app logger, not app.core.logging itself: the standalone CLI
+# loads the catalog without the server's settings or log pipeline
+# Done by ELYES
+logger = logging.getLogger("chatxpert.intents")
+
+# Done by ELYES
+class Intent(NamedTuple):
+    tag: str
+    patterns: Tuple[str, ...]
+    responses: Tuple[str, ...]
+
+def _unique(items: Iterable[str]) -> Tuple[str, ...]:
+    # Done by ELYES
+    return tuple(dict.fromkeys(items))
+
+class IntentCatalog:
+    # Immutable tag -> Intent index; a new catalog is built on every reload so
+    # concurrent readers never see a half-updated mapping
+    # Done by ELYES
+    def __init__(
+        self,
+        intents: Iterable[Intent],
+        fallback_tag: Optional[str] = None,
+        threshold: float = 0.0
+    ):
+        merged: Dict[str, Intent] = {}
+        for intent in intents:
+            existing = merged.get(intent.tag)
+            if existing:
+                intent = Intent(
+                    intent.tag,
+                    _unique(existing.patterns + intent.patterns),
+                    _unique(existing.responses + intent.responses)
+                )
+            merged[intent.tag] = intent
+        self.intents = MappingProxyType(merged)
+        self.fallback_tag = fallback_tag
+        self.threshold = threshold
+
+    @staticmethod
+    def parse(items: Iterable[Dict[str, Any]]) -> List[Intent]:
+        # Accepts both intents.json items ("tag") and training_data documents ("intent")
+        return [
+            Intent(
+                item.get("tag") or item["intent"],
+                tuple(item.get("patterns", ())),
+                tuple(item.get("responses", ()))
+            )
+            for item in items
+        ]
+
+    @classmethod
+    def from_json(cls, path: str, **kwargs) -> "IntentCatalog":
+        with open(path) as f:
+            return cls(cls.parse(json.load(f)["intents"]), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.intents)
+
+    def __contains__(self, tag: str) -> bool:
+        return tag in self.intents
+
+    def get(self, tag: str) -> Optional[Intent]:
+        return self.intents.get(tag)
+
+    def resolve(self, intents_list: List[Dict[str, Any]]) -> Optional[Intent]:
+        # Top-ranked intent, or the fallback intent when nothing clears the threshold
+        if intents_list and float(intents_list[0]["probability"]) >= self.threshold:
+            intent = self.intents.get(intents_list[0]["intent"])
+            if intent:
+                return intent
+        return self.intents.get(self.fallback_tag) if self.fallback_tag else None
+
+    def choose_response(self, intents_list: List[Dict[str, Any]]) -> Tuple[Optional[Intent], Optional[str]]:
+        intent = self.resolve(intents_list)
+        if intent is None or not intent.responses:
+            return intent, None
+        return intent, random.choice(intent.responses)
+
+class IntentCatalogStore:
+    # Builds the catalog from intents.json plus the training_data collection and
+    # rebuilds it whenever either source changes
+    # Done by ELYES
+    def __init__(
+        self,
+        path: str,
+        collection=None,
+        fallback_tag: Optional[str] = None,
+        threshold: float = 0.0,
+        poll_interval: float = 0
+    ):
+        self.path = path
+        self.collection = collection
+        self.fallback_tag = fallback_tag
+        self.threshold = threshold
+        self.poll_interval = poll_interval
+        self.catalog = IntentCatalog((), fallback_tag=fallback_tag, threshold=threshold)
+        self._signature = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _source_signature(self):
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self.collection is not None:
+            try:
+                latest = await self.collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+                # Bulk upserts change existing documents without adding new ones
+                updated = await self.collection.find_one(
+                    {"updated_at": {"$exists": True}},
+                    {"updated_at": 1},
+                    sort=[("updated_at", -1)]
+                )
+                count = await self.collection.estimated_document_count()
+                signature += (count, latest and latest["_id"], updated and updated["updated_at"])
+            except Exception as e:
+                logger.warning(f"Could not read training_data for intent catalog: {str(e)}")
+        return signature
+
+    async def _load_documents(self) -> List[Dict[str, Any]]:
+        if self.collection is None:
+            return []
+        try:
+            cursor = self.collection.find({}, {"intent": 1, "patterns": 1, "responses": 1})
+            return await cursor.to_list(length=None)
+        except Exception as e:
+            logger.warning(f"Could not load training_data for intent catalog: {str(e)}")
+            return []
+
+    async def reload(self, force: bool = False) -> bool:
+        signature = await self._source_signature()
+        if not force and signature == self._signature:
+            return False
+
+        with open(self.path) as f:
+            intents = IntentCatalog.parse(json.load(f)["intents"])
+        intents += IntentCatalog.parse(await self._load_documents())
+        self.catalog = IntentCatalog(intents, fallback_tag=self.fallback_tag, threshold=self.threshold)
+        self._signature = signature
+        logger.info(f"Intent catalog loaded with {len(self.catalog)} intents")
+        return True
+
+    async def start(self):
+        await self.reload(force=True)
+        if self.poll_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Intent catalog reload failed: {str(e)}")
@@ -0,0 +1,101 @@
+"""
+LLM client for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+
+from app.core.config import settings
+from app.core.logging import logger
+
+# Done by ELYES
+Messages = List[Dict[str, str]]
+
+class LLMClient(ABC):
+    # Interface for text generation backends; stream() yields text deltas
+    # Done by ELYES
+    @abstractmethod
+    def stream(self, messages: Messages) -> AsyncIterator[str]:
+        ...
+
+    async def complete(self, messages: Messages) -> str:
+        return "".join([delta async for delta in self.stream(messages)])
+
+    async def close(self):
+        pass
+
+class OpenAIChatClient(LLMClient):
+    # Streams chat completions from the OpenAI API
+    # Done by ELYES
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        max_tokens: int = 256,
+        temperature: float = 0.7,
+        timeout: float = 30.0
+    ):
+        from openai import AsyncOpenAI
+
+        self.client = AsyncOpenAI(api_key=api_key, timeout=timeout)
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    async def stream(self, messages: Messages) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def close(self):
+        await self.client.close()
+
+class StaticLLMClient(LLMClient):
+    # Replays a fixed reply word by word; stands in for the API in tests and
+    # local development
+    # Done by ELYES
+    def __init__(self, reply: str = "I'm not sure about that yet."):
+        self.reply = reply
+        self.calls: List[Messages] = []
+
+    async def stream(self, messages: Messages) -> AsyncIterator[str]:
+        self.calls.append(messages)
+        words = self.reply.split(" ")
+        for i, word in enumerate(words):
+            yield word if i == len(words) - 1 else word + " "
+
+def build_messages(message: str, history: Sequence[Dict[str, str]] = ()) -> Messages:
+    # Done by ELYES
+    return [
+        {"role": "system", "content": settings.LLM_SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": message},
+    ]
+
+def build_llm_client() -> Optional[LLMClient]:
+    # Done by ELYES
+    if not settings.LLM_ENABLED:
+        return None
+    try:
+        return OpenAIChatClient(
+            settings.OPENAI_API_KEY,
+            settings.OPENAI_MODEL,
+            max_tokens=settings.LLM_MAX_TOKENS,
+            temperature=settings.LLM_TEMPERATURE,
+            timeout=settings.LLM_TIMEOUT
+        )
+    except Exception as e:
+        logger.error(f"Could not create LLM client: {str(e)}")
+        return None
+
+# Done by ELYES
+llm_client = build_llm_client()
@@ -0,0 +1,117 @@
+"""
+NumPy forward pass for the ChatXpert intent model
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import struct
+import sys
+import zipfile
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Done by ELYES
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "softmax": None,
+}
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    # Done by ELYES
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+def export_keras_model(model, path: str) -> None:
+    # Write the Dense layers of a trained Keras model to an uncompressed .npz;
+    # Dropout only matters during training and is skipped
+    # Done by ELYES
+    arrays = {}
+    activations = []
+    for layer in model.layers:
+        if layer.__class__.__name__ != "Dense":
+            continue
+        kernel, bias = layer.get_weights()
+        i = len(activations)
+        arrays[f"kernel_{i}"] = kernel.astype(np.float32)
+        arrays[f"bias_{i}"] = bias.astype(np.float32)
+        activations.append(layer.get_config()["activation"])
+    np.savez(path, activations=np.array(activations), **arrays)
+
+def _mmap_npz(path: str) -> Dict[str, np.ndarray]:
+    # np.load ignores mmap_mode for .npz files, but members written by np.savez
+    # are stored uncompressed, so each one can be mapped at its data offset
+    # Done by ELYES
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} is compressed and cannot be memory-mapped")
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            arrays[info.filename[:-len(".npy")]] = np.memmap(
+                path,
+                dtype=dtype,
+                mode='r',
+                shape=shape,
+                offset=f.tell(),
+                order='F' if fortran_order else 'C'
+            )
+    return arrays
+
+class NumpyMLP:
+    # Drop-in replacement for the Keras model at inference time: exposes
+    # predict_on_batch so IntentClassifier can use either backend
+    # Done by ELYES
+    def __init__(self, layers: List[Tuple[np.ndarray, np.ndarray, str]]):
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {activation}")
+        self.layers = layers
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "NumpyMLP":
+        if mmap:
+            arrays = _mmap_npz(path)
+        else:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        activations = [str(a) for a in arrays["activations"]]
+        return cls([
+            (arrays[f"kernel_{i}"], arrays[f"bias_{i}"], activation)
+            for i, activation in enumerate(activations)
+        ])
+
+    @property
+    def input_size(self) -> int:
+        return self.layers[0][0].shape[0]
+
+    def _forward(self, x: np.ndarray, layers: List[Tuple[np.ndarray, np.ndarray, str]]) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        for kernel, bias, activation in layers:
+            x = x @ kernel + bias
+            x = _softmax(x) if activation == "softmax" else ACTIVATIONS[activation](x)
+        return x
+
+    def predict_on_batch(self, x: np.ndarray) -> np.ndarray:
+        return self._forward(x, self.layers)
+
+    def hidden_on_batch(self, x: np.ndarray) -> np.ndarray:
+        # Activations of the last hidden layer, a dense sentence embedding
+        return self._forward(x, self.layers[:-1])
+
+if __name__ == "__main__":
+    # Usage: python -m app.ml.numpy_model chatbotmodel.h5 chatbotmodel.npz
+    # Done by ELYES
+    from tensorflow.keras.models import load_model
+
+    source, target = sys.argv[1:3]
+    export_keras_model(load_model(source, compile=False), target)
+    print(f"Exported {source} to {target}")
@@ -0,0 +1,97 @@
+"""
+Prediction cache for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.cache import Cache, LRUCache
+from app.core.config import settings
+from app.ml.inference import inference_engine
+from app.ml.preprocessing import Preprocessor
+
+# Done by ELYES
+class PredictionCache:
+    # Two tiers in front of the classifier: an in-process LRU, then Redis via
+    # Cache. Keys include the model version, so deploying a new model never
+    # serves predictions made by the old one.
+    def __init__(
+        self,
+        version: Callable[[], Optional[str]],
+        maxsize: int = 1024,
+        ttl: int = 3600,
+        prefix: str = "prediction"
+    ):
+        self.version = version
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local = LRUCache(maxsize=maxsize)
+        self._local_version: Optional[str] = None
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+
+    def _redis_key(self, version: str, message: str) -> str:
+        digest = hashlib.sha1(message.encode()).hexdigest()
+        return f"{self.prefix}:{version}:{digest}"
+
+    async def get_or_compute(
+        self,
+        message: str,
+        compute: Callable[[str], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        version = self.version()
+        if version is None:
+            return await compute(message)
+        if version != self._local_version:
+            # A new model is live: everything cached locally is stale
+            self.local.clear()
+            self._local_version = version
+
+        normalized = Preprocessor.normalize(message)
+        result = self.local.get(normalized)
+        if result is not None:
+            self.local_hits += 1
+            return result
+
+        redis_key = self._redis_key(version, normalized)
+        result = await Cache.get(redis_key)
+        if result is not None:
+            self.remote_hits += 1
+            self.local.set(normalized, result)
+            return result
+
+        start_time = time.perf_counter()
+        result = await compute(message)
+        self.misses += 1
+        self.miss_seconds += time.perf_counter() - start_time
+
+        self.local.set(normalized, result)
+        await Cache.set(redis_key, result, ttl=self.ttl)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.local_hits + self.remote_hits
+        lookups = hits + self.misses
+        average_miss = self.miss_seconds / self.misses if self.misses else 0.0
+        return {
+            "model_version": self._local_version,
+            "local_hits": self.local_hits,
+            "remote_hits": self.remote_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "size": len(self.local),
+            # Estimated from the average cost of a miss
+            "latency_saved_seconds": hits * average_miss
+        }
+
+# Done by ELYES
+prediction_cache = PredictionCache(
+    lambda: inference_engine.model_version,
+    maxsize=settings.PREDICTION_CACHE_SIZE,
+    ttl=settings.PREDICTION_CACHE_TTL
+)
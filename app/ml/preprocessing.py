@@ -0,0 +1,81 @@
+"""
+Sentence preprocessing for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Done by ELYES
+SENTENCE_CACHE_SIZE = 4096
+LEMMA_CACHE_SIZE = 16384
+
+def _nltk_tokenize(sentence: str) -> List[str]:
+    # Done by ELYES
+    import nltk
+
+    return nltk.word_tokenize(sentence)
+
+class Preprocessor:
+    # Tokenize + lemmatize with two bounded LRU caches: normalized sentence ->
+    # token tuple, and word -> lemma. Chat traffic repeats the same short
+    # messages, so most calls never reach NLTK/WordNet.
+    # Done by ELYES
+    def __init__(
+        self,
+        sentence_cache_size: int = SENTENCE_CACHE_SIZE,
+        lemma_cache_size: int = LEMMA_CACHE_SIZE,
+        tokenizer: Callable[[str], List[str]] = _nltk_tokenize,
+        lemmatizer: Optional[Callable[[str], str]] = None
+    ):
+        self._word_tokenize = tokenizer
+        self._lemmatizer = lemmatizer
+        self.configure(sentence_cache_size, lemma_cache_size)
+
+    def configure(self, sentence_cache_size: int, lemma_cache_size: int):
+        # Rebuilds (and therefore empties) both caches with the new bounds
+        self._tokenize_cached = lru_cache(maxsize=sentence_cache_size)(self._tokenize_normalized)
+        self._lemmatize_cached = lru_cache(maxsize=lemma_cache_size)(self._lemmatize_word)
+
+    @staticmethod
+    def normalize(sentence: str) -> str:
+        return " ".join(sentence.lower().split())
+
+    def _lemmatize_word(self, word: str) -> str:
+        if self._lemmatizer is None:
+            from nltk.stem import WordNetLemmatizer
+
+            self._lemmatizer = WordNetLemmatizer().lemmatize
+        return self._lemmatizer(word)
+
+    def _tokenize_normalized(self, sentence: str) -> Tuple[str, ...]:
+        lemmatize = self._lemmatize_cached
+        return tuple(lemmatize(word) for word in self._word_tokenize(sentence))
+
+    def lemmatize(self, word: str) -> str:
+        return self._lemmatize_cached(word.lower())
+
+    def tokenize(self, sentence: str) -> Tuple[str, ...]:
+        return self._tokenize_cached(self.normalize(sentence))
+
+    def warm(self, words: Iterable[str]):
+        for word in words:
+            self.lemmatize(word)
+
+    def clear(self):
+        self._tokenize_cached.cache_clear()
+        self._lemmatize_cached.cache_clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: cache.cache_info()._asdict()
+            for name, cache in (("sentences", self._tokenize_cached), ("lemmas", self._lemmatize_cached))
+        }
+
+# Done by ELYES
+preprocessor = Preprocessor()
+
+def clean_up_sentence(sentence: str) -> Tuple[str, ...]:
+    # Done by ELYES
+    return preprocessor.tokenize(sentence)
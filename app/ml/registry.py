@@ -0,0 +1,280 @@
+"""
+Model registry for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers this process
+    fcntl = None
+
+from app.core.logging import logger
+from app.ml.training import CLASSES_FILE, MODEL_FILE, WEIGHTS_FILE, WORDS_FILE
+
+# Done by ELYES
+ARTIFACT_FILES = (WEIGHTS_FILE, WORDS_FILE, CLASSES_FILE, MODEL_FILE)
+REQUIRED_FILES = (WEIGHTS_FILE, WORDS_FILE, CLASSES_FILE)
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+
+def _write_atomic(path: str, content: str):
+    # Done by ELYES
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+class ModelRegistry:
+    # On-disk store of trained artifact sets:
+    #   <root>/versions/<version>/{artifacts, manifest.json}
+    #   <root>/CURRENT       active version, replaced atomically
+    #   <root>/history.json  activation history used for rollback
+    #   <root>/.lock         flock taken by every write, across workers
+    # Done by ELYES
+    def __init__(self, root: str):
+        self.root = root
+        self.versions_dir = os.path.join(root, "versions")
+        self._thread_lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+
+    @contextlib.contextmanager
+    def locked(self):
+        # Re-entrant within a process; flock itself is per open file, so the
+        # file is only opened and locked by the outermost holder
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                os.makedirs(self.root, exist_ok=True)
+                self._lock_file = open(os.path.join(self.root, LOCK_FILE), 'a')
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    # Closing the file releases the flock
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version)
+
+    def _read_json(self, path: str, default: Any) -> Any:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    @staticmethod
+    def content_hash(artifacts: Dict[str, str]) -> str:
+        digest = hashlib.sha256()
+        for name in sorted(artifacts):
+            digest.update(name.encode())
+            with open(artifacts[name], 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def manifest(self, version: str) -> Dict[str, Any]:
+        manifest = self._read_json(os.path.join(self.path(version), MANIFEST_FILE), None)
+        if manifest is None:
+            raise KeyError(version)
+        return manifest
+
+    def list_versions(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.versions_dir):
+            return []
+        manifests = []
+        for version in os.listdir(self.versions_dir):
+            try:
+                manifests.append(self.manifest(version))
+            except KeyError:
+                continue
+        return sorted(manifests, key=lambda m: m["created_at"], reverse=True)
+
+    def register(
+        self,
+        artifacts: Dict[str, str],
+        metrics: Optional[Dict[str, Any]] = None,
+        source: Optional[str] = None
+    ) -> Dict[str, Any]:
+        # artifacts maps registry file names (ARTIFACT_FILES) to source paths
+        missing = [name for name in REQUIRED_FILES if name not in artifacts]
+        if missing:
+            raise ValueError(f"Missing model artifacts: {', '.join(missing)}")
+
+        content_hash = self.content_hash(artifacts)
+        with self.locked():
+            for manifest in self.list_versions():
+                if manifest["sha256"] == content_hash:
+                    return manifest
+
+            created_at = datetime.utcnow()
+            version = f"{created_at:%Y%m%d%H%M%S}-{content_hash[:8]}"
+            manifest = {
+                "version": version,
+                "sha256": content_hash,
+                "created_at": created_at.isoformat(),
+                "files": sorted(artifacts),
+                "metrics": metrics or {},
+                "source": source
+            }
+
+            # Copy into a temporary directory first so a version never appears half-written
+            os.makedirs(self.versions_dir, exist_ok=True)
+            staging = tempfile.mkdtemp(dir=self.versions_dir, prefix=".staging-")
+            for name, src in artifacts.items():
+                shutil.copyfile(src, os.path.join(staging, name))
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            try:
+                os.rename(staging, self.path(version))
+            except OSError:
+                # Another worker registered the same artifacts in the same second
+                shutil.rmtree(staging, ignore_errors=True)
+                return self.manifest(version)
+            logger.info(f"Registered model version {version}")
+            return manifest
+
+    def register_directory(self, directory: str, **kwargs) -> Dict[str, Any]:
+        artifacts = {
+            name: os.path.join(directory, name)
+            for name in ARTIFACT_FILES
+            if os.path.exists(os.path.join(directory, name))
+        }
+        return self.register(artifacts, **kwargs)
+
+    def current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def history(self) -> List[str]:
+        return self._read_json(os.path.join(self.root, "history.json"), [])
+
+    def set_current(self, version: str):
+        self.manifest(version)
+        with self.locked():
+            history = self.history()
+            if not history or history[-1] != version:
+                history.append(version)
+            _write_atomic(os.path.join(self.root, "history.json"), json.dumps(history))
+            _write_atomic(os.path.join(self.root, "CURRENT"), version)
+
+    def previous(self) -> str:
+        # The version that was active before the current one
+        history = self.history()
+        if len(history) < 2:
+            raise ValueError("No previous model version to roll back to")
+        return history[-2]
+
+    def rollback(self, version: Optional[str] = None) -> str:
+        # Re-activates the previous version; version, when given, is the one
+        # the caller loaded, and must still be the previous one
+        with self.locked():
+            history = self.history()
+            if len(history) < 2:
+                raise ValueError("No previous model version to roll back to")
+            if version is not None and history[-2] != version:
+                raise ValueError("Model history changed during rollback")
+            history.pop()
+            version = history[-1]
+            _write_atomic(os.path.join(self.root, "history.json"), json.dumps(history))
+            _write_atomic(os.path.join(self.root, "CURRENT"), version)
+        return version
+
+class ModelManager:
+    # Keeps a serving engine on the registry's CURRENT version. New versions
+    # are loaded and warmed up off the event loop, then swapped in atomically;
+    # batches already running finish on the classifier they started with.
+    # Done by ELYES
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        engine,
+        loader: Callable[[str], Any],
+        poll_interval: float = 0
+    ):
+        self.registry = registry
+        self.engine = engine
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _load(self, version: str):
+        self.registry.manifest(version)
+        return await asyncio.get_running_loop().run_in_executor(None, self.loader, version)
+
+    async def activate(self, version: str) -> str:
+        async with self.lock:
+            classifier = await self._load(version)
+            self.engine.swap(classifier)
+            if self.registry.current() != version:
+                self.registry.set_current(version)
+            logger.info(f"Serving model version {version}")
+            return version
+
+    async def rollback(self) -> str:
+        # CURRENT and the history only move once the target is loaded and
+        # warmed up, so a version that fails to load leaves them as they were
+        async with self.lock:
+            version = self.registry.previous()
+            classifier = await self._load(version)
+            self.registry.rollback(version)
+            self.engine.swap(classifier)
+            logger.info(f"Serving model version {version}")
+            return version
+
+    async def sync(self) -> bool:
+        # Follows CURRENT when another worker activated or rolled back a version
+        version = self.registry.current()
+        if version is None or version == self.engine.model_version:
+            return False
+        await self.activate(version)
+        return True
+
+    async def start(self):
+        if self.poll_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Model registry sync failed: {str(e)}")
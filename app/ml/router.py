@@ -0,0 +1,198 @@
+"""
+Response routing for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import pipeline_stage_seconds
+from app.core.profiling import record_stage
+from app.core.session_context import Turn, as_messages
+from app.ml.inference import inference_engine, intent_catalog
+from app.ml.intents import IntentCatalogStore
+from app.ml.llm import LLMClient, build_messages, llm_client
+from app.ml.prediction_cache import PredictionCache, prediction_cache
+from app.ml.semantic_cache import SemanticCache, semantic_cache
+
+# Done by ELYES
+FALLBACK_RESPONSE = "Sorry, I didn't understand that. Could you rephrase?"
+LOCAL, LLM, CACHED, FALLBACK = "local", "llm", "cache", "fallback"
+RESPONSE_SELECTION = pipeline_stage_seconds.labels("response_selection")
+LLM_GENERATION = pipeline_stage_seconds.labels("llm")
+
+class RoutedReply(NamedTuple):
+    # Done by ELYES
+    message: str
+    confidence: float
+    intent: Optional[str]
+    source: str
+
+class ResponseRouter:
+    # Answers from intents.json when the local classifier is confident enough,
+    # and only escalates low-confidence or unknown messages to the LLM. Without
+    # an LLM client those get the catalog's fallback intent instead. LLM
+    # answers go through the semantic cache, so a reworded question is not
+    # paid for twice. The conversation so far breaks near-ties between intents
+    # and is sent to the LLM with the message.
+    # Done by ELYES
+    def __init__(
+        self,
+        catalog: IntentCatalogStore,
+        predict: Callable[[str], Awaitable[List[Dict[str, Any]]]],
+        cache: Optional[PredictionCache] = None,
+        llm: Optional[LLMClient] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        threshold: float = 0.7,
+        context_margin: float = 0.15,
+        fallback_response: str = FALLBACK_RESPONSE
+    ):
+        self.catalog = catalog
+        self.predict = predict
+        self.cache = cache
+        self.llm = llm
+        self.semantic_cache = semantic_cache
+        self.threshold = threshold
+        self.context_margin = context_margin
+        self.fallback_response = fallback_response
+        self.counts = {LOCAL: 0, LLM: 0, CACHED: 0, FALLBACK: 0}
+        self.seconds = {source: 0.0 for source in self.counts}
+        self.max_seconds = {source: 0.0 for source in self.counts}
+
+    def _disambiguate(self, intents: List[Dict[str, Any]], context: Sequence[Turn]) -> List[Dict[str, Any]]:
+        # A follow-up scoring within context_margin of the top intent for the
+        # intent the conversation is already on stays on that intent
+        fallback_tag = self.catalog.catalog.fallback_tag
+        last = next((t.intent for t in reversed(context) if t.intent and t.intent != fallback_tag), None)
+        if last is None or not intents or intents[0]["intent"] == last:
+            return intents
+        for i, candidate in enumerate(intents[1:], 1):
+            if intents[0]["probability"] - candidate["probability"] > self.context_margin:
+                break
+            if candidate["intent"] == last:
+                # A new list: the cached one is shared
+                return [candidate] + intents[:i] + intents[i + 1:]
+        return intents
+
+    async def classify(
+        self,
+        message: str,
+        context: Sequence[Turn] = ()
+    ) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str], float]:
+        # (ranked intents, tag, local response, confidence); response is None
+        # when the message should go to the LLM
+        start_time = time.perf_counter()
+        if self.cache is not None:
+            intents = await self.cache.get_or_compute(message, self.predict)
+        else:
+            intents = await self.predict(message)
+        # Cache lookup plus, on a miss, the wait for the batched inference
+        predicted = time.perf_counter()
+        record_stage("predict", predicted - start_time)
+        intents = self._disambiguate(intents, context)
+        confidence = intents[0]["probability"] if intents else 0.0
+        intent, response = self.catalog.catalog.choose_response(intents)
+        elapsed = time.perf_counter() - predicted
+        RESPONSE_SELECTION.observe(elapsed)
+        record_stage("response_selection", elapsed)
+        if response is not None:
+            confident = confidence >= self.threshold and intent.tag != self.catalog.catalog.fallback_tag
+            if confident or self.llm is None:
+                return intents, intent.tag, response, confidence
+        return intents, None, None, confidence
+
+    def _record(self, source: str, start_time: float):
+        elapsed = time.perf_counter() - start_time
+        self.counts[source] += 1
+        self.seconds[source] += elapsed
+        self.max_seconds[source] = max(self.max_seconds[source], elapsed)
+
+    def _source(self, tag: Optional[str]) -> str:
+        return LOCAL if tag is not None and tag != self.catalog.catalog.fallback_tag else FALLBACK
+
+    async def stream(
+        self,
+        message: str,
+        context: Sequence[Turn] = ()
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        # intent event, then token events, then done with the full reply
+        start_time = time.perf_counter()
+        _, tag, response, confidence = await self.classify(message, context)
+        # An answer given with earlier turns in the prompt may depend on them,
+        # so only context-free answers go through the semantic cache
+        semantic_cache = self.semantic_cache if not context else None
+        if response is None and self.llm is None:
+            response = self.fallback_response
+            source = FALLBACK
+        elif response is None and semantic_cache is not None:
+            lookup_start = time.perf_counter()
+            response = await semantic_cache.get(message)
+            record_stage("semantic_cache", time.perf_counter() - lookup_start)
+            source = CACHED if response is not None else LLM
+        else:
+            source = self._source(tag) if response is not None else LLM
+        yield "intent", {"intent": tag, "confidence": confidence, "source": source}
+
+        if response is None:
+            parts = []
+            llm_start = time.perf_counter()
+            try:
+                async for delta in self.llm.stream(build_messages(message, as_messages(context))):
+                    parts.append(delta)
+                    yield "token", {"text": delta}
+            except Exception as e:
+                logger.error(f"LLM fallback failed: {str(e)}", exc_info=True)
+                if parts:
+                    raise
+                source = FALLBACK
+                response = self.fallback_response
+                yield "token", {"text": response}
+            else:
+                elapsed = time.perf_counter() - llm_start
+                LLM_GENERATION.observe(elapsed)
+                record_stage("llm", elapsed)
+                response = "".join(parts)
+                if semantic_cache is not None:
+                    await semantic_cache.set(message, response)
+        else:
+            yield "token", {"text": response}
+
+        self._record(source, start_time)
+        yield "done", RoutedReply(response, confidence, tag, source)._asdict()
+
+    async def reply(self, message: str, context: Sequence[Turn] = ()) -> RoutedReply:
+        done = None
+        async for event, data in self.stream(message, context):
+            if event == "done":
+                done = data
+        return RoutedReply(**done)
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.counts.values())
+        return {
+            "threshold": self.threshold,
+            "llm_enabled": self.llm is not None,
+            "counts": dict(self.counts),
+            "local_ratio": self.counts[LOCAL] / total if total else 0.0,
+            "llm_ratio": self.counts[LLM] / total if total else 0.0,
+            "cache_ratio": self.counts[CACHED] / total if total else 0.0,
+            "average_seconds": {
+                source: self.seconds[source] / count if count else 0.0
+                for source, count in self.counts.items()
+            },
+            "max_seconds": dict(self.max_seconds)
+        }
+
+# Done by ELYES
+response_router = ResponseRouter(
+    intent_catalog,
+    inference_engine.predict,
+    cache=prediction_cache,
+    llm=llm_client,
+    semantic_cache=semantic_cache,
+    threshold=settings.ROUTER_CONFIDENCE_THRESHOLD,
+    context_margin=settings.ROUTER_CONTEXT_MARGIN
+)
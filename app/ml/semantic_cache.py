@@ -0,0 +1,333 @@
+"""
+Semantic response cache for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.logging import logger
+from app.ml.classifier import IntentClassifier
+from app.ml.inference import inference_engine
+from app.ml.preprocessing import Preprocessor
+
+# Done by ELYES
+# Entries re-embedded per executor call when the model changes, so the
+# predictions sharing that executor are not held up for the whole rebuild
+REINDEX_CHUNK = 256
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    # Rows scaled to unit length; all-zero rows stay zero
+    # Done by ELYES
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+# Done by ELYES
+class SemanticIndex:
+    # Fixed-capacity nearest-neighbour index over unit vectors. A lookup is one
+    # matrix-vector product; expired rows never match, and a full index
+    # replaces an expired row first, then the least recently used one.
+    def __init__(self, dim: int, maxsize: int = 1024):
+        self.dim = dim
+        self.vectors = np.zeros((maxsize, dim), dtype=np.float32)
+        # Wall-clock expiry, so entries shared through Redis agree across
+        # workers; empty rows are permanently expired
+        self.expires_at = np.full(maxsize, -np.inf)
+        self.last_used = np.zeros(maxsize, dtype=np.int64)
+        self.keys: List[Optional[str]] = [None] * maxsize
+        self.values: List[Any] = [None] * maxsize
+        self.slots: Dict[str, int] = {}
+        self._clock = 0
+
+    def __len__(self) -> int:
+        return int((self.expires_at > time.time()).sum())
+
+    def __contains__(self, key: str) -> bool:
+        i = self.slots.get(key)
+        return i is not None and self.expires_at[i] > time.time()
+
+    def _touch(self, i: int):
+        self._clock += 1
+        self.last_used[i] = self._clock
+
+    def search(self, vector: np.ndarray) -> Optional[Tuple[str, Any, float]]:
+        # (key, value, cosine similarity) of the closest live entry
+        similarities = self.vectors @ vector
+        similarities[self.expires_at <= time.time()] = -np.inf
+        i = int(np.argmax(similarities))
+        if similarities[i] == -np.inf:
+            return None
+        self._touch(i)
+        return self.keys[i], self.values[i], float(similarities[i])
+
+    def add(self, key: str, vector: np.ndarray, value: Any, expires_at: float):
+        i = self.slots.get(key)
+        if i is None:
+            expired = self.expires_at <= time.time()
+            i = int(np.argmax(expired)) if expired.any() else int(np.argmin(self.last_used))
+            if self.keys[i] is not None:
+                del self.slots[self.keys[i]]
+            self.keys[i] = key
+            self.slots[key] = i
+        self.vectors[i] = vector
+        self.values[i] = value
+        self.expires_at[i] = expires_at
+        self._touch(i)
+
+    def items(self) -> List[Tuple[str, Any, float]]:
+        # (key, value, expires_at) of the live entries
+        now = time.time()
+        return [
+            (self.keys[i], self.values[i], float(self.expires_at[i]))
+            for i in self.slots.values()
+            if self.expires_at[i] > now
+        ]
+
+# Done by ELYES
+class SemanticCache:
+    # Answers from the LLM, looked up by meaning rather than exact text:
+    # messages are embedded with the serving classifier (bag of words, or its
+    # last hidden layer) and a stored answer is reused when its message is
+    # within the cosine similarity threshold. Entries are kept in a Redis hash
+    # as message text, so every worker loads the same set and re-embeds it
+    # whenever the model, and with it the vector space, changes. Embedding and
+    # every index access run in executor (the inference thread), never on the
+    # event loop, and lookups are skipped while a new model's index is built.
+    def __init__(
+        self,
+        classifier: Callable[[], Optional[IntentClassifier]],
+        redis=None,
+        maxsize: int = 4096,
+        ttl: int = 86400,
+        threshold: float = 0.9,
+        hidden: bool = True,
+        oov_buckets: int = 1024,
+        sync_interval: float = 0,
+        key: str = "semantic_cache",
+        executor=None,
+        enabled: bool = True
+    ):
+        self.enabled = enabled
+        self.classifier = classifier
+        self.redis = redis
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hidden = hidden
+        self.oov_buckets = oov_buckets
+        self.sync_interval = sync_interval
+        self.key = key
+        self.executor = executor
+        self.index: Optional[SemanticIndex] = None
+        self._version: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._rebuild: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _entry_key(message: str) -> str:
+        return hashlib.sha1(Preprocessor.normalize(message).encode()).hexdigest()
+
+    def _embed(self, classifier: IntentClassifier, messages: Sequence[str]) -> np.ndarray:
+        known = _unit(classifier.embed_batch(messages, hidden=self.hidden))
+        if not self.oov_buckets:
+            return known
+        # The model only sees its own vocabulary, so "what is love" and "what
+        # is life" would embed identically; words outside it are hashed into a
+        # second half that has to match as well
+        vectorizer = classifier.vectorizer
+        unknown = np.zeros((len(messages), self.oov_buckets), dtype=np.float32)
+        for row, message in enumerate(messages):
+            for token in vectorizer.tokenizer(message):
+                if token not in vectorizer.index:
+                    unknown[row, zlib.crc32(token.encode()) % self.oov_buckets] = 1
+        # Messages without a single word stay all-zero and never match
+        return _unit(np.hstack([known, _unit(unknown)]))
+
+    async def _in_executor(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _add(
+        self,
+        classifier: IntentClassifier,
+        index: SemanticIndex,
+        entries: Sequence[Tuple[str, str, str, float]]
+    ):
+        # entries: (key, message, answer, expires_at)
+        if not entries:
+            return
+        vectors = self._embed(classifier, [message for _, message, _, _ in entries])
+        for (key, message, answer, expires_at), vector in zip(entries, vectors):
+            if vector.any():
+                index.add(key, vector, (message, answer), expires_at)
+
+    def _search(self, classifier: IntentClassifier, index: SemanticIndex, message: str):
+        vector = self._embed(classifier, [message])[0]
+        return index.search(vector) if vector.any() else None
+
+    async def _reindex(self, classifier: IntentClassifier):
+        # A new model means a new vector space: re-embed what we have into a
+        # new index, which replaces the old one once it is complete
+        try:
+            previous = await self._in_executor(self.index.items) if self.index is not None else []
+            entries = [
+                (key, message, answer, expires_at)
+                for key, (message, answer), expires_at in previous
+            ]
+            dim = (await self._in_executor(self._embed, classifier, [""])).shape[1]
+            index = SemanticIndex(dim, maxsize=self.maxsize)
+            for start in range(0, len(entries), REINDEX_CHUNK):
+                await self._in_executor(self._add, classifier, index, entries[start:start + REINDEX_CHUNK])
+            self.index = index
+            self._version = classifier.version
+        except Exception as e:
+            logger.error(f"Semantic cache rebuild error: {str(e)}")
+        finally:
+            self._rebuild = None
+
+    def _current_index(self) -> Optional[Tuple[IntentClassifier, SemanticIndex]]:
+        # None while there is no model, or the index for it is being built
+        classifier = self.classifier()
+        if classifier is None:
+            return None
+        if self.index is None or classifier.version != self._version:
+            if self._rebuild is None:
+                self._rebuild = asyncio.create_task(self._reindex(classifier))
+            return None
+        return classifier, self.index
+
+    async def get(self, message: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        current = self._current_index()
+        if current is None:
+            return None
+        # Embedding and the search over the whole index are one executor hop
+        match = await self._in_executor(self._search, *current, message)
+        if match is None or match[2] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return match[1][1]
+
+    async def set(self, message: str, answer: str):
+        if not self.enabled:
+            return
+        key = self._entry_key(message)
+        expires_at = time.time() + self.ttl
+        current = self._current_index()
+        if current is not None:
+            await self._in_executor(self._add, *current, [(key, message, answer, expires_at)])
+        # Stored even while the index is being rebuilt; the next sync adds it
+        if self.redis is None:
+            return
+        try:
+            await self.redis.hset(self.key, key, json.dumps({
+                "message": message,
+                "answer": answer,
+                "expires_at": expires_at
+            }))
+            await self.redis.expire(self.key, self.ttl)
+        except Exception as e:
+            logger.error(f"Semantic cache set error: {str(e)}")
+
+    async def sync(self) -> int:
+        # Pulls entries other workers stored and drops expired ones from Redis;
+        # returns the number of entries added
+        if not self.enabled:
+            return 0
+        current = self._current_index()
+        if current is None and self._rebuild is not None:
+            # Off the request path, so wait for the new index instead
+            await asyncio.shield(self._rebuild)
+            current = self._current_index()
+        if current is None or self.redis is None:
+            return 0
+        classifier, index = current
+        try:
+            stored = await self.redis.hgetall(self.key)
+        except Exception as e:
+            logger.error(f"Semantic cache sync error: {str(e)}")
+            return 0
+
+        now = time.time()
+        expired, entries = [], []
+        for key, data in stored.items():
+            key = key.decode() if isinstance(key, bytes) else key
+            entry = json.loads(data)
+            if entry["expires_at"] <= now:
+                expired.append(key)
+            elif key not in index:
+                entries.append((key, entry["message"], entry["answer"], entry["expires_at"]))
+        # More than fit: keep the freshest
+        entries = sorted(entries, key=lambda entry: entry[3])[-self.maxsize:]
+        await self._in_executor(self._add, classifier, index, entries)
+
+        if expired:
+            try:
+                await self.redis.hdel(self.key, *expired)
+            except Exception as e:
+                logger.error(f"Semantic cache prune error: {str(e)}")
+        return len(entries)
+
+    async def start(self):
+        if not self.enabled:
+            return
+        await self.sync()
+        if self.sync_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        for task in (self._task, self._rebuild):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Semantic cache sync failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self.index) if self.index is not None else 0,
+            "threshold": self.threshold,
+            "embedding": "hidden" if self.hidden else "bag_of_words"
+        }
+
+# Done by ELYES
+semantic_cache = SemanticCache(
+    lambda: inference_engine.classifier,
+    redis=redis_client,
+    maxsize=settings.SEMANTIC_CACHE_SIZE,
+    ttl=settings.SEMANTIC_CACHE_TTL,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    hidden=settings.SEMANTIC_CACHE_EMBEDDING == "hidden",
+    oov_buckets=settings.SEMANTIC_CACHE_OOV_BUCKETS,
+    sync_interval=settings.SEMANTIC_CACHE_SYNC_INTERVAL,
+    executor=inference_engine.executor,
+    enabled=settings.SEMANTIC_CACHE_ENABLED
+)
@@ -0,0 +1,286 @@
+"""
+Intent model training for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import os
+import pickle
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.ml.dataset import Dataset, DatasetBuilder
+from app.ml.numpy_model import export_keras_model
+from app.ml.preprocessing import preprocessor
+
+# Done by ELYES
+SPARSE_VOCABULARY_SIZE = 20000
+MODEL_FILE = "chatbotmodel.h5"
+WEIGHTS_FILE = "chatbotmodel.npz"
+WORDS_FILE = "words.pkl"
+CLASSES_FILE = "classes.pkl"
+
+class TrainingCancelled(Exception):
+    # Done by ELYES
+    pass
+
+def build_training_data(intents: Iterable[Dict[str, Any]]) -> Dataset:
+    # Dense uint8 features, or CSR once the vocabulary gets large
+    # Done by ELYES
+    builder = DatasetBuilder(tokenizer=preprocessor.tokenize).add_intents(intents)
+    return builder.build(sparse=builder.vocabulary_size >= SPARSE_VOCABULARY_SIZE)
+
+def build_model(input_size: int, output_size: int):
+    # Done by ELYES
+    from tensorflow.keras.layers import Dense, Dropout, Input
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.optimizers import SGD
+
+    model = Sequential([
+        Input(shape=(input_size,)),
+        Dense(128, activation='relu'),
+        Dropout(0.5),
+        Dense(64, activation='relu'),
+        Dropout(0.5),
+        Dense(output_size, activation='softmax'),
+    ])
+    sgd = SGD(learning_rate=0.01, momentum=0.9, nesterov=True)
+    model.compile(loss='categorical_crossentropy', optimizer=sgd, metrics=['accuracy'])
+    return model
+
+def fit_model(
+    model,
+    train_x,
+    train_y: np.ndarray,
+    epochs: int = 200,
+    batch_size: int = 5,
+    on_epoch: Optional[Callable[[int, int, Dict[str, float]], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    verbose: int = 0
+) -> Dict[str, float]:
+    # Trains in place; raises TrainingCancelled if should_stop() fires
+    # Done by ELYES
+    from tensorflow.keras.callbacks import Callback
+
+    class Progress(Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            if on_epoch:
+                on_epoch(epoch + 1, epochs, {k: float(v) for k, v in (logs or {}).items()})
+            if should_stop and should_stop():
+                self.model.stop_training = True
+
+    history = model.fit(
+        train_x,
+        train_y,
+        epochs=epochs,
+        shuffle=True,
+        batch_size=batch_size,
+        verbose=verbose,
+        callbacks=[Progress()]
+    )
+    if should_stop and should_stop():
+        raise TrainingCancelled()
+    return {name: float(values[-1]) for name, values in history.history.items()}
+
+def widen_model(
+    model,
+    old_words: List[str],
+    words: List[str],
+    old_classes: List[str],
+    classes: List[str]
+):
+    # Returns a fresh model sized for words/classes that keeps every learned
+    # weight: input rows and output columns are moved to the new positions of
+    # their word/class, new input rows start at zero and new classes keep the
+    # initializer's weights
+    # Done by ELYES
+    from tensorflow.keras.layers import Dense
+
+    widened = build_model(len(words), len(classes))
+    old_layers = [layer for layer in model.layers if isinstance(layer, Dense)]
+    new_layers = [layer for layer in widened.layers if isinstance(layer, Dense)]
+    if [l.units for l in old_layers[:-1]] != [l.units for l in new_layers[:-1]]:
+        raise ValueError("Base model architecture does not match build_model()")
+
+    word_index = {word: i for i, word in enumerate(words)}
+    class_index = {tag: i for i, tag in enumerate(classes)}
+    rows = np.array([word_index[word] for word in old_words], dtype=np.intp)
+    columns = np.array([class_index[tag] for tag in old_classes], dtype=np.intp)
+
+    for position, (old, new) in enumerate(zip(old_layers, new_layers)):
+        kernel, bias = old.get_weights()
+        if position == 0:
+            new_kernel = np.zeros(new.kernel.shape, dtype=kernel.dtype)
+            new_kernel[rows] = kernel
+            kernel = new_kernel
+        if position == len(old_layers) - 1:
+            new_kernel, new_bias = new.get_weights()
+            new_kernel[:, columns] = kernel
+            new_bias[columns] = bias
+            kernel, bias = new_kernel, new_bias
+        new.set_weights([kernel, bias])
+    return widened
+
+def save_artifacts(model, words: List[str], classes: List[str], output_dir: str):
+    # Done by ELYES
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, WORDS_FILE), 'wb') as f:
+        pickle.dump(words, f)
+    with open(os.path.join(output_dir, CLASSES_FILE), 'wb') as f:
+        pickle.dump(classes, f)
+    model.save(os.path.join(output_dir, MODEL_FILE))
+    export_keras_model(model, os.path.join(output_dir, WEIGHTS_FILE))
+
+def train_intents(
+    intents: Iterable[Dict[str, Any]],
+    output_dir: str,
+    epochs: int = 200,
+    batch_size: int = 5,
+    on_epoch: Optional[Callable[[int, int, Dict[str, float]], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    verbose: int = 0
+) -> Dict[str, Any]:
+    # Full training run: vectorize, train, write words/classes/model artifacts
+    # Done by ELYES
+    dataset = build_training_data(intents)
+    if not len(dataset):
+        raise ValueError("No training patterns found")
+
+    model = build_model(len(dataset.words), len(dataset.classes))
+    metrics = fit_model(
+        model,
+        dataset.features,
+        dataset.one_hot(),
+        epochs,
+        batch_size,
+        on_epoch,
+        should_stop,
+        verbose
+    )
+    save_artifacts(model, dataset.words, dataset.classes, output_dir)
+    return {
+        **metrics,
+        "mode": "full",
+        "patterns": len(dataset),
+        "words": len(dataset.words),
+        "classes": len(dataset.classes),
+        "output_dir": output_dir
+    }
+
+def fine_tune_intents(
+    base_dir: str,
+    intents: Iterable[Dict[str, Any]],
+    changed_tags: Iterable[str],
+    output_dir: str,
+    epochs: int = 30,
+    batch_size: int = 5,
+    replay_ratio: float = 1.0,
+    on_epoch: Optional[Callable[[int, int, Dict[str, float]], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    verbose: int = 0,
+    seed: Optional[int] = None
+) -> Dict[str, Any]:
+    # Incremental run on top of the artifacts in base_dir: only the patterns of
+    # changed_tags are tokenized to extend the vocabulary and class index, the
+    # base model is widened to match, and it is fine-tuned on those patterns
+    # plus replay_ratio times as many sampled from the unchanged intents
+    # Done by ELYES
+    from tensorflow.keras.models import load_model
+
+    with open(os.path.join(base_dir, WORDS_FILE), 'rb') as f:
+        old_words = pickle.load(f)
+    with open(os.path.join(base_dir, CLASSES_FILE), 'rb') as f:
+        old_classes = pickle.load(f)
+
+    changed_tags = set(changed_tags)
+    changed, unchanged = [], []
+    for intent in intents:
+        tag = intent.get("tag") or intent["intent"]
+        target = changed if tag in changed_tags else unchanged
+        target.extend((tag, pattern) for pattern in intent["patterns"])
+    if not changed:
+        raise ValueError("No training patterns found for the changed intents")
+
+    delta = DatasetBuilder(tokenizer=preprocessor.tokenize)
+    for tag, pattern in changed:
+        delta.add(tag, pattern)
+    delta = delta.build()
+    words = sorted(set(old_words).union(delta.words))
+    classes = sorted(set(old_classes).union(delta.classes))
+
+    rng = np.random.default_rng(seed)
+    replay_size = min(len(unchanged), int(round(len(changed) * replay_ratio)))
+    replay = rng.choice(len(unchanged), replay_size, replace=False) if replay_size else ()
+
+    builder = DatasetBuilder(tokenizer=preprocessor.tokenize, words=words, classes=classes)
+    for tag, pattern in changed:
+        builder.add(tag, pattern)
+    for i in replay:
+        builder.add(*unchanged[i])
+    dataset = builder.build(sparse=len(words) >= SPARSE_VOCABULARY_SIZE)
+
+    base_model = load_model(os.path.join(base_dir, MODEL_FILE), compile=False)
+    model = widen_model(base_model, old_words, words, old_classes, classes)
+    metrics = fit_model(
+        model,
+        dataset.features,
+        dataset.one_hot(),
+        epochs,
+        batch_size,
+        on_epoch,
+        should_stop,
+        verbose
+    )
+    save_artifacts(model, words, classes, output_dir)
+    return {
+        **metrics,
+        "mode": "incremental",
+        "patterns": len(dataset),
+        "changed_patterns": len(changed),
+        "replayed_patterns": replay_size,
+        "new_words": len(words) - len(old_words),
+        "new_classes": len(classes) - len(old_classes),
+        "words": len(words),
+        "classes": len(classes),
+        "output_dir": output_dir
+    }
+
+def run_training_job(
+    intents: List[Dict[str, Any]],
+    output_dir: str,
+    epochs: int,
+    batch_size: int,
+    progress,
+    cancel_event,
+    base_dir: Optional[str] = None,
+    changed_tags: Optional[List[str]] = None,
+    replay_ratio: float = 1.0
+) -> Dict[str, Any]:
+    # Entry point for training worker processes: epoch metrics go to the
+    # progress queue and cancel_event stops training after the current epoch.
+    # With base_dir and changed_tags the run fine-tunes that model instead.
+    # Done by ELYES
+    def on_epoch(epoch: int, total: int, logs: Dict[str, float]):
+        progress.put({"epoch": epoch, "epochs": total, **logs})
+
+    if base_dir is not None and changed_tags:
+        return fine_tune_intents(
+            base_dir,
+            intents,
+            changed_tags,
+            output_dir,
+            epochs=epochs,
+            batch_size=batch_size,
+            replay_ratio=replay_ratio,
+            on_epoch=on_epoch,
+            should_stop=cancel_event.is_set
+        )
+    return train_intents(
+        intents,
+        output_dir,
+        epochs=epochs,
+        batch_size=batch_size,
+        on_epoch=on_epoch,
+        should_stop=cancel_event.is_set
+    )
@@ -0,0 +1,441 @@
+"""
+Background training jobs for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.core.database import mongodb
+from app.core.logging import logger
+from app.core.metrics import training_job_seconds
+from app.ml.inference import intent_catalog, model_manager, model_registry
+from app.ml.intents import IntentCatalogStore
+from app.ml.registry import ModelManager, ModelRegistry
+from app.ml.training import MODEL_FILE, TrainingCancelled, run_training_job
+
+# Done by ELYES
+# The scheduler collection document holding the ids of the jobs with a slot
+SCHEDULER_ID = "slots"
+
+# Done by ELYES
+class TrainingRunner:
+    # Runs training jobs in a process pool so the event loop never blocks, and
+    # mirrors their progress into the training_jobs collection. The collection
+    # is also the queue every API worker shares: a worker claims a queued job
+    # with find_one_and_update, takes one of max_concurrent_jobs slots kept in
+    # the scheduler collection, heartbeats while it trains and stops when the job
+    # document asks for cancellation, whichever worker took the request.
+    def __init__(
+        self,
+        jobs_collection,
+        scheduler_collection,
+        catalog: IntentCatalogStore,
+        registry: ModelRegistry,
+        model_manager: ModelManager,
+        output_dir: str,
+        max_concurrent_jobs: int = 1,
+        epochs: int = 200,
+        batch_size: int = 5,
+        progress_interval: float = 1.0,
+        auto_activate: bool = True,
+        fine_tune_epochs: int = 30,
+        replay_ratio: float = 1.0,
+        poll_interval: float = 2.0,
+        stale_after: float = 60.0,
+        coalesce_window: float = 10.0,
+        worker_id: Optional[str] = None
+    ):
+        self.jobs_collection = jobs_collection
+        self.scheduler_collection = scheduler_collection
+        self.catalog = catalog
+        self.registry = registry
+        self.model_manager = model_manager
+        self.auto_activate = auto_activate
+        self.output_dir = output_dir
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.fine_tune_epochs = fine_tune_epochs
+        self.replay_ratio = replay_ratio
+        self.progress_interval = progress_interval
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.coalesce_window = coalesce_window
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._wake: Optional[asyncio.Event] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._jobs: Dict[str, Tuple[asyncio.Task, Any]] = {}
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            # spawn keeps the workers free of the event loop and driver threads
+            context = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.max_concurrent_jobs, mp_context=context)
+            self._manager = context.Manager()
+
+    @property
+    def active_jobs(self) -> int:
+        return len(self._jobs)
+
+    async def start(self):
+        if self._poller is not None:
+            return
+        await self.scheduler_collection.update_one(
+            {"_id": SCHEDULER_ID},
+            {"$setOnInsert": {"running": []}},
+            upsert=True
+        )
+        # Jobs a previous run of any worker left running are failed first
+        await self._reconcile()
+        self._wake = asyncio.Event()
+        self._poller = asyncio.create_task(self._poll())
+
+    async def enqueue(self, created_by: str, changed_tags: Optional[Iterable[str]] = None) -> str:
+        # changed_tags requests an incremental run on top of the active model.
+        # Changes made while an incremental job is still queued join it, and
+        # it waits coalesce_window to collect them, instead of every addition
+        # fine-tuning its own copy of the same base model.
+        now = datetime.now()
+        if changed_tags:
+            update = {
+                "$addToSet": {"changed_intents": {"$each": sorted(set(changed_tags))}},
+                "$set": {"updated_at": now},
+                "$setOnInsert": {
+                    "progress": 0.0,
+                    "created_by": created_by,
+                    "created_at": now,
+                    "not_before": now + timedelta(seconds=self.coalesce_window)
+                }
+            }
+            try:
+                job = await self._join_incremental(update)
+            except DuplicateKeyError:
+                # Another worker inserted the queued job first (the unique
+                # index created in init_db allows one); join that one instead
+                job = await self._join_incremental(update)
+            job_id = str(job["_id"])
+        else:
+            result = await self.jobs_collection.insert_one({
+                "status": "queued",
+                "progress": 0.0,
+                "created_by": created_by,
+                "created_at": now
+            })
+            job_id = str(result.inserted_id)
+        self.submit(job_id)
+        return job_id
+
+    async def _join_incremental(self, update: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.jobs_collection.find_one_and_update(
+            {"status": "queued", "mode": "incremental"},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def submit(self, job_id: Optional[str] = None) -> None:
+        # The job is already queued in the collection; this only saves the
+        # poll interval when this worker has a free slot
+        if self._wake is not None:
+            self._wake.set()
+
+    async def cancel(self, job_id: str) -> bool:
+        # A queued job is cancelled outright; a running one is flagged and its
+        # worker stops it at the next heartbeat. False if the job is finished.
+        now = datetime.now()
+        job = await self.jobs_collection.find_one_and_update(
+            {"_id": ObjectId(job_id), "status": "queued"},
+            {"$set": {"status": "cancelled", "updated_at": now, "finished_at": now}}
+        )
+        if job is None:
+            job = await self.jobs_collection.find_one_and_update(
+                {"_id": ObjectId(job_id), "status": "running"},
+                {"$set": {"cancel_requested": True, "updated_at": now}}
+            )
+            if job is None:
+                return False
+        local = self._jobs.get(job_id)
+        if local is not None:
+            local[1].set()
+        return True
+
+    async def shutdown(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        for _, cancel_event in self._jobs.values():
+            cancel_event.set()
+        if self._jobs:
+            await asyncio.wait([task for task, _ in self._jobs.values()], timeout=10)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._manager.shutdown()
+            self._pool = None
+            self._manager = None
+
+    async def _poll(self):
+        while True:
+            # Cleared first so a submit() made while claiming is not lost
+            self._wake.clear()
+            try:
+                await self._reconcile()
+                while len(self._jobs) < self.max_concurrent_jobs and await self._claim_next():
+                    pass
+            except Exception as e:
+                logger.error(f"Error polling training jobs: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reconcile(self):
+        # A running job whose worker stopped heartbeating (crashed, killed or
+        # restarted) will never finish; fail it and free its slot
+        now = datetime.now()
+        cutoff = now - timedelta(seconds=self.stale_after)
+        await self.jobs_collection.update_many(
+            {
+                "status": "running",
+                "$or": [{"heartbeat_at": {"$lt": cutoff}}, {"heartbeat_at": {"$exists": False}}]
+            },
+            {"$set": {"status": "failed", "error": "Training worker lost", "updated_at": now, "finished_at": now}}
+        )
+        scheduler = await self.scheduler_collection.find_one({"_id": SCHEDULER_ID})
+        held = (scheduler or {}).get("running", [])
+        if not held:
+            return
+        running = {
+            str(job["_id"])
+            async for job in self.jobs_collection.find(
+                {"_id": {"$in": [ObjectId(job_id) for job_id in held]}, "status": "running"},
+                {"_id": 1}
+            )
+        }
+        released = [job_id for job_id in held if job_id not in running]
+        if released:
+            await self.scheduler_collection.update_one(
+                {"_id": SCHEDULER_ID},
+                {"$pull": {"running": {"$in": released}}}
+            )
+
+    async def _claim_next(self) -> bool:
+        # Claims the oldest queued job; False when there is none or every
+        # slot is taken
+        scheduler = await self.scheduler_collection.find_one({"_id": SCHEDULER_ID})
+        if len((scheduler or {}).get("running", [])) >= self.max_concurrent_jobs:
+            return False
+        now = datetime.now()
+        claimable = {
+            "status": "queued",
+            "$or": [{"not_before": {"$exists": False}}, {"not_before": {"$lte": now}}]
+        }
+        # Incremental runs go one at a time, each widening the model the one
+        # before it activated
+        if await self.jobs_collection.find_one({"status": "running", "changed_intents": {"$exists": True}}):
+            claimable["changed_intents"] = {"$exists": False}
+        job = await self.jobs_collection.find_one_and_update(
+            claimable,
+            {"$set": {
+                "status": "running",
+                "worker": self.worker_id,
+                "started_at": now,
+                "heartbeat_at": now,
+                "updated_at": now
+            }},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            return False
+        job_id = str(job["_id"])
+        # The slot is taken after the job so that _reconcile, which frees the
+        # slots of jobs that are not running, never frees one being claimed
+        slot = await self.scheduler_collection.find_one_and_update(
+            {"_id": SCHEDULER_ID, f"running.{self.max_concurrent_jobs - 1}": {"$exists": False}},
+            {"$addToSet": {"running": job_id}}
+        )
+        if slot is None:
+            # Another worker took the last slot in between
+            requeue = {"$set": {"status": "queued"}, "$unset": {"worker": "", "started_at": "", "heartbeat_at": ""}}
+            try:
+                await self.jobs_collection.update_one({"_id": job["_id"], "status": "running"}, requeue)
+            except DuplicateKeyError:
+                # A newer incremental job was queued meanwhile; this one goes
+                # back as a queued job of its own rather than the one to join
+                requeue["$unset"]["mode"] = ""
+                await self.jobs_collection.update_one({"_id": job["_id"], "status": "running"}, requeue)
+            return False
+
+        self._ensure_pool()
+        cancel_event = self._manager.Event()
+        changed_tags = job.get("changed_intents") or None
+        task = asyncio.create_task(self._run(job_id, cancel_event, changed_tags))
+        self._jobs[job_id] = (task, cancel_event)
+        task.add_done_callback(lambda _: self._jobs.pop(job_id, None))
+        return True
+
+    async def _heartbeat(self, job_id: str, cancel_event):
+        # Keeps the claim fresh and relays a cancel made through any worker
+        while True:
+            try:
+                job = await self.jobs_collection.find_one_and_update(
+                    {"_id": ObjectId(job_id)},
+                    {"$set": {"heartbeat_at": datetime.now()}},
+                    projection={"cancel_requested": 1}
+                )
+                if job is not None and job.get("cancel_requested"):
+                    cancel_event.set()
+            except Exception as e:
+                logger.warning(f"Could not heartbeat training job {job_id}: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _update(self, job_id: str, **fields):
+        fields["updated_at"] = datetime.now()
+        await self.jobs_collection.update_one({"_id": ObjectId(job_id)}, {"$set": fields})
+
+    async def _report_progress(self, job_id: str, progress):
+        # Drains epoch updates from the worker and writes at most one update per
+        # progress_interval; a None sentinel ends the loop
+        loop = asyncio.get_running_loop()
+        while True:
+            update = await loop.run_in_executor(None, progress.get)
+            done = update is None
+            try:
+                while not done:
+                    latest = progress.get_nowait()
+                    if latest is None:
+                        done = True
+                    else:
+                        update = latest
+            except queue.Empty:
+                pass
+
+            if update is not None:
+                try:
+                    await self._update(
+                        job_id,
+                        progress=update["epoch"] / update["epochs"],
+                        metrics=update
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not record progress for training job {job_id}: {str(e)}")
+            if done:
+                return
+            await asyncio.sleep(self.progress_interval)
+
+    def _base_dir(self) -> Optional[str]:
+        # Incremental runs start from the active version's Keras model
+        version = self.registry.current()
+        if version is None:
+            return None
+        base_dir = self.registry.path(version)
+        return base_dir if os.path.exists(os.path.join(base_dir, MODEL_FILE)) else None
+
+    async def _run(self, job_id: str, cancel_event, changed_tags=None):
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, cancel_event))
+        started_at = datetime.now()
+        mode = "full"
+        try:
+            # Resolved when the job starts so queued runs build on each other
+            base_dir = self._base_dir() if changed_tags else None
+            mode = "incremental" if base_dir else "full"
+            await self._update(job_id, mode=mode)
+            progress = self._manager.Queue()
+            reporter = asyncio.create_task(self._report_progress(job_id, progress))
+            try:
+                # Pick up anything added through /data or /upload since the last poll
+                await self.catalog.reload()
+                intents = [intent._asdict() for intent in self.catalog.catalog.intents.values()]
+                metrics = await asyncio.get_running_loop().run_in_executor(
+                    self._pool,
+                    run_training_job,
+                    intents,
+                    os.path.join(self.output_dir, job_id),
+                    self.fine_tune_epochs if base_dir else self.epochs,
+                    self.batch_size,
+                    progress,
+                    cancel_event,
+                    base_dir,
+                    changed_tags,
+                    self.replay_ratio
+                )
+            except TrainingCancelled:
+                status = {"status": "cancelled"}
+                logger.info(f"Training job {job_id} cancelled")
+            except Exception as e:
+                status = {"status": "failed", "error": str(e)}
+                logger.error(f"Training job {job_id} failed: {str(e)}", exc_info=True)
+            else:
+                status = await self._publish(job_id, metrics)
+            finally:
+                progress.put(None)
+                await reporter
+            finished_at = datetime.now()
+            training_job_seconds.labels(mode, status["status"]).observe((finished_at - started_at).total_seconds())
+            await self._update(job_id, finished_at=finished_at, **status)
+        finally:
+            heartbeat.cancel()
+            await self.scheduler_collection.update_one({"_id": SCHEDULER_ID}, {"$pull": {"running": job_id}})
+
+    async def _publish(self, job_id: str, metrics: Dict[str, Any]) -> Dict[str, Any]:
+        # Registers the trained artifacts and, if enabled, hot-swaps them in
+        try:
+            manifest = self.registry.register_directory(
+                metrics["output_dir"],
+                metrics=metrics,
+                source=f"training_job:{job_id}"
+            )
+            if self.auto_activate:
+                await self.model_manager.activate(manifest["version"])
+        except Exception as e:
+            logger.error(f"Could not publish model from training job {job_id}: {str(e)}", exc_info=True)
+            return {"status": "failed", "progress": 1.0, "metrics": metrics, "error": str(e)}
+
+        logger.info(
+            f"Training job {job_id} completed: accuracy={metrics.get('accuracy')}, "
+            f"model version {manifest['version']}"
+        )
+        return {
+            "status": "completed",
+            "progress": 1.0,
+            "metrics": metrics,
+            "model_version": manifest["version"]
+        }
+
+# Done by ELYES
+training_runner = TrainingRunner(
+    mongodb.training_jobs,
+    mongodb.training_scheduler,
+    intent_catalog,
+    model_registry,
+    model_manager,
+    settings.TRAINING_OUTPUT_DIR,
+    max_concurrent_jobs=settings.TRAINING_MAX_CONCURRENT_JOBS,
+    epochs=settings.TRAINING_EPOCHS,
+    batch_size=settings.TRAINING_BATCH_SIZE,
+    auto_activate=settings.MODEL_AUTO_ACTIVATE,
+    fine_tune_epochs=settings.TRAINING_FINE_TUNE_EPOCHS,
+    replay_ratio=settings.TRAINING_REPLAY_RATIO,
+    poll_interval=settings.TRAINING_POLL_INTERVAL,
+    stale_after=settings.TRAINING_STALE_AFTER,
+    coalesce_window=settings.TRAINING_COALESCE_WINDOW
+)
@@ -0,0 +1,78 @@
+"""
+Bag-of-words vectorizer for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import pickle
+from typing import Callable, Dict, Iterable, List, Sequence
+
+import numpy as np
+
+from app.ml.preprocessing import clean_up_sentence
+
+class BagOfWordsVectorizer:
+    # Maps tokens to vocabulary columns through a dict built once, so encoding a
+    # sentence costs O(tokens) instead of O(tokens x vocabulary)
+    # Done by ELYES
+    def __init__(
+        self,
+        words: Sequence[str],
+        tokenizer: Callable[[str], Sequence[str]] = clean_up_sentence,
+        dtype=np.float32
+    ):
+        self.words = list(words)
+        self.index: Dict[str, int] = {word: i for i, word in enumerate(self.words)}
+        self.tokenizer = tokenizer
+        self.dtype = dtype
+
+    @classmethod
+    def from_pickle(cls, path: str, **kwargs) -> "BagOfWordsVectorizer":
+        with open(path, 'rb') as f:
+            return cls(pickle.load(f), **kwargs)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self.words)
+
+    def indices(self, tokens: Iterable[str]) -> List[int]:
+        # Column indices of the known tokens, without duplicates
+        index = self.index
+        return sorted({index[token] for token in tokens if token in index})
+
+    def transform_tokens(self, tokens: Iterable[str]) -> np.ndarray:
+        bag = np.zeros(len(self.words), dtype=self.dtype)
+        bag[self.indices(tokens)] = 1
+        return bag
+
+    def transform(self, sentence: str) -> np.ndarray:
+        return self.transform_tokens(self.tokenizer(sentence))
+
+    def transform_tokens_batch(self, token_lists: Iterable[Iterable[str]], sparse: bool = False):
+        rows = [self.indices(tokens) for tokens in token_lists]
+        if sparse:
+            return self._to_csr(rows)
+
+        matrix = np.zeros((len(rows), len(self.words)), dtype=self.dtype)
+        for i, columns in enumerate(rows):
+            matrix[i, columns] = 1
+        return matrix
+
+    def transform_batch(self, sentences: Iterable[str], sparse: bool = False):
+        return self.transform_tokens_batch(
+            (self.tokenizer(sentence) for sentence in sentences),
+            sparse=sparse
+        )
+
+    def _to_csr(self, rows: List[List[int]]):
+        from scipy.sparse import csr_matrix
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(columns) for columns in rows], out=indptr[1:])
+        indices = np.fromiter(
+            (column for columns in rows for column in columns),
+            dtype=np.int32,
+            count=int(indptr[-1])
+        )
+        data = np.ones(len(indices), dtype=self.dtype)
+        return csr_matrix((data, indices, indptr), shape=(len(rows), len(self.words)))
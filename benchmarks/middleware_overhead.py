@@ -0,0 +1,137 @@
+"""
+Middleware overhead benchmark for ChatXpert
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+
+Measures the per-request cost of the middleware stack by calling the ASGI
+app directly (no sockets, no HTTP client), comparing the previous
+BaseHTTPMiddleware stack with the current pure-ASGI one. Run with:
+
+    python -m benchmarks.middleware_overhead [requests]
+"""
+
+import asyncio
+import sys
+import time
+
+from fastapi import FastAPI, Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.middleware import (
+    ErrorHandlingMiddleware,
+    RateLimitMiddleware,
+    RequestLoggingMiddleware,
+    SecurityHeadersMiddleware
+)
+from app.core.rate_limit import RateLimitResult
+
+class AllowAll:
+    # Rate limiter stand-in so the comparison excludes Redis latency
+    # Done by ELYES
+    async def hit(self, identity, path="", cost=1):
+        return RateLimitResult(True, 100)
+
+# The previous BaseHTTPMiddleware implementations, reduced to the same work
+# Done by ELYES
+class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        response.headers["X-Process-Time"] = f"{process_time:.4f}s"
+        return response
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        await AllowAll().hit(f"ip:{request.client.host}", request.url.path)
+        return await call_next(request)
+
+class LegacyErrorHandlingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception:
+            return Response(content="Internal server error", status_code=500)
+
+def build_app(middleware):
+    # Done by ELYES
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    for cls, kwargs in middleware:
+        app.add_middleware(cls, **kwargs)
+    return app
+
+async def measure(app, requests: int) -> float:
+    # Mean seconds per request through the full ASGI app
+    # Done by ELYES
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+    def connection():
+        # The request body once, then block like a server until the response
+        # is complete, at which point receive() reports the disconnect
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        complete = asyncio.Event()
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                complete.set()
+        return receive, send
+
+    for _ in range(200):
+        await app(dict(scope), *connection())
+    start_time = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), *connection())
+    return (time.perf_counter() - start_time) / requests
+
+def main():
+    # Done by ELYES
+    import logging
+    logging.disable(logging.INFO)
+
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    stacks = {
+        "no middleware": [],
+        "BaseHTTPMiddleware (before)": [
+            (LegacyRequestLoggingMiddleware, {}),
+            (LegacyRateLimitMiddleware, {}),
+            (LegacyErrorHandlingMiddleware, {}),
+        ],
+        "pure ASGI (after)": [
+            (RequestLoggingMiddleware, {}),
+            (RateLimitMiddleware, {"limiter": AllowAll()}),
+            (ErrorHandlingMiddleware, {}),
+            (SecurityHeadersMiddleware, {}),
+        ],
+    }
+    baseline = None
+    for name, middleware in stacks.items():
+        seconds = asyncio.run(measure(build_app(middleware), requests))
+        baseline = seconds if baseline is None else baseline
+        print(f"{name:<30} {seconds * 1e6:8.1f} us/request  (+{(seconds - baseline) * 1e6:.1f} us overhead)")
+
+if __name__ == "__main__":
+    main()
@@ -48,20 +48,59 @@ const Chat = () => {
     setIsLoading(true);
 
     try {
-      const response = await axios.post('/api/chat/send', 
-        { content: input },
-        { headers: { Authorization: `Bearer ${user.token}` }}
-      );
+      // Stream the reply over Server-Sent Events: the intent arrives first,
+      // then the text token by token
+      const response = await fetch('/api/chat/stream', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Authorization: `Bearer ${user.token}`
+        },
+        body: JSON.stringify({ content: input })
+      });
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
 
-      const botMessage = {
-        content: response.data.message,
-        timestamp: new Date(),
-        type: 'bot',
-        confidence: response.data.confidence,
-        intent: response.data.intent
+      const updateBotMessage = (update) => {
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          if (last && last.type === 'bot' && last.streaming) {
+            return [...prev.slice(0, -1), { ...last, ...update(last) }];
+          }
+          return [...prev, {
+            content: '',
+            timestamp: new Date(),
+            type: 'bot',
+            confidence: 0,
+            streaming: true,
+            ...update({ content: '' })
+          }];
+        });
       };
 
-      setMessages(prev => [...prev, botMessage]);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+          if (event === 'intent') {
+            setIsLoading(false);
+            updateBotMessage(() => ({ confidence: data.confidence, intent: data.intent }));
+          } else if (event === 'token') {
+            updateBotMessage(last => ({ content: last.content + data.text }));
+          } else if (event === 'done') {
+            updateBotMessage(() => ({ ...data, content: data.message, streaming: false }));
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
+        }
+      }
     } catch (error) {
       console.error('Error sending message:', error);
       setMessages(prev => [...prev, {
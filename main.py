@@ -1,60 +1,23 @@
 ### Author: Riya Nakarmi ###
 ### College Project ###
 
-import random
-import json
-import pickle
-import numpy as np
+from app.ml.classifier import load_numpy_classifier
+from app.ml.intents import IntentCatalog
 
-import nltk
-from nltk.stem import WordNetLemmatizer
 
-from tensorflow.keras.models import load_model
+intents = IntentCatalog.from_json('intents.json', fallback_tag='invalid')
 
-
-lemmatizer = WordNetLemmatizer()
-
-intents = json.loads(open('intents.json').read())
-
-words = pickle.load(open('words.pkl', 'rb'))
-classes = pickle.load(open('classes.pkl', 'rb'))
-model = load_model('chatbotmodel.h5')
-
-def clean_up_sentence(sentence):
-    sentence_words = nltk.word_tokenize(sentence)
-    sentence_words = [lemmatizer.lemmatize(word)  for word in sentence_words]
-    return sentence_words
+classifier = load_numpy_classifier('chatbotmodel.npz', 'words.pkl', 'classes.pkl')
 
 def bag_of_words(sentence):
-    sentence_words= clean_up_sentence(sentence)
-    bag = [0] * len(words)
-    for w in sentence_words:
-        for i, word in enumerate(words):
-            if word == w:
-                bag[i] = 1
-
-    return np.array(bag)
+    return classifier.vectorizer.transform(sentence)
 
 def predict_class(sentence):
-    bow = bag_of_words(sentence)
-    res = model.predict(np.array([bow]))[0]
-    ERROR_THRESHOLD = 0.25
-    results = [[i,r] for i, r in enumerate(res) if r > ERROR_THRESHOLD]
-
-    results.sort(key=lambda  x:x[1], reverse=True)
-    return_list = []
-    for r in results:
-        return_list.append({'intent': classes[r[0]], 'probability': str(r[1])})
-    return return_list
+    return classifier.predict_class(sentence)
 
 
-def get_response(intents_list,intents_json):
-    tag= intents_list[0]['intent']
-    list_of_intents =intents_json['intents']
-    for i in list_of_intents:
-        if i['tag'] == tag:
-            result = random.choice(i['responses'])
-            break
+def get_response(intents_list,intents_catalog):
+    intent, result = intents_catalog.choose_response(intents_list)
     return result
 
 print("|============= Welcome to College Equiry Chatbot System! =============|")
@@ -0,0 +1,180 @@
+"""
+Tests for ChatXpert chat history pagination
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.core.chat_history import ChatHistory, decode_cursor
+from app.core.message_writer import MessageWriter
+
+class FakeCursor:
+    # Done by ELYES
+    def __init__(self, documents, on_read=None):
+        self.documents = documents
+        self.on_read = on_read
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.documents.sort(key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.documents = self.documents[:n]
+        return self
+
+    async def to_list(self, length=None):
+        # The documents were matched in find(); on_read runs after that
+        if self.on_read is not None:
+            await self.on_read()
+        return self.documents
+
+class FakeMessages:
+    # Understands just the queries ChatHistory sends
+    # Done by ELYES
+    def __init__(self):
+        self.documents = []
+        self.finds = []
+        self.on_read = None
+
+    async def insert_many(self, documents, ordered=True):
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+            self.documents.append(dict(document))
+
+    async def insert_one(self, document):
+        await self.insert_many([document])
+
+    def _matches(self, document, query):
+        if document["user_id"] != query["user_id"]:
+            return False
+        if "$or" not in query:
+            return True
+        _, same = query["$or"]
+        timestamp = same["timestamp"]
+        return document["timestamp"] < timestamp or (
+            document["timestamp"] == timestamp and document["_id"] < same["_id"]["$lt"]
+        )
+
+    def find(self, query, projection):
+        self.finds.append(query)
+        return FakeCursor([
+            {key: d[key] for key in ("_id", *projection)}
+            for d in self.documents
+            if self._matches(d, query)
+        ], self.on_read)
+
+class FakePipeline:
+    # Done by ELYES
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self.calls.append((name, args))
+            return self
+        return queue
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args) for name, args in self.calls]
+
+class FakeRedis:
+    # Done by ELYES
+    def __init__(self):
+        self.hashes = {}
+
+    async def hmget(self, key, *fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    async def hincrby(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = str(int(fields.get(field, 0)) + amount).encode()
+        return int(fields[field])
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    async def expire(self, key, ttl):
+        pass
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+def test_history_pages_with_keyset_cursors():
+    # Done by ELYES
+    messages = FakeMessages()
+    start = datetime(2025, 1, 1)
+    # Pairs share a timestamp, so the _id tie-breaker decides page boundaries
+    asyncio.run(messages.insert_many([
+        {"content": f"m{i}", "user_id": "u1", "timestamp": start + timedelta(seconds=i // 2), "extra": "x"}
+        for i in range(7)
+    ] + [{"content": "other", "user_id": "u2", "timestamp": start}]))
+    history = ChatHistory(messages, max_page_size=3)
+
+    async def run():
+        pages, cursor = [], None
+        while True:
+            # Page size is capped at max_page_size
+            page, cursor = await history.page("u1", 50, cursor)
+            pages.append([m["content"] for m in page])
+            if cursor is None:
+                return pages
+
+    assert asyncio.run(run()) == [["m6", "m5", "m4"], ["m3", "m2", "m1"], ["m0"]]
+    first, _ = asyncio.run(history.page("u1", 1))
+    assert set(first[0]) == {"content", "user_id", "timestamp"}
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_first_page_cache_is_dropped_when_a_message_is_written():
+    # Done by ELYES
+    messages = FakeMessages()
+    history = ChatHistory(messages, FakeRedis())
+    writer = MessageWriter(messages, flush_interval=0, on_written=history.written)
+
+    async def run():
+        await writer.write({"content": "hello", "user_id": "u1", "timestamp": datetime(2025, 1, 1)})
+        assert [m["content"] for m in (await history.page("u1"))[0]] == ["hello"]
+        assert [m["content"] for m in (await history.page("u1"))[0]] == ["hello"]
+        assert len(messages.finds) == 1
+
+        await writer.start()
+        await writer.write({"content": "again", "user_id": "u1", "timestamp": datetime(2025, 1, 2)})
+        await writer.stop()
+        return [m["content"] for m in (await history.page("u1"))[0]]
+
+    assert asyncio.run(run()) == ["again", "hello"]
+    assert len(messages.finds) == 2
+
+def test_first_page_read_before_a_write_is_not_served_after_it():
+    # Done by ELYES
+    messages = FakeMessages()
+    history = ChatHistory(messages, FakeRedis())
+
+    async def write_during_read():
+        # Lands between the reader's query and its caching of the result
+        messages.on_read = None
+        await messages.insert_one({"content": "again", "user_id": "u1", "timestamp": datetime(2025, 1, 2)})
+        await history.written([{"user_id": "u1"}])
+
+    async def run():
+        await messages.insert_one({"content": "hello", "user_id": "u1", "timestamp": datetime(2025, 1, 1)})
+        messages.on_read = write_during_read
+        first = [m["content"] for m in (await history.page("u1"))[0]]
+        second = [m["content"] for m in (await history.page("u1"))[0]]
+        third = [m["content"] for m in (await history.page("u1"))[0]]
+        return first, second, third
+
+    assert asyncio.run(run()) == (["hello"], ["again", "hello"], ["again", "hello"])
+    # The stale page was stored but never served; the fresh one is cached
+    assert len(messages.finds) == 2
@@ -0,0 +1,102 @@
+"""
+Tests for ChatXpert streaming chat
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from app.api.routes import chat
+from app.core.security import get_current_user
+from app.core.session_context import SessionContextStore
+from app.ml.intents import Intent, IntentCatalog
+from app.ml.llm import StaticLLMClient
+from app.ml.router import ResponseRouter
+
+# Done by ELYES
+USER = {"_id": "u1", "username": "alice"}
+
+class FakeWriter:
+    # Done by ELYES
+    def __init__(self):
+        self.documents = []
+
+    async def write(self, document):
+        self.documents.append(document)
+
+@pytest.fixture
+def client(monkeypatch):
+    # Done by ELYES
+    async def predict(message):
+        if "hello" in message:
+            return [{"intent": "greetings", "probability": 0.9}]
+        return []
+
+    async def get_user_from_token(token):
+        return (USER, {"sub": "alice"}) if token == "good" else None
+
+    catalog = IntentCatalog([Intent("greetings", ("hello",), ("Hi there!",))], threshold=0.5)
+    monkeypatch.setattr(chat, "message_writer", FakeWriter())
+    monkeypatch.setattr(chat, "response_router", ResponseRouter(
+        SimpleNamespace(catalog=catalog),
+        predict,
+        llm=StaticLLMClient("Let me think about that.")
+    ))
+    monkeypatch.setattr(chat, "session_context", SessionContextStore())
+    monkeypatch.setattr(chat, "get_user_from_token", get_user_from_token)
+
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/api/chat")
+    app.dependency_overrides[get_current_user] = lambda: USER
+    return TestClient(app)
+
+def parse_sse(text):
+    # Done by ELYES
+    events = []
+    for block in text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def test_sse_sends_intent_first_then_tokens(client):
+    # Done by ELYES
+    events = parse_sse(client.post("/api/chat/stream", json={"content": "hello"}).text)
+    assert events == [
+        ("intent", {"intent": "greetings", "confidence": 0.9, "source": "local"}),
+        ("token", {"text": "Hi there!"}),
+        ("done", {"message": "Hi there!", "confidence": 0.9, "intent": "greetings", "source": "local"}),
+    ]
+
+    events = parse_sse(client.post("/api/chat/stream", json={"content": "what is love"}).text)
+    assert events[0] == ("intent", {"intent": None, "confidence": 0.0, "source": "llm"})
+    assert "".join(data["text"] for event, data in events if event == "token") == "Let me think about that."
+    assert events[-1][1]["message"] == "Let me think about that."
+    assert [d["content"] for d in chat.message_writer.documents] == ["hello", "what is love"]
+    # Both turns are in the conversation context for the next message
+    turns = asyncio.run(chat.session_context.get("u1"))
+    assert [(t.message, t.intent) for t in turns] == [("hello", "greetings"), ("what is love", None)]
+
+def test_websocket_session_authenticates_once(client):
+    # Done by ELYES
+    with client.websocket_connect("/api/chat/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": "good"})
+        assert websocket.receive_json() == {"type": "ready", "username": "alice"}
+        for content in ("hello", "hello again"):
+            websocket.send_json({"content": content})
+            types = []
+            while not types or types[-1] != "done":
+                types.append(websocket.receive_json()["type"])
+            assert types == ["intent", "token", "done"]
+        websocket.send_json({"content": ""})
+        assert websocket.receive_json()["type"] == "error"
+
+    with client.websocket_connect("/api/chat/ws?token=bad") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 1008
@@ -0,0 +1,130 @@
+"""
+Tests for ChatXpert database utilities
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pymongo import monitoring
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.database import HealthChecker, async_database_url, create_database_engine, database_connect_args
+from app.core.pools import InstrumentedRedisPool, MongoPoolListener, PoolMetrics, instrumented_sqlalchemy_pool
+
+def test_database_urls_get_asyncio_drivers():
+    # Done by ELYES
+    assert async_database_url("postgresql://u:p@db:5432/chatxpert").drivername == "postgresql+asyncpg"
+    assert async_database_url("postgresql+psycopg2://u:p@db/chatxpert").drivername == "postgresql+asyncpg"
+    assert async_database_url("sqlite:///./local.db").drivername == "sqlite+aiosqlite"
+
+def test_postgres_connections_ask_the_server_for_tcp_keepalives():
+    # Done by ELYES
+    connect_args = database_connect_args(async_database_url("postgresql://u:p@db/chatxpert"))
+    assert connect_args["server_settings"]["tcp_keepalives_idle"] == "60"
+    assert database_connect_args(async_database_url("sqlite://")) == {}
+    engine = create_database_engine("postgresql://u:p@db/chatxpert")
+    assert engine.pool._pre_ping
+
+def test_health_checker_runs_concurrently_with_timeouts_and_caches():
+    # Done by ELYES
+    engine = create_database_engine("sqlite://")
+    calls = []
+
+    async def ping_sqlite():
+        calls.append("sqlite")
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def hanging():
+        calls.append("hanging")
+        await asyncio.sleep(10)
+
+    async def broken():
+        calls.append("broken")
+        raise ConnectionError("refused")
+
+    checker = HealthChecker({"sqlite": ping_sqlite, "hanging": hanging, "broken": broken}, timeout=0.2, ttl=60)
+
+    async def run():
+        start_time = asyncio.get_running_loop().time()
+        # Concurrent probes share one check
+        results = await asyncio.gather(*(checker.check() for _ in range(5)))
+        elapsed = asyncio.get_running_loop().time() - start_time
+        await checker.check()
+        await engine.dispose()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(run())
+    stores = results[0]["stores"]
+    assert not results[0]["healthy"]
+    assert {name: store["status"] for name, store in stores.items()} == {
+        "sqlite": "up", "hanging": "timeout", "broken": "down"
+    }
+    assert stores["broken"]["error"] == "refused"
+    assert all(store["latency_ms"] >= 0 for store in stores.values())
+    # Bounded by the slowest timeout, not the sum, and each store pinged once
+    assert elapsed < 0.5
+    assert sorted(calls) == ["broken", "hanging", "sqlite"]
+
+def test_sqlalchemy_pool_metrics_track_checkouts_and_timeouts(tmp_path):
+    # Done by ELYES
+    metrics = PoolMetrics("postgres", 1)
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=instrumented_sqlalchemy_pool(metrics),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1
+    )
+
+    async def run():
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+            held = metrics.stats()["checked_out"]
+            with pytest.raises(exc.TimeoutError):
+                async with engine.connect():
+                    pass
+        await engine.dispose()
+        # The pool rebuilt by dispose() reports to the same metrics
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        await engine.dispose()
+        return held
+
+    assert asyncio.run(run()) == 1
+    stats = metrics.stats()
+    assert (stats["checked_out"], stats["acquisitions"], stats["timeouts"], stats["opened"]) == (0, 2, 1, 2)
+    assert stats["max_wait_seconds"] >= stats["average_wait_seconds"] > 0
+
+def test_redis_and_mongo_pool_metrics():
+    # Done by ELYES
+    exhausted = InstrumentedRedisPool(max_connections=1)
+    # Every connection already in use
+    exhausted.max_connections = 0
+    refused = InstrumentedRedisPool(port=1, socket_connect_timeout=0.5)
+
+    async def run():
+        for pool in (exhausted, refused):
+            with pytest.raises(RedisConnectionError):
+                await pool.get_connection("PING")
+
+    asyncio.run(run())
+    assert exhausted.metrics.stats()["timeouts"] == 1
+    # A connection that never connected was never checked out
+    assert (refused.metrics.stats()["checked_out"], refused.metrics.stats()["opened"]) == (0, 1)
+
+    metrics = PoolMetrics("mongodb")
+    listener = MongoPoolListener(metrics)
+    listener.connection_created(None)
+    listener.connection_check_out_started(None)
+    listener.connection_checked_out(None)
+    assert metrics.stats()["checked_out"] == 1
+    listener.connection_checked_in(None)
+    listener.connection_check_out_failed(SimpleNamespace(reason=monitoring.ConnectionCheckOutFailedReason.TIMEOUT))
+    stats = metrics.stats()
+    assert (stats["checked_out"], stats["acquisitions"], stats["timeouts"], stats["opened"]) == (0, 1, 1, 1)
@@ -0,0 +1,46 @@
+"""
+Tests for ChatXpert logging
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import json
+import logging
+import queue
+
+from app.core.logging import JsonFormatter, LazyQueueHandler, SamplingFilter
+
+def make_record(name="chatxpert.requests", level=logging.INFO, msg="Request: %s", args=("/ok",), **extra):
+    # Done by ELYES
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_json_formatter_adds_extra_fields():
+    # Done by ELYES
+    entry = json.loads(JsonFormatter().format(make_record(status_code=200, duration=0.5)))
+    assert entry["message"] == "Request: /ok"
+    assert (entry["level"], entry["logger"]) == ("INFO", "chatxpert.requests")
+    assert (entry["status_code"], entry["duration"]) == (200, 0.5)
+    assert "args" not in entry
+
+def test_sampling_keeps_a_fraction_of_info_records_and_every_warning():
+    # Done by ELYES
+    sampler = SamplingFilter({"chatxpert.requests": 0.25})
+    kept = [sampler.filter(make_record()) for _ in range(8)]
+    assert kept.count(True) == 2
+    assert sampler.filter(make_record(level=logging.WARNING))
+    assert all(sampler.filter(make_record(name="chatxpert")) for _ in range(3))
+
+def test_queue_handler_defers_formatting_and_drops_when_full():
+    # Done by ELYES
+    handler = LazyQueueHandler(queue.Queue(maxsize=1))
+    first = make_record()
+    handler.handle(first)
+    handler.handle(make_record())
+
+    queued = handler.queue.get_nowait()
+    assert queued is first
+    # Still unformatted: msg and args are merged by the listener's formatter
+    assert (queued.msg, queued.args) == ("Request: %s", ("/ok",))
+    assert handler.dropped == 1
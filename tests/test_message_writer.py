@@ -0,0 +1,74 @@
+"""
+Tests for the ChatXpert message log writer
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+
+from app.core.message_writer import MessageWriter
+
+class FakeMessages:
+    # Done by ELYES
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.inline = []
+
+    async def insert_many(self, documents, ordered=True):
+        await asyncio.sleep(self.delay)
+        self.batches.append(list(documents))
+
+    async def insert_one(self, document):
+        self.inline.append(document)
+
+def test_message_writer_batches_and_drains_on_stop():
+    # Done by ELYES
+    messages = FakeMessages()
+    writer = MessageWriter(messages, max_batch_size=4, flush_interval=10)
+
+    async def run():
+        await writer.start()
+        await asyncio.gather(*(writer.write({"n": i}) for i in range(10)))
+        await asyncio.sleep(0)
+        # The last two are below max_batch_size and only go out on the drain
+        await writer.stop()
+
+    asyncio.run(run())
+    assert [len(batch) for batch in messages.batches] == [4, 4, 2]
+    assert [doc["n"] for batch in messages.batches for doc in batch] == list(range(10))
+    stats = writer.stats()
+    assert (stats["enqueued"], stats["written"], stats["queue_depth"]) == (10, 10, 0)
+
+def test_message_writer_applies_backpressure_when_full():
+    # Done by ELYES
+    messages = FakeMessages(delay=0.2)
+    writer = MessageWriter(messages, max_batch_size=1, flush_interval=0, max_queue_size=1, enqueue_timeout=0.01)
+
+    async def run():
+        await writer.start()
+        for i in range(4):
+            await writer.write({"n": i})
+        await writer.stop()
+
+    asyncio.run(run())
+    written = sorted(doc["n"] for batch in messages.batches for doc in batch)
+    inline = sorted(doc["n"] for doc in messages.inline)
+    assert inline and sorted(written + inline) == [0, 1, 2, 3]
+    assert writer.stats()["inline_writes"] == len(inline)
+
+def test_message_writer_counts_the_batch_cut_off_by_stop():
+    # Done by ELYES
+    messages = FakeMessages(delay=5)
+    writer = MessageWriter(messages, max_batch_size=2, flush_interval=0, drain_timeout=0.05)
+
+    async def run():
+        await writer.start()
+        for i in range(3):
+            await writer.write({"n": i})
+        await asyncio.sleep(0.01)
+        await writer.stop()
+
+    asyncio.run(run())
+    # Two were mid-flush, one still queued
+    assert (writer.stats()["failed"], messages.batches) == (3, [])
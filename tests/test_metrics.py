@@ -0,0 +1,84 @@
+"""
+Tests for ChatXpert metrics
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.metrics import MetricsRegistry, http_request_seconds
+from app.core.middleware import RequestLoggingMiddleware
+
+def test_registry_renders_prometheus_text():
+    # Done by ELYES
+    registry = MetricsRegistry("test")
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.callback("queue_depth", "Queued items", ("queue",), lambda: [(("writer",), 3)])
+
+    requests.labels("/a").inc()
+    requests.labels("/a").inc(2)
+    requests.labels('say "hi"').inc()
+    for value in (0.05, 0.1, 0.5, 5.0):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_requests_total counter" in lines
+    assert 'test_requests_total{route="/a"} 3' in lines
+    assert 'test_requests_total{route="say \\"hi\\""} 1' in lines
+    # Buckets are cumulative and le is inclusive
+    assert 'test_latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'test_latency_seconds_bucket{le="1"} 3' in lines
+    assert 'test_latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "test_latency_seconds_sum 5.65" in lines
+    assert "test_latency_seconds_count 4" in lines
+    assert 'test_queue_depth{queue="writer"} 3' in lines
+
+    with pytest.raises(ValueError):
+        requests.labels()
+    with pytest.raises(ValueError):
+        registry.counter("requests_total", "Again")
+
+def test_counters_and_histograms_add_up_across_threads():
+    # Done by ELYES
+    registry = MetricsRegistry()
+    counter = registry.counter("hits_total", "Hits").labels()
+    histogram = registry.histogram("seconds", "Seconds", buckets=(1.0,)).labels()
+
+    def work():
+        for _ in range(10000):
+            counter.inc()
+            histogram.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.value == 40000
+    assert histogram.snapshot() == ([40000, 40000], 20000, 40000)
+
+def test_request_latency_is_recorded_per_route_template():
+    # Done by ELYES
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    app.add_middleware(RequestLoggingMiddleware)
+    client = TestClient(app)
+    matched = http_request_seconds.labels("GET", "/items/{item_id}", 200)
+    unmatched = http_request_seconds.labels("GET", "unmatched", 404)
+    before = (matched.snapshot()[2], unmatched.snapshot()[2])
+
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/nowhere")
+
+    assert (matched.snapshot()[2], unmatched.snapshot()[2]) == (before[0] + 2, before[1] + 1)
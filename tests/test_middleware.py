@@ -0,0 +1,80 @@
+"""
+Tests for ChatXpert middleware
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.middleware import (
+    ErrorHandlingMiddleware,
+    RateLimitMiddleware,
+    RequestLoggingMiddleware,
+    SecurityHeadersMiddleware
+)
+from app.core.rate_limit import RateLimitResult
+
+class AllowFirst:
+    # Done by ELYES
+    def __init__(self, allowed):
+        self.allowed = allowed
+        self.identities = []
+
+    async def hit(self, identity, path="", cost=1):
+        self.identities.append(identity)
+        self.allowed -= 1
+        return RateLimitResult(self.allowed >= 0, max(self.allowed, 0), 0 if self.allowed >= 0 else 2.5)
+
+def build_app(limiter):
+    # Done by ELYES
+    app = FastAPI()
+
+    @app.get("/ok")
+    async def ok():
+        return {"ok": True}
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"a", b"b", b"c"]), media_type="text/plain")
+
+    app.add_middleware(RequestLoggingMiddleware)
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+    app.add_middleware(ErrorHandlingMiddleware)
+    app.add_middleware(SecurityHeadersMiddleware)
+    return app
+
+def test_middleware_pipeline_headers_errors_and_streaming():
+    # Done by ELYES
+    client = TestClient(build_app(AllowFirst(10)), raise_server_exceptions=False)
+
+    response = client.get("/ok")
+    assert response.json() == {"ok": True}
+    assert response.headers["X-Process-Time"].endswith("s")
+    assert response.headers["X-Frame-Options"] == "DENY"
+    assert response.headers["Content-Security-Policy"] == "default-src 'self'"
+    assert "Content-Security-Policy" not in client.get("/docs").headers
+
+    response = client.get("/boom")
+    assert (response.status_code, response.text) == (500, "Internal server error")
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+    response = client.get("/stream")
+    assert response.text == "abc"
+    assert "X-Process-Time" in response.headers
+
+def test_rate_limit_middleware_rejects_with_retry_after():
+    # Done by ELYES
+    limiter = AllowFirst(1)
+    client = TestClient(build_app(limiter))
+
+    assert client.get("/ok").status_code == 200
+    response = client.get("/ok", headers={"Authorization": "Bearer not-a-jwt"})
+    assert (response.status_code, response.text) == (429, "Too many requests")
+    assert response.headers["Retry-After"] == "3"
+    assert limiter.identities == ["ip:testclient", "ip:testclient"]
@@ -0,0 +1,865 @@
+"""
+Tests for the ChatXpert intent pipeline
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.core import cache as cache_module
+from app.core.cache import Cache
+from app.core.session_context import Turn
+from app.ml import training
+from app.ml import training_runner as training_runner_module
+from app.ml.classifier import IntentClassifier, load_numpy_classifier
+from app.ml.dataset import DatasetBuilder
+from app.ml.inference import InferenceEngine
+from app.ml.ingest import TrainingDataImporter, iter_json_items
+from app.ml.intents import Intent, IntentCatalog, IntentCatalogStore
+from app.ml.llm import StaticLLMClient
+from app.ml.numpy_model import NumpyMLP, export_keras_model
+from app.ml.prediction_cache import PredictionCache
+from app.ml.preprocessing import Preprocessor
+from app.ml.registry import ModelManager, ModelRegistry
+from app.ml.router import FALLBACK_RESPONSE, ResponseRouter
+from app.ml.semantic_cache import SemanticCache
+from app.ml.training_runner import TrainingRunner
+from app.ml.vectorizer import BagOfWordsVectorizer
+
+# Done by ELYES
+WORDS = ["course", "fee", "hello", "hi", "how", "location", "what"]
+
+def simple_tokenizer(sentence):
+    # Done by ELYES
+    return sentence.lower().replace("?", "").split()
+
+def naive_bag(sentence):
+    # Reference implementation of the original nested loop in main.bag_of_words
+    # Done by ELYES
+    bag = [0] * len(WORDS)
+    for w in simple_tokenizer(sentence):
+        for i, word in enumerate(WORDS):
+            if word == w:
+                bag[i] = 1
+    return np.array(bag)
+
+def test_vectorizer_matches_nested_loop():
+    # Done by ELYES
+    vectorizer = BagOfWordsVectorizer(WORDS, tokenizer=simple_tokenizer)
+    for sentence in ["hi", "what fee what fee", "unknown words only", "How is the location?"]:
+        assert np.array_equal(vectorizer.transform(sentence), naive_bag(sentence))
+
+def test_vectorizer_batch_dense_and_sparse():
+    # Done by ELYES
+    vectorizer = BagOfWordsVectorizer(WORDS, tokenizer=simple_tokenizer)
+    sentences = ["hello", "what course fee", "", "nothing known"]
+
+    dense = vectorizer.transform_batch(sentences)
+    sparse = vectorizer.transform_batch(sentences, sparse=True)
+
+    assert dense.shape == (4, len(WORDS))
+    assert dense.dtype == np.float32
+    assert np.array_equal(sparse.toarray(), dense)
+    for row, sentence in zip(dense, sentences):
+        assert np.array_equal(row, naive_bag(sentence))
+
+def test_dataset_builder_matches_naive_training_rows():
+    # Done by ELYES
+    intents = [
+        {"tag": "greetings", "patterns": ["hi", "hello", "hi hello hi"]},
+        {"intent": "fee", "patterns": ["what course fee?", "how fee"]},
+        {"tag": "location", "patterns": ["what location"]},
+    ]
+    patterns = [(intent.get("tag") or intent["intent"], p) for intent in intents for p in intent["patterns"]]
+
+    dataset = DatasetBuilder(tokenizer=simple_tokenizer).add_intents(iter(intents)).build()
+    sparse = DatasetBuilder(tokenizer=simple_tokenizer).add_intents(intents).build(sparse=True)
+
+    assert dataset.words == WORDS
+    assert dataset.classes == ["fee", "greetings", "location"]
+    assert dataset.features.dtype == np.uint8
+    assert np.array_equal(sparse.features.toarray(), dataset.features)
+    for row, target, (tag, pattern) in zip(dataset.features, dataset.one_hot(), patterns):
+        assert np.array_equal(row, naive_bag(pattern))
+        assert target.dtype == np.float32
+        assert dataset.classes[int(target.argmax())] == tag and target.sum() == 1
+
+    # A fixed vocabulary keeps the given order and drops unknown words and tags
+    fixed = DatasetBuilder(tokenizer=simple_tokenizer, words=["hi", "fee"], classes=["fee", "greetings"])
+    fixed = fixed.add_intents(intents).build()
+    assert fixed.features.tolist() == [[1, 0], [0, 0], [1, 0], [0, 1], [0, 1]]
+    assert fixed.labels.tolist() == [1, 1, 1, 0, 0]
+
+class CountingClassifier:
+    # Done by ELYES
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, sentences):
+        self.batches.append(list(sentences))
+        return [[{"intent": sentence, "probability": 1.0}] for sentence in sentences]
+
+def test_inference_engine_batches_concurrent_requests():
+    # Done by ELYES
+    classifier = CountingClassifier()
+    engine = InferenceEngine(lambda: classifier, max_batch_size=4, max_wait_ms=50)
+
+    async def run():
+        await engine.start()
+        try:
+            return await asyncio.gather(*(engine.predict(f"m{i}") for i in range(10)))
+        finally:
+            await engine.stop()
+
+    results = asyncio.run(run())
+
+    assert [r[0]["intent"] for r in results] == [f"m{i}" for i in range(10)]
+    assert [len(batch) for batch in classifier.batches] == [4, 4, 2]
+
+def test_inference_engine_stop_fails_the_batch_in_flight():
+    # Done by ELYES
+    release = threading.Event()
+
+    class BlockingClassifier(CountingClassifier):
+        def predict_batch(self, sentences):
+            release.wait(5)
+            return super().predict_batch(sentences)
+
+    engine = InferenceEngine(BlockingClassifier, max_batch_size=4, max_wait_ms=1)
+
+    async def run():
+        await engine.start()
+        pending = asyncio.ensure_future(engine.predict("m0"))
+        await asyncio.sleep(0.05)
+        await engine.stop()
+        release.set()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(pending, timeout=1)
+        assert not engine.running
+
+    asyncio.run(run())
+
+def test_numpy_model_matches_keras_on_every_pattern(tmp_path):
+    # Done by ELYES
+    tf = pytest.importorskip("tensorflow")
+    keras_model = tf.keras.models.load_model("chatbotmodel.h5", compile=False)
+
+    # Export fresh so the parity also covers export_keras_model
+    export_keras_model(keras_model, str(tmp_path / "model.npz"))
+    numpy_classifier = load_numpy_classifier(str(tmp_path / "model.npz"), "words.pkl", "classes.pkl")
+    keras_classifier = IntentClassifier(numpy_classifier.vectorizer, numpy_classifier.classes, keras_model)
+
+    with open("intents.json") as f:
+        patterns = [p for intent in json.load(f)["intents"] for p in intent["patterns"]]
+    # A regex tokenizer keeps the test independent of NLTK data downloads
+    numpy_classifier.vectorizer.tokenizer = lambda s: re.findall(r"\w+|[^\w\s]", s.lower())
+    features = numpy_classifier.vectorizer.transform_batch(patterns)
+
+    expected = np.asarray(keras_model.predict_on_batch(features))
+    assert np.allclose(numpy_classifier.predict_proba(features), expected, atol=1e-5)
+    assert np.allclose(NumpyMLP.load("chatbotmodel.npz").predict_on_batch(features), expected, atol=1e-5)
+    for numpy_ranked, keras_ranked in zip(
+        numpy_classifier.predict_batch(patterns),
+        keras_classifier.predict_batch(patterns)
+    ):
+        assert [r["intent"] for r in numpy_ranked] == [r["intent"] for r in keras_ranked]
+
+def test_cli_modules_load_without_server_settings():
+    # Done by ELYES
+    # main.py only needs the catalog and the NumPy classifier; neither may pull
+    # in Settings (which needs a full .env) or the server's log pipeline
+    code = (
+        "import sys, app.ml.classifier, app.ml.intents; "
+        "print(sorted(m for m in ('app.core.config', 'app.core.logging') if m in sys.modules))"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
+
+def test_intent_catalog_lookup_and_fallback():
+    # Done by ELYES
+    catalog = IntentCatalog.from_json("intents.json", fallback_tag="invalid", threshold=0.5)
+
+    intent, response = catalog.choose_response([{"intent": "greetings", "probability": 0.9}])
+    assert intent.tag == "greetings"
+    assert response in catalog.get("greetings").responses
+
+    # Empty and below-threshold predictions use the fallback intent
+    assert catalog.resolve([]).tag == "invalid"
+    assert catalog.resolve([{"intent": "greetings", "probability": 0.3}]).tag == "invalid"
+    assert IntentCatalog(()).choose_response([]) == (None, None)
+
+def test_intent_catalog_store_reloads_changed_source(tmp_path):
+    # Done by ELYES
+    path = tmp_path / "intents.json"
+    path.write_text(json.dumps({"intents": [{"tag": "a", "patterns": ["x"], "responses": ["one"]}]}))
+    store = IntentCatalogStore(str(path))
+
+    async def run():
+        await store.start()
+        assert not await store.reload()
+        path.write_text(json.dumps({"intents": [
+            {"tag": "a", "patterns": ["x"], "responses": ["one"]},
+            {"tag": "b", "patterns": ["y"], "responses": ["two"]}
+        ]}))
+        os.utime(path, ns=(0, 0))
+        assert await store.reload()
+
+    asyncio.run(run())
+    assert "b" in store.catalog
+    merged = IntentCatalog(IntentCatalog.parse([
+        {"tag": "a", "patterns": ["x"], "responses": ["one"]},
+        {"intent": "a", "patterns": ["z"], "responses": ["one", "three"]}
+    ]))
+    assert merged.get("a").responses == ("one", "three")
+
+def test_response_router_escalates_only_low_confidence():
+    # Done by ELYES
+    catalog = IntentCatalog(
+        [Intent("greetings", ("hello",), ("Hi!",)), Intent("invalid", (), ("Say again?",))],
+        fallback_tag="invalid",
+        threshold=0.25
+    )
+    store = SimpleNamespace(catalog=catalog)
+    scores = {"hello": 0.95, "hey": 0.5, "???": 0.1}
+
+    async def predict(message):
+        return [{"intent": "greetings", "probability": scores[message]}]
+
+    llm = StaticLLMClient("From the LLM")
+    router = ResponseRouter(store, predict, llm=llm, threshold=0.7)
+
+    async def run():
+        return [await router.reply(message) for message in ("hello", "hello", "hey", "???")]
+
+    replies = asyncio.run(run())
+    assert [(r.message, r.source) for r in replies] == [
+        ("Hi!", "local"), ("Hi!", "local"), ("From the LLM", "llm"), ("From the LLM", "llm")
+    ]
+    assert len(llm.calls) == 2
+    stats = router.stats()
+    assert (stats["local_ratio"], stats["llm_ratio"]) == (0.5, 0.5)
+    assert stats["average_seconds"]["llm"] > 0
+
+    # Without an LLM the catalog decides: the top intent above its own
+    # threshold, the fallback intent below it, the fixed reply with no intents
+    local = ResponseRouter(store, predict, threshold=0.7)
+    assert asyncio.run(local.reply("hey")).source == "local"
+    assert asyncio.run(local.reply("???"))[::3] == ("Say again?", "fallback")
+    empty = ResponseRouter(SimpleNamespace(catalog=IntentCatalog(())), predict)
+    assert asyncio.run(empty.reply("hey"))[::3] == (FALLBACK_RESPONSE, "fallback")
+
+def test_response_router_uses_conversation_context():
+    # Done by ELYES
+    catalog = IntentCatalog(
+        [Intent("fees", ("fee",), ("100 per course.",)), Intent("location", ("where",), ("Tunis.",))],
+        threshold=0.25
+    )
+    ranked = [{"intent": "location", "probability": 0.5}, {"intent": "fees", "probability": 0.4}]
+
+    async def predict(message):
+        return ranked
+
+    llm = StaticLLMClient("Let me check.")
+    router = ResponseRouter(SimpleNamespace(catalog=catalog), predict, llm=llm, threshold=0.3)
+    context = [Turn("what is the fee?", "100 per course.", "fees")]
+
+    # A near-tie follows the intent the conversation is on, without
+    # reordering the shared prediction
+    reply = asyncio.run(router.reply("and for the master?"))
+    assert (reply.intent, reply.source) == ("location", "local")
+    assert asyncio.run(router.reply("and for the master?", context)).intent == "fees"
+    assert ranked[0]["intent"] == "location"
+
+    # Below the threshold the turns are sent to the LLM ahead of the message
+    router.threshold = 0.9
+    asyncio.run(router.reply("and for the master?", context))
+    assert [m["content"] for m in llm.calls[-1][1:]] == ["what is the fee?", "100 per course.", "and for the master?"]
+
+class FakeHashRedis:
+    # Done by ELYES
+    def __init__(self):
+        self.hashes = {}
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    async def expire(self, key, ttl):
+        pass
+
+def test_semantic_cache_matches_rewordings_and_shares_through_redis():
+    # Done by ELYES
+    rng = np.random.default_rng(0)
+    model = NumpyMLP([
+        (rng.normal(size=(len(WORDS), 8)).astype(np.float32), np.zeros(8, np.float32), "relu"),
+        (rng.normal(size=(8, 2)).astype(np.float32), np.zeros(2, np.float32), "softmax"),
+    ])
+    vectorizer = BagOfWordsVectorizer(WORDS, tokenizer=simple_tokenizer)
+    current = {"classifier": IntentClassifier(vectorizer, ["a", "b"], model, version="v1")}
+    assert current["classifier"].embed_batch(["hello"], hidden=True).shape == (1, 8)
+
+    redis = FakeHashRedis()
+    cache = SemanticCache(lambda: current["classifier"], redis, maxsize=2, threshold=0.85, hidden=False)
+    other_worker = SemanticCache(lambda: current["classifier"], redis, threshold=0.85, hidden=False)
+
+    async def run():
+        # Builds the index for the serving model before the first request
+        await cache.start()
+        await cache.set("what is the course fee", "It is 100.")
+        # Same words, then a close rewording; different known or unknown words miss
+        assert await cache.get("What is the course fee?") == "It is 100."
+        assert await cache.get("what is course fee") == "It is 100."
+        assert await cache.get("what is the course location") is None
+        assert await cache.get("how much is the course fee") is None
+        assert await cache.get("hello love") is None
+
+        assert await other_worker.sync() == 1
+        assert await other_worker.get("what is the course fee") == "It is 100."
+
+        # A new model re-embeds the entries into its own vector space in the
+        # background; lookups are skipped until that is done
+        current["classifier"] = IntentClassifier(
+            BagOfWordsVectorizer(WORDS + ["love"], tokenizer=simple_tokenizer), ["a", "b"], None, version="v2"
+        )
+        assert await cache.get("what is the course fee") is None
+        assert await cache.sync() == 0
+        assert await cache.get("what is the course fee") == "It is 100."
+
+        # Least recently used entries are replaced once the index is full
+        await cache.set("hello love", "Hi!")
+        await cache.set("what location", "Here.")
+        assert await cache.get("what is the course fee") is None
+        assert await cache.get("hello love") == "Hi!"
+
+        # Expired entries are pruned from Redis on the next sync
+        await SemanticCache(lambda: current["classifier"], redis, ttl=-1).set("hi", "Hey")
+        await other_worker.sync()
+        assert len(redis.hashes["semantic_cache"]) == 3
+
+    asyncio.run(run())
+    assert cache.stats()["hits"] == 4
+
+    # Disabled, it is still there to call and does nothing
+    disabled = SemanticCache(lambda: current["classifier"], FakeHashRedis(), enabled=False)
+    asyncio.run(disabled.start())
+    asyncio.run(disabled.set("what is the course fee", "It is 100."))
+    assert asyncio.run(disabled.get("what is the course fee")) is None
+    assert disabled.redis.hashes == {} and disabled.index is None
+
+def test_preprocessor_caches_sentences_and_lemmas():
+    # Done by ELYES
+    lemmatized = []
+
+    def lemmatizer(word):
+        lemmatized.append(word)
+        return word.rstrip("s")
+
+    preprocessor = Preprocessor(
+        sentence_cache_size=2,
+        lemma_cache_size=8,
+        tokenizer=str.split,
+        lemmatizer=lemmatizer
+    )
+    preprocessor.warm(["courses"])
+
+    assert preprocessor.tokenize("What  COURSES") == ("what", "course")
+    assert preprocessor.tokenize("what courses") == ("what", "course")
+    assert lemmatized == ["courses", "what"]
+
+    stats = preprocessor.stats()
+    assert stats["sentences"]["hits"] == 1
+    assert stats["sentences"]["misses"] == 1
+    assert stats["lemmas"]["hits"] == 1
+
+    preprocessor.tokenize("a")
+    preprocessor.tokenize("b")
+    assert preprocessor.stats()["sentences"]["currsize"] == 2
+
+def test_prediction_cache_tiers_and_version_invalidation(monkeypatch):
+    # Done by ELYES
+    remote = {}
+
+    async def remote_get(key):
+        return remote.get(key)
+
+    async def remote_set(key, value, ttl=3600):
+        remote[key] = value
+        return True
+
+    monkeypatch.setattr(Cache, "get", staticmethod(remote_get))
+    monkeypatch.setattr(Cache, "set", staticmethod(remote_set))
+
+    calls = []
+    version = {"current": "v1"}
+
+    async def compute(message):
+        calls.append(message)
+        return [{"intent": "greetings", "probability": 0.9}]
+
+    cache = PredictionCache(lambda: version["current"], maxsize=8)
+
+    async def run():
+        await cache.get_or_compute("Hi", compute)
+        await cache.get_or_compute("  hi ", compute)
+        cache.local.clear()
+        await cache.get_or_compute("hi", compute)
+        version["current"] = "v2"
+        await cache.get_or_compute("hi", compute)
+
+    asyncio.run(run())
+
+    assert calls == ["Hi", "hi"]
+    stats = cache.stats()
+    assert (stats["local_hits"], stats["remote_hits"], stats["misses"]) == (1, 1, 2)
+    assert stats["hit_ratio"] == 0.5
+    assert stats["model_version"] == "v2"
+
+def test_cache_skips_redis_after_an_error_and_logs_once(monkeypatch, caplog):
+    # Done by ELYES
+    class DownRedis:
+        calls = 0
+
+        async def get(self, key):
+            DownRedis.calls += 1
+            raise ConnectionError("Connection refused")
+
+        setex = get
+
+    monkeypatch.setattr(cache_module, "redis_client", DownRedis())
+    monkeypatch.setattr(cache_module, "cache_breaker", cache_module.CircuitBreaker("Redis cache", retry_after=60))
+
+    async def run():
+        for _ in range(5):
+            assert await Cache.get("k") is None
+            assert await Cache.set("k", [1]) is False
+
+    asyncio.run(run())
+    assert DownRedis.calls == 1
+    assert len([r for r in caplog.records if "Redis cache unavailable" in r.getMessage()]) == 1
+
+    # Once the pause is over the next call probes Redis again
+    cache_module.cache_breaker._open_until = 1.0
+    asyncio.run(Cache.get("k"))
+    assert DownRedis.calls == 2
+    assert len([r for r in caplog.records if "Redis cache unavailable" in r.getMessage()]) == 1
+
+def test_train_intents_writes_artifacts_and_honours_cancel(tmp_path, monkeypatch):
+    # Done by ELYES
+    pytest.importorskip("tensorflow")
+    monkeypatch.setattr(training, "preprocessor", Preprocessor(tokenizer=simple_tokenizer, lemmatizer=str))
+    intents = [
+        {"tag": "greetings", "patterns": ["hi", "hello"], "responses": ["Hello!"]},
+        {"tag": "fee", "patterns": ["what fee", "how much fee"], "responses": ["Rs 10"]},
+    ]
+    epochs_seen = []
+
+    metrics = training.train_intents(
+        intents,
+        str(tmp_path / "run"),
+        epochs=3,
+        on_epoch=lambda epoch, total, logs: epochs_seen.append((epoch, total, "accuracy" in logs))
+    )
+
+    assert epochs_seen == [(1, 3, True), (2, 3, True), (3, 3, True)]
+    assert (metrics["patterns"], metrics["classes"]) == (4, 2)
+    classifier = load_numpy_classifier(
+        str(tmp_path / "run" / training.WEIGHTS_FILE),
+        str(tmp_path / "run" / training.WORDS_FILE),
+        str(tmp_path / "run" / training.CLASSES_FILE)
+    )
+    assert classifier.classes == ["fee", "greetings"]
+
+    with pytest.raises(training.TrainingCancelled):
+        training.train_intents(intents, str(tmp_path / "cancelled"), epochs=50, should_stop=lambda: True)
+    assert not (tmp_path / "cancelled").exists()
+
+def test_incremental_training_widens_model_and_keeps_weights(tmp_path, monkeypatch):
+    # Done by ELYES
+    tf = pytest.importorskip("tensorflow")
+    monkeypatch.setattr(training, "preprocessor", Preprocessor(tokenizer=simple_tokenizer, lemmatizer=str))
+    intents = [
+        {"tag": "greetings", "patterns": ["hi", "hello"], "responses": ["Hello!"]},
+        {"tag": "fee", "patterns": ["what fee", "how much fee"], "responses": ["Rs 10"]},
+    ]
+    base_dir = tmp_path / "base"
+    training.train_intents(intents, str(base_dir), epochs=3)
+    base_model = tf.keras.models.load_model(str(base_dir / training.MODEL_FILE), compile=False)
+    old_words = ["fee", "hello", "hi", "how", "much", "what"]
+    words = ["fee", "hello", "hi", "how", "location", "much", "what", "where"]
+    classes = ["fee", "greetings", "location"]
+
+    # Old classes keep their logits, so their relative probabilities are unchanged
+    widened = training.widen_model(base_model, old_words, words, ["fee", "greetings"], classes)
+    old_features = np.eye(len(old_words), dtype=np.float32)
+    new_features = np.zeros((len(old_words), len(words)), dtype=np.float32)
+    new_features[:, [words.index(w) for w in old_words]] = old_features
+    expected = np.asarray(base_model.predict_on_batch(old_features))
+    kept = np.asarray(widened.predict_on_batch(new_features))[:, :2]
+    assert np.allclose(kept / kept.sum(axis=1, keepdims=True), expected, atol=1e-5)
+
+    intents.append({"tag": "location", "patterns": ["where location"], "responses": ["Kathmandu"]})
+    metrics = training.fine_tune_intents(
+        str(base_dir), intents, ["location"], str(tmp_path / "tuned"), epochs=2, seed=0
+    )
+
+    assert metrics["mode"] == "incremental"
+    assert (metrics["changed_patterns"], metrics["replayed_patterns"]) == (1, 1)
+    assert (metrics["new_words"], metrics["new_classes"]) == (2, 1)
+    classifier = load_numpy_classifier(
+        str(tmp_path / "tuned" / training.WEIGHTS_FILE),
+        str(tmp_path / "tuned" / training.WORDS_FILE),
+        str(tmp_path / "tuned" / training.CLASSES_FILE)
+    )
+    assert classifier.classes == classes
+    assert classifier.vectorizer.words == words
+
+def _matches(doc, query):
+    # The subset of Mongo queries the training runner issues
+    # Done by ELYES
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(doc, option) for option in condition):
+                return False
+            continue
+        name, _, index = key.partition(".")
+        present = name in doc and (not index or len(doc[name]) > int(index))
+        value = doc.get(name)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op == "$exists" and present != operand:
+                    return False
+                if op == "$lt" and not (present and value < operand):
+                    return False
+                if op == "$lte" and not (present and value <= operand):
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+class FakeCollection:
+    # unique: the filter of a partial unique index, checked on upserts
+    # Done by ELYES
+    def __init__(self, unique=None):
+        self.docs = {}
+        self.unique = unique
+
+    def _apply(self, doc, update, inserting=False):
+        doc.update(update.get("$set", {}))
+        if inserting:
+            doc.update(update.get("$setOnInsert", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+        for field, value in update.get("$addToSet", {}).items():
+            for item in value["$each"] if isinstance(value, dict) else [value]:
+                if item not in doc.setdefault(field, []):
+                    doc[field].append(item)
+        for field, value in update.get("$pull", {}).items():
+            removed = value["$in"] if isinstance(value, dict) else [value]
+            doc[field] = [item for item in doc.get(field, []) if item not in removed]
+
+    def _first(self, query, sort=None):
+        docs = [doc for doc in self.docs.values() if _matches(doc, query)]
+        for field, direction in reversed(sort or []):
+            docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return docs[0] if docs else None
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = doc
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def find_one(self, query, projection=None, sort=None):
+        doc = self._first(query, sort)
+        return dict(doc) if doc else None
+
+    def find(self, query, projection=None):
+        async def docs():
+            for doc in list(self.docs.values()):
+                if _matches(doc, query):
+                    yield dict(doc)
+        return docs()
+
+    async def find_one_and_update(self, query, update, projection=None, sort=None, return_document=False, upsert=False):
+        doc = self._first(query, sort)
+        if doc is None and upsert:
+            # Lets a concurrent upsert find nothing either
+            await asyncio.sleep(0)
+            doc = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            if self.unique is not None and _matches(doc, self.unique) and self._first(self.unique):
+                raise DuplicateKeyError("E11000 duplicate key error")
+            await self.insert_one(doc)
+            self._apply(doc, update, inserting=True)
+            return dict(doc) if return_document else None
+        if doc is None:
+            return None
+        before = dict(doc)
+        self._apply(doc, update)
+        return dict(doc) if return_document else before
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self._first(query)
+        if doc is None and upsert:
+            doc = {"_id": query["_id"]}
+            self.docs[doc["_id"]] = doc
+            self._apply(doc, update, inserting=True)
+        elif doc is not None:
+            self._apply(doc, update)
+
+    async def update_many(self, query, update):
+        for doc in [doc for doc in self.docs.values() if _matches(doc, query)]:
+            self._apply(doc, update)
+
+def test_training_jobs_are_shared_and_cancelled_across_workers(monkeypatch):
+    # Done by ELYES
+    def fake_training_job(intents, output_dir, epochs, batch_size, progress, cancel_event, *args):
+        # Trains until cancelled, like run_training_job between epochs
+        assert cancel_event.wait(5)
+        raise training.TrainingCancelled()
+
+    monkeypatch.setattr(training_runner_module, "run_training_job", fake_training_job)
+    jobs, scheduler = FakeCollection(), FakeCollection()
+    catalog = SimpleNamespace(reload=lambda: asyncio.sleep(0), catalog=IntentCatalog([]))
+    registry = SimpleNamespace(current=lambda: None)
+
+    def make_runner(name):
+        runner = TrainingRunner(jobs, scheduler, catalog, registry, None, "runs", poll_interval=0.01, worker_id=name)
+        # Threads stand in for the worker processes
+        runner._ensure_pool = lambda: None
+        runner._manager = SimpleNamespace(Event=threading.Event, Queue=queue.Queue)
+        return runner
+
+    async def scenario():
+        first, second = make_runner("a"), make_runner("b")
+        await first.start()
+        await second.start()
+        for runner in (first, second):
+            runner._poller.cancel()
+        now = datetime.now()
+        job_ids = []
+        for offset in range(2):
+            result = await jobs.insert_one({"status": "queued", "created_at": now + timedelta(seconds=offset)})
+            job_ids.append(str(result.inserted_id))
+
+        # One slot across both workers
+        assert await first._claim_next()
+        assert not await second._claim_next()
+        assert jobs.docs[ObjectId(job_ids[1])]["status"] == "queued"
+
+        # Cancelled through the worker not running it
+        assert await second.cancel(job_ids[0])
+        await asyncio.wait_for(first._jobs[job_ids[0]][0], 5)
+        assert jobs.docs[ObjectId(job_ids[0])]["status"] == "cancelled"
+        assert not await second.cancel(job_ids[0])
+
+        assert await second._claim_next()
+        assert jobs.docs[ObjectId(job_ids[1])]["worker"] == "b"
+
+        # A job left running by a worker that is gone is failed and its slot freed
+        lost = await jobs.insert_one({"status": "running", "heartbeat_at": now - timedelta(minutes=5)})
+        scheduler.docs["slots"]["running"].append(str(lost.inserted_id))
+        await first._reconcile()
+        assert jobs.docs[lost.inserted_id]["status"] == "failed"
+        assert scheduler.docs["slots"]["running"] == [job_ids[1]]
+        assert jobs.docs[ObjectId(job_ids[1])]["status"] == "running"
+
+        await second.shutdown()
+        await first.shutdown()
+        assert scheduler.docs["slots"]["running"] == []
+
+    asyncio.run(scenario())
+
+def test_incremental_training_jobs_coalesce_and_run_one_at_a_time(monkeypatch):
+    # Done by ELYES
+    jobs = FakeCollection(unique={"mode": "incremental", "status": "queued"})
+    runner = TrainingRunner(jobs, FakeCollection(), None, None, None, "runs", max_concurrent_jobs=3, coalesce_window=60)
+    started = []
+
+    async def fake_run(job_id, cancel_event, changed_tags=None):
+        started.append((job_id, changed_tags))
+
+    runner._ensure_pool = lambda: None
+    runner._manager = SimpleNamespace(Event=threading.Event)
+    monkeypatch.setattr(runner, "_run", fake_run)
+
+    async def scenario():
+        await runner.start()
+        runner._poller.cancel()
+        # Two workers upserting at once: the one that loses joins the winner
+        first, joined = await asyncio.gather(runner.enqueue("alice", ["fee"]), runner.enqueue("bob", ["location"]))
+        assert joined == first
+        assert await runner.enqueue("bob", ["location", "fee"]) == first
+        full = await runner.enqueue("alice")
+        assert full != first
+        assert jobs.docs[ObjectId(first)]["changed_intents"] == ["fee", "location"]
+
+        # Still collecting changes: only the full retrain starts
+        assert await runner._claim_next()
+        assert not await runner._claim_next()
+        await asyncio.sleep(0)
+        assert started == [(full, None)]
+
+        jobs.docs[ObjectId(first)]["not_before"] = datetime.now()
+        assert await runner._claim_next()
+        await asyncio.sleep(0)
+        assert started[-1] == (first, ["fee", "location"])
+
+        # Changes arriving now start a new job, which waits for the running one
+        second = await runner.enqueue("bob", ["hours"])
+        assert second != first
+        jobs.docs[ObjectId(second)]["not_before"] = datetime.now()
+        assert not await runner._claim_next()
+        jobs.docs[ObjectId(first)]["status"] = "completed"
+        assert await runner._claim_next()
+        await asyncio.sleep(0)
+        assert started[-1] == (second, ["hours"])
+
+    asyncio.run(scenario())
+
+def test_model_registry_hot_swap_and_rollback(tmp_path):
+    # Done by ELYES
+    def artifacts(content):
+        source = tmp_path / content
+        source.mkdir()
+        for name in (training.WEIGHTS_FILE, training.WORDS_FILE, training.CLASSES_FILE):
+            (source / name).write_text(f"{content}-{name}")
+        return str(source)
+
+    registry = ModelRegistry(str(tmp_path / "models"))
+    first = registry.register_directory(artifacts("one"))
+    second = registry.register_directory(artifacts("two"))
+    assert registry.register_directory(str(tmp_path / "one"))["version"] == first["version"]
+    assert len(registry.list_versions()) == 2
+
+    class VersionedClassifier(CountingClassifier):
+        def __init__(self, version):
+            super().__init__()
+            self.version = version
+
+    engine = InferenceEngine(lambda: VersionedClassifier(None))
+    manager = ModelManager(registry, engine, VersionedClassifier)
+
+    async def run():
+        await engine.start()
+        try:
+            await manager.activate(first["version"])
+            await manager.activate(second["version"])
+            assert engine.model_version == second["version"]
+            assert await manager.rollback() == first["version"]
+            assert engine.model_version == first["version"]
+
+            # Another worker switching CURRENT is picked up by sync()
+            registry.set_current(second["version"])
+            assert await manager.sync()
+            assert not await manager.sync()
+            return engine.model_version
+        finally:
+            await engine.stop()
+
+    assert asyncio.run(run()) == second["version"]
+    assert registry.current() == second["version"]
+    with pytest.raises(KeyError):
+        asyncio.run(manager.activate("missing"))
+
+def test_model_rollback_commits_only_after_the_target_loads(tmp_path):
+    # Done by ELYES
+    registry = ModelRegistry(str(tmp_path / "models"))
+    versions = []
+    for content in ("one", "two"):
+        source = tmp_path / content
+        source.mkdir()
+        for name in (training.WEIGHTS_FILE, training.WORDS_FILE, training.CLASSES_FILE):
+            (source / name).write_text(f"{content}-{name}")
+        versions.append(registry.register_directory(str(source))["version"])
+        registry.set_current(versions[-1])
+
+    def broken_loader(version):
+        raise OSError("weights unreadable")
+
+    engine = SimpleNamespace(model_version=versions[1], swap=lambda classifier: None)
+    manager = ModelManager(registry, engine, broken_loader)
+    with pytest.raises(OSError):
+        asyncio.run(manager.rollback())
+    assert registry.current() == versions[1]
+    assert registry.history() == versions
+
+    # Registering the same artifacts again finds the existing version; the
+    # lock is re-entrant, as load_serving_classifier needs
+    with registry.locked():
+        assert registry.register_directory(str(tmp_path / "one"))["version"] == versions[0]
+    assert len(registry.list_versions()) == 2
+
+def chunked_reader(data, size):
+    # Done by ELYES
+    stream = iter(data[i:i + size] for i in range(0, len(data), size))
+
+    async def read(_):
+        return next(stream, b"")
+    return read
+
+def test_iter_json_items_streams_arrays_and_ndjson():
+    # Done by ELYES
+    items = [{"intent": "a", "patterns": ["x, ]y"], "responses": ["é"]}, {"intent": "b", "n": 12345}]
+    array = json.dumps(items, ensure_ascii=False).encode()
+    ndjson = "\n".join(json.dumps(item) for item in items).encode()
+
+    async def collect(data, size):
+        return [item async for item in iter_json_items(chunked_reader(data, size), chunk_size=size)]
+
+    for size in (1, 3, 1 << 16):
+        assert asyncio.run(collect(array, size)) == items
+        assert asyncio.run(collect(ndjson, size)) == items
+    assert asyncio.run(collect(b" [ ] ", 2)) == []
+    for malformed in (b'[{"intent": "a"}', b'[{"intent": "a"} {"intent": "b"}]', b'{"intent": '):
+        with pytest.raises(ValueError):
+            asyncio.run(collect(malformed, 4))
+
+def test_training_data_importer_validates_before_bulk_upserts():
+    # Done by ELYES
+    class FakeTrainingData:
+        def __init__(self):
+            self.batches = []
+
+        async def bulk_write(self, operations, ordered=True):
+            self.batches.append(operations)
+
+            class Result:
+                upserted_count = len(operations)
+                modified_count = 0
+            return Result()
+
+    collection = FakeTrainingData()
+    importer = TrainingDataImporter(collection, batch_size=2)
+    valid = [{"intent": f"i{n % 2}", "patterns": [f"p{n}"], "responses": ["r"]} for n in range(5)]
+    invalid = valid[:2] + [{"intent": "x", "patterns": "not a list", "responses": []}]
+
+    count, errors = asyncio.run(importer.validate(chunked_reader(json.dumps(invalid).encode(), 8)))
+    assert (count, errors) == (3, [{"item": 2, "error": "patterns must be a list of strings"}])
+
+    report = asyncio.run(importer.write(chunked_reader(json.dumps(valid).encode(), 8), "admin"))
+    assert [len(batch) for batch in collection.batches] == [2, 2, 1]
+    assert [batch["first_item"] for batch in report["batches"]] == [0, 2, 4]
+    assert (report["items"], report["intents"], report["failed_batches"]) == (5, ["i0", "i1"], 0)
+    assert collection.batches[0][0]._filter == {"intent": "i0"}
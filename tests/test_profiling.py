@@ -0,0 +1,89 @@
+"""
+Tests for ChatXpert request profiling
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import profiling
+from app.core.middleware import ProfilingMiddleware
+from app.core.profiling import RequestProfiler, record_stage
+
+def build_app(profiler):
+    # Done by ELYES
+    app = FastAPI()
+
+    @app.get("/fast")
+    async def fast():
+        record_stage("predict", 0.001)
+        return {"ok": True}
+
+    @app.get("/slow")
+    async def slow():
+        record_stage("predict", 0.002)
+        # Blocks the event loop, so every sample lands here
+        time.sleep(0.2)
+        record_stage("llm", 0.2)
+        return {"ok": True}
+
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+    return app
+
+def test_slow_requests_keep_sampled_stacks_and_stage_timings():
+    # Done by ELYES
+    profiler = RequestProfiler(enabled=True, token="secret", threshold=0.1, interval=0.005)
+    client = TestClient(build_app(profiler))
+    try:
+        client.get("/fast")
+        client.get("/slow")
+        response = client.get("/fast", headers={"X-Profile": "wrong"})
+        assert "X-Profile-Id" not in response.headers
+    finally:
+        profiler.stop()
+
+    [trace] = profiler.recent()
+    assert (trace["kind"], trace["path"], trace["status_code"]) == ("slow", "/slow", 200)
+    assert [stage["stage"] for stage in trace["stages"]] == ["predict", "llm"]
+    report = profiler.get(trace["id"]).as_dict()
+    assert report["stacks"] and "slow (test_profiling.py" in report["stacks"][0]["stack"]
+    assert (report["scope"], report["overlapping_requests"]) == ("event_loop_thread", 0)
+
+def test_header_and_armed_requests_are_profiled():
+    # Done by ELYES
+    profiler = RequestProfiler(enabled=False, token="secret")
+    client = TestClient(build_app(profiler))
+
+    # Disabled: the header alone does nothing
+    assert "X-Profile-Id" not in client.get("/fast", headers={"X-Profile": "secret"}).headers
+    assert not profiler.active
+
+    profiler.arm("/fast")
+    client.get("/slow")
+    response = client.get("/fast")
+    trace = profiler.get(response.headers["X-Profile-Id"])
+    assert "function calls" in trace.profile
+    assert trace.stages == [("predict", 0.001)]
+    assert not profiler.active and not profiler.sampler.running
+
+    profiler.enabled = True
+    response = client.get("/fast", headers={"X-Profile": "secret"})
+    assert [t["id"] for t in profiler.recent()] == [response.headers["X-Profile-Id"], trace.id]
+    profiler.stop()
+
+def test_no_profile_id_when_the_profiler_cannot_start(monkeypatch):
+    # Done by ELYES
+    class BusyProfile:
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(profiling.cProfile, "Profile", BusyProfile)
+    profiler = RequestProfiler(enabled=False)
+    profiler.arm()
+    response = TestClient(build_app(profiler)).get("/fast")
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert profiler.recent() == []
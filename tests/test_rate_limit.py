@@ -0,0 +1,63 @@
+"""
+Tests for ChatXpert rate limiting
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+
+from app.core.rate_limit import RateLimiter, RateLimitPolicy
+
+class FakeScriptRedis:
+    # Counts calls and grants from a fixed budget per key, like the GCRA script
+    # without refill
+    # Done by ELYES
+    def __init__(self, budget, fail=False):
+        self.budget = budget
+        self.fail = fail
+        self.calls = []
+        self.used = {}
+
+    def register_script(self, script):
+        async def run(keys, args):
+            if self.fail:
+                raise ConnectionError("redis down")
+            key, (_, window_ms, requested, minimum) = keys[0], args
+            self.calls.append((key, requested))
+            available = self.budget - self.used.get(key, 0)
+            if available < minimum:
+                return [0, available, window_ms]
+            granted = min(requested, available)
+            self.used[key] = self.used.get(key, 0) + granted
+            return [granted, available - granted, 0]
+        return run
+
+def test_rate_limiter_routes_and_local_leases():
+    # Done by ELYES
+    redis = FakeScriptRedis(budget=10)
+    limiter = RateLimiter(
+        redis,
+        RateLimitPolicy.parse("10/60"),
+        routes={"/api/chat": RateLimitPolicy(10, 60), "/api/chat/send": RateLimitPolicy(10, 1)},
+        local_batch=4
+    )
+    assert limiter.policy_for("/api/chat/send")[0] == "/api/chat/send"
+    assert limiter.policy_for("/api/chat/history")[0] == "/api/chat"
+    assert limiter.policy_for("/health") == ("default", RateLimitPolicy(10, 60.0))
+
+    async def run():
+        return [await limiter.hit("user:alice", "/health") for _ in range(12)]
+
+    results = asyncio.run(run())
+    assert [r.allowed for r in results] == [True] * 10 + [False] * 2
+    assert [r.remaining for r in results[:10]] == list(range(9, -1, -1))
+    assert results[-1].retry_after == 60
+    # Ten requests took three leases, then the two denied round trips
+    assert [n for _, n in redis.calls] == [4, 4, 4, 4, 4]
+    assert {key for key, _ in redis.calls} == {"rate_limit:default:user:alice"}
+
+def test_rate_limiter_fails_open_without_redis():
+    # Done by ELYES
+    policy = RateLimitPolicy(5, 60)
+    assert asyncio.run(RateLimiter(FakeScriptRedis(0, fail=True), policy).hit("ip:1")).allowed
+    assert not asyncio.run(RateLimiter(FakeScriptRedis(0, fail=True), policy, fail_open=False).hit("ip:1")).allowed
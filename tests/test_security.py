@@ -0,0 +1,82 @@
+"""
+Tests for ChatXpert security utilities
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+from bson import ObjectId
+from jose import JWTError
+
+from app.core.security import UserCache, create_access_token, decode_access_token, token_cache
+
+class FakeUsers:
+    # Done by ELYES
+    def __init__(self, users):
+        self.users = users
+        self.queries = []
+
+    async def find_one(self, query, projection=None):
+        self.queries.append(query["username"])
+        user = self.users.get(query["username"])
+        if user is None:
+            return None
+        return {k: v for k, v in user.items() if k not in (projection or {})}
+
+class FakeRedis:
+    # Done by ELYES
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+def test_user_cache_tiers_negative_caching_and_invalidation():
+    # Done by ELYES
+    user_id = ObjectId()
+    users = FakeUsers({"alice": {"_id": user_id, "username": "alice", "hashed_password": "x"}})
+    redis = FakeRedis()
+    cache = UserCache(users, redis)
+    other_worker = UserCache(users, redis)
+
+    async def run():
+        alice = await cache.get("alice")
+        assert alice == {"_id": user_id, "username": "alice"}
+        alice["username"] = "mutated"
+        assert (await cache.get("alice"))["username"] == "alice"
+        # A second worker is served from Redis, with the ObjectId intact
+        assert (await other_worker.get("alice"))["_id"] == user_id
+
+        assert await cache.get("bob") is None
+        assert await other_worker.get("bob") is None
+        assert users.queries == ["alice", "bob"]
+
+        users.users["bob"] = {"_id": ObjectId(), "username": "bob"}
+        await cache.invalidate("bob")
+        assert (await cache.get("bob"))["username"] == "bob"
+
+    asyncio.run(run())
+    assert users.queries == ["alice", "bob", "bob"]
+
+def test_decode_access_token_is_memoized_until_expiry():
+    # Done by ELYES
+    token = create_access_token({"sub": "alice"}, expires_delta=timedelta(minutes=5))
+    assert decode_access_token(token)["sub"] == "alice"
+    assert token_cache.get(token)["sub"] == "alice"
+    # A caller changing its payload does not change the memoized one
+    decode_access_token(token)["sub"] = "mallory"
+    assert decode_access_token(token)["sub"] == "alice"
+
+    expired = create_access_token({"sub": "alice"}, expires_delta=timedelta(minutes=-1))
+    with pytest.raises(JWTError):
+        decode_access_token(expired)
+    assert token_cache.get(expired) is None
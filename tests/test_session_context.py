@@ -0,0 +1,100 @@
+"""
+Tests for the ChatXpert conversation context store
+© 2024-2025 ELYES. All rights reserved.
+Done by ELYES
+"""
+
+import asyncio
+
+from app.core.session_context import SessionContextStore, Turn, as_messages, decode_turn, encode_turn
+
+class FakePipeline:
+    # Done by ELYES
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def rpush(self, key, value):
+        self.commands.append(lambda: self.redis.lists.setdefault(key, []).append(value))
+        return self
+
+    def ltrim(self, key, start, end):
+        def trim():
+            items = self.redis.lists.get(key, [])
+            self.redis.lists[key] = items[start:len(items) + end + 1]
+        self.commands.append(trim)
+        return self
+
+    def expire(self, key, ttl):
+        self.commands.append(lambda: self.redis.ttls.__setitem__(key, ttl))
+        return self
+
+    async def execute(self):
+        for command in self.commands:
+            command()
+
+class FakeRedis:
+    # Done by ELYES
+    def __init__(self):
+        self.lists = {}
+        self.ttls = {}
+        self.reads = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def lrange(self, key, start, end):
+        self.reads += 1
+        return list(self.lists.get(key, []))
+
+    async def delete(self, key):
+        self.lists.pop(key, None)
+
+def test_turns_round_trip_compactly():
+    # Done by ELYES
+    turn = Turn("what are the fees?", "100 per course.", "fees", 1700000000.5)
+    data = encode_turn(turn)
+    assert decode_turn(data) == turn
+    assert len(data) < len(turn.message) + len(turn.reply) + len(turn.intent) + 16
+    assert as_messages([turn]) == [
+        {"role": "user", "content": "what are the fees?"},
+        {"role": "assistant", "content": "100 per course."},
+    ]
+
+def test_context_is_trimmed_shared_and_cached():
+    # Done by ELYES
+    redis = FakeRedis()
+    store = SessionContextStore(redis, max_turns=3, ttl=60)
+    other_worker = SessionContextStore(redis, max_turns=3, ttl=60)
+
+    async def run():
+        assert await store.get("u1") == []
+        for i in range(5):
+            await store.append("u1", None, Turn(f"m{i}", f"r{i}"))
+        local = [t.message for t in await store.get("u1")]
+        remote = [t.message for t in await other_worker.get("u1")]
+        await store.get("u1")
+        await other_worker.get("u1", "other")
+        return local, remote
+
+    local, remote = asyncio.run(run())
+    assert local == remote == ["m2", "m3", "m4"]
+    # One read per worker and session; the rest come from the local cache
+    assert redis.reads == 3
+    assert redis.ttls == {"context:u1:default": 60}
+
+def test_context_without_redis_lives_in_process():
+    # Done by ELYES
+    store = SessionContextStore(max_turns=2)
+
+    async def run():
+        for i in range(3):
+            await store.append("u1", "s1", Turn(f"m{i}", f"r{i}", "greetings"))
+        turns = await store.get("u1", "s1")
+        await store.clear("u1", "s1")
+        return turns, await store.get("u1", "s1")
+
+    turns, cleared = asyncio.run(run())
+    assert [t.message for t in turns] == ["m1", "m2"]
+    assert all(t.timestamp > 0 for t in turns)
+    assert cleared == []